@@ -1,8 +1,54 @@
+import io
+import os
+import hashlib
 import streamlit as st
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Sequence
+import baseline_index
+import metrics
 import openai_utils
 
+CSV_CHUNK_ROWS = 50_000
+MODEL_PATH = "model.pkl"
+
+
+# Cached objects are shared between reruns and sessions: never mutate them.
+# Keys are content digests; underscore-prefixed arguments are not hashed.
+@st.cache_resource(max_entries=256, show_spinner=False)
+def parse_upload(digest: str, _content: bytes) -> pd.DataFrame:
+    return pd.read_json(io.BytesIO(_content))
+
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def combine_uploads(digests: Sequence[str], _frames: List[pd.DataFrame]) -> pd.DataFrame:
+    return pd.concat(_frames, ignore_index=True)
+
+
+@st.cache_resource(max_entries=256, show_spinner="Оцениваем записи…")
+def score_upload(digest: str, model_path: str, model_version: tuple, prefilter: bool,
+                 _df: pd.DataFrame) -> np.ndarray:
+    """Per-record probabilities of one uploaded file, in row order."""
+    return openai_utils.score_frame(_df, model_path=model_path, prefilter=prefilter).to_numpy()
+
+
+def _mtime(path: str) -> int:
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+
+
+def csv_export(df: pd.DataFrame, chunk_rows: int = CSV_CHUNK_ROWS) -> io.BytesIO:
+    """Write df as CSV chunk by chunk into a BytesIO instead of building the
+    whole CSV string first (a type st.download_button accepts)."""
+    out = io.BytesIO()
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        out.write(chunk.to_csv(index=False, header=start == 0).encode("utf-8"))
+    if df.empty:
+        out.write(df.to_csv(index=False).encode("utf-8"))
+    out.seek(0)
+    return out
+
+
 st.set_page_config(page_title="Аномалии CI/CD логов", layout="wide")
 st.title("🔍 Аномалии CI/CD логов")
 
@@ -11,6 +57,12 @@ threshold = st.sidebar.slider(
     "Порог вероятности аномалии",
     min_value=0.0, max_value=1.0, value=0.5, step=0.01
 )
+prefilter = st.sidebar.checkbox(
+    "Пропускать типовые строки (baseline-индекс)",
+    value=False,
+    help="строки, типовые по model.baseline.json, не оцениваются моделью и получают вероятность 0",
+    disabled=not os.path.exists(baseline_index.index_path(MODEL_PATH)),
+)
 
 uploaded = st.file_uploader(
     "Загрузите один или несколько JSON-файлов логов",
@@ -19,27 +71,36 @@ uploaded = st.file_uploader(
 )
 
 if uploaded:
-    dfs = []
+    parts = []
     for f in uploaded:
+        content = f.getvalue()
+        digest = hashlib.sha256(content).hexdigest()
         try:
-            dfs.append(pd.read_json(f))
+            parts.append((digest, parse_upload(digest, content)))
         except ValueError:
             st.warning(f"Не удалось прочитать {f.name}")
-    if not dfs:
+    if not parts:
         st.error("Нет корректных JSON-файлов")
         st.stop()
 
-    data = pd.concat(dfs, ignore_index=True)
+    digests = tuple(d for d, _ in parts)
+    data = combine_uploads(digests, [df for _, df in parts])
     st.sidebar.metric("Всего записей", len(data))
-    
-    records: List[Dict[str, Any]] = data.to_dict(orient="records")
-    anomalies = openai_utils.detect_anomalies(records, threshold=threshold)
-    n_anom = len(anomalies)
+
+    # Probabilities do not depend on the threshold: score each file once,
+    # moving the slider only re-filters below. A retrained model or a
+    # rebuilt/deleted baseline index changes the key.
+    model_version = (_mtime(MODEL_PATH), _mtime(baseline_index.index_path(MODEL_PATH)) if prefilter else 0)
+    probs = np.concatenate([
+        score_upload(d, MODEL_PATH, model_version, prefilter, df) for d, df in parts
+    ])
+
+    df_all = data.assign(anomaly_prob=probs)
+    df_anom = df_all[df_all["anomaly_prob"] > threshold]
+    n_anom = len(df_anom)
     st.sidebar.metric("Найдено аномалий", n_anom)
     
     if n_anom:
-        df_anom = pd.DataFrame(anomalies)
-        
         df_anom = df_anom.sort_values("anomaly_prob", ascending=False)
         st.subheader("⚠️ Список потенциальных аномалий")
         st.dataframe(
@@ -52,6 +113,7 @@ if uploaded:
         if st.button("📝 Описать аномалии"):
             with st.spinner("Генерируем обзор…"):
                 try:
+                    anomalies: List[Dict[str, Any]] = df_anom.to_dict(orient="records")
                     summary = openai_utils.describe_anomalies(anomalies)
                     st.markdown("**Обзор аномалий (2–3 предложения):**")
                     st.write(summary)
@@ -59,24 +121,28 @@ if uploaded:
                     st.error(f"Ошибка при вызове OpenAI: {e}")
     else:
         st.info("Аномалий выше порога не найдено")
-    
-    df_all = data.copy()
-    df_all["anomaly_prob"] = 0.0
-    for rec in anomalies:
-        
-        mask = (
-            (df_all["run_id"] == rec["run_id"]) &
-            (df_all["timestamp"].astype(str) == str(rec["timestamp"])) &
-            (df_all["stage"] == rec["stage"])
-        )
-        df_all.loc[mask, "anomaly_prob"] = rec["anomaly_prob"]
 
-    csv = df_all.to_csv(index=False).encode("utf-8")
     st.download_button(
         "⬇️ Скачать результат (все записи с вероятностями)",
-        data=csv,
+        data=lambda: csv_export(df_all),
         file_name="cicd_anomaly_results.csv",
         mime="text/csv"
     )
 else:
     st.info("Загрузите JSON-файлы логов для анализа")
+
+# The registry lives as long as the Streamlit process, across sessions
+with st.sidebar.expander("📈 Метрики производительности"):
+    snap = metrics.registry.snapshot()
+    spans = pd.DataFrame.from_dict(snap["spans_ms"], orient="index")
+    if spans.empty:
+        st.caption("Пока ничего не измерено")
+    else:
+        st.dataframe(spans[["count", "sum_ms", "p50", "p99"]], use_container_width=True)
+        st.json(snap["counters"], expanded=False)
+    st.download_button(
+        "⬇️ Метрики (Prometheus)",
+        data=metrics.registry.to_prometheus(),
+        file_name="pipeguard_metrics.prom",
+        mime="text/plain"
+    )
@@ -0,0 +1,229 @@
+"""Historical baseline of routine log lines, used as a cheap pre-filter.
+
+For every (stage, message template) seen in normal training lines the index
+keeps mergeable quantile sketches of ``delta`` and ``duration_sec`` and the
+status frequencies. A line whose key, status and timings all fall inside the
+baseline is "routine" and does not need the full model.
+"""
+
+import os
+import json
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import log_templates
+
+FORMAT_VERSION = 1
+_SEP = "\x1f"
+
+
+class QuantileSketch:
+    """Log-bucketed streaming quantile sketch with relative error ``alpha``
+    (DDSketch-style); values <= 0 share one bucket."""
+
+    def __init__(self, alpha: float = 0.01):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.zero = 0
+        self.bins: Dict[int, int] = {}
+
+    @property
+    def count(self) -> int:
+        return self.zero + sum(self.bins.values())
+
+    def add(self, values: Any):
+        v = np.asarray(values, dtype=np.float64)
+        v = v[np.isfinite(v)]
+        pos = v > 0
+        self.zero += int((~pos).sum())
+        if pos.any():
+            idx = np.ceil(np.log(v[pos]) / self._log_gamma).astype(np.int64)
+            for i, n in zip(*np.unique(idx, return_counts=True)):
+                self.bins[int(i)] = self.bins.get(int(i), 0) + int(n)
+
+    def merge(self, other: "QuantileSketch"):
+        self.zero += other.zero
+        for i, n in other.bins.items():
+            self.bins[i] = self.bins.get(i, 0) + n
+
+    def quantile(self, q: float) -> float:
+        total = self.count
+        if not total:
+            return float("nan")
+        rank = q * (total - 1)
+        seen = self.zero
+        if rank < seen:
+            return 0.0
+        for i in sorted(self.bins):
+            seen += self.bins[i]
+            if rank < seen:
+                return 2 * self.gamma ** i / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"alpha": self.alpha, "zero": self.zero, "bins": {str(i): n for i, n in self.bins.items()}}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "QuantileSketch":
+        s = cls(d["alpha"])
+        s.zero = d["zero"]
+        s.bins = {int(i): n for i, n in d["bins"].items()}
+        return s
+
+
+class BaselineIndex:
+    def __init__(
+        self,
+        entries: Optional[Dict[str, Dict[str, Any]]] = None,
+        quantile_range: Tuple[float, float] = (0.005, 0.995),
+        min_count: int = 20,
+        min_status_share: float = 0.01,
+    ):
+        self.entries = entries or {}
+        self.quantile_range = tuple(quantile_range)
+        self.min_count = min_count
+        self.min_status_share = min_status_share
+        self._bounds: Optional[Dict[str, Tuple[float, float, float, float]]] = None
+        self._templates: Dict[Any, str] = {}
+
+    def _keys(self, X: Any) -> List[str]:
+        # Templates are regex work per message, so memoize per distinct text
+        cache = self._templates
+        if len(cache) > 200_000:
+            cache.clear()
+        keys = []
+        for stage, m in zip(X["stage"], X["message"]):
+            t = cache.get(m)
+            if t is None:
+                t = cache[m] = log_templates.message_template(m)
+            keys.append(f"{stage}{_SEP}{t}")
+        return keys
+
+    def update(self, df: "pd.DataFrame"):
+        """Add normal lines (with ``delta``; ``duration_sec`` optional)."""
+        import pandas as pd
+
+        frame = pd.DataFrame({
+            "key": pd.Series(self._keys(df), index=df.index),
+            "status": df["status"].astype(str),
+            "delta": df["delta"],
+            "duration": df["duration_sec"] if "duration_sec" in df else np.nan,
+        })
+        for key, part in frame.groupby("key", sort=False):
+            e = self.entries.get(key)
+            if e is None:
+                e = self.entries[key] = {
+                    "count": 0, "status": {}, "delta": QuantileSketch(), "duration": QuantileSketch(),
+                }
+            e["count"] += len(part)
+            for status, n in part["status"].value_counts().items():
+                e["status"][status] = e["status"].get(status, 0) + int(n)
+            e["delta"].add(part["delta"].to_numpy())
+            e["duration"].add(part["duration"].to_numpy())
+        self._bounds = None
+
+    def _compute_bounds(self) -> Dict[str, Tuple[float, float, float, float]]:
+        lo, hi = self.quantile_range
+        bounds = {}
+        for key, e in self.entries.items():
+            if e["count"] < self.min_count:
+                continue
+            d, dur = e["delta"], e["duration"]
+            bounds[key] = (
+                d.quantile(lo), d.quantile(hi),
+                dur.quantile(lo) if dur.count else -np.inf,
+                dur.quantile(hi) if dur.count else np.inf,
+            )
+        return bounds
+
+    def routine_mask(self, X: Any) -> np.ndarray:
+        """True for lines that match the baseline and can skip the model.
+
+        ``X`` is a DataFrame or a mapping of column -> sequence with stage,
+        status, message and delta (duration_sec optional); no pandas needed.
+        """
+        if self._bounds is None:
+            self._bounds = self._compute_bounds()
+        keys = self._keys(X)
+        hits = [self._bounds.get(k) for k in keys]
+        known = np.fromiter((h is not None for h in hits), dtype=bool, count=len(keys))
+        mask = np.zeros(len(keys), dtype=bool)
+        if not known.any():
+            return mask
+
+        b = np.array([h for h in hits if h is not None], dtype=np.float64)
+        delta = np.asarray(X["delta"], dtype=np.float64)[known]
+        ok = (delta >= b[:, 0]) & (delta <= b[:, 1])
+        if "duration_sec" in X:
+            dur = np.asarray(X["duration_sec"], dtype=np.float64)[known]
+            ok &= np.isnan(dur) | ((dur >= b[:, 2]) & (dur <= b[:, 3]))
+
+        known_at = np.flatnonzero(known)
+        statuses = X["status"]
+        for i in np.flatnonzero(ok):
+            row = known_at[i]
+            e = self.entries[keys[row]]
+            status = statuses.iloc[row] if hasattr(statuses, "iloc") else statuses[row]
+            if e["status"].get(str(status), 0) < self.min_status_share * e["count"]:
+                ok[i] = False
+        mask[known] = ok
+        return mask
+
+    def save(self, path: str):
+        data = {
+            "version": FORMAT_VERSION,
+            "quantile_range": list(self.quantile_range),
+            "min_count": self.min_count,
+            "min_status_share": self.min_status_share,
+            "entries": {
+                k: {
+                    "count": e["count"], "status": e["status"],
+                    "delta": e["delta"].to_dict(), "duration": e["duration"].to_dict(),
+                }
+                for k, e in self.entries.items()
+            },
+        }
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BaselineIndex":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported baseline index version in {path}")
+        entries = {
+            k: {
+                "count": e["count"], "status": e["status"],
+                "delta": QuantileSketch.from_dict(e["delta"]),
+                "duration": QuantileSketch.from_dict(e["duration"]),
+            }
+            for k, e in data["entries"].items()
+        }
+        return cls(entries, data["quantile_range"], data["min_count"], data["min_status_share"])
+
+
+def index_path(model_path: str) -> str:
+    """``model.pkl`` -> ``model.baseline.json``: the index lives next to its model."""
+    return os.path.splitext(model_path)[0] + ".baseline.json"
+
+
+_loaded: Dict[str, Tuple[int, BaselineIndex]] = {}
+
+
+def load_for_model(model_path: str) -> Optional[BaselineIndex]:
+    """The index stored next to ``model_path``, or None; reloaded when the file changes."""
+    path = index_path(model_path)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _loaded[path] = (mtime, BaselineIndex.load(path))
+    return cached[1]
@@ -0,0 +1,165 @@
+"""Micro-batching in front of the model: coalesces concurrent scoring
+requests into one vectorized ``predict_proba`` call."""
+
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import baseline_index
+import openai_utils
+import metrics
+from metrics import LatencyHistogram
+
+
+class _Request(NamedTuple):
+    X: pd.DataFrame
+    future: Future
+    submitted: float
+
+
+class MicroBatcher:
+    """Collects feature frames for up to ``window_ms`` or ``max_batch`` records,
+    scores them with a single ``predict_proba`` and hands every caller its slice.
+
+    Featurization (``delta`` per run) happens in the caller's thread on its own
+    records, so runs of different callers never mix even if their ids collide.
+    """
+
+    def __init__(
+        self,
+        model: Any = None,
+        window_ms: float = 5.0,
+        max_batch: int = 8192,
+        workers: int = 1,
+        model_path: str = "model.pkl",
+        prefilter: bool = False,
+    ):
+        # With a fixed ``model`` every batch uses it; otherwise each batch asks
+        # the registry, so a retrained model file is picked up on the fly.
+        self.model = model
+        self.model_path = model_path
+        self.prefilter = prefilter
+        if model is None:
+            openai_utils.load_anomaly_model(model_path)
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.records = 0
+        self.batches = 0
+        self._started = None
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+        self._thread = threading.Thread(target=self._collect, name="batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, X: pd.DataFrame) -> "Future[np.ndarray]":
+        """Queue a model input frame; the future resolves to its probabilities."""
+        fut: Future = Future()
+        if len(X) == 0:
+            fut.set_result(np.empty(0))
+        else:
+            self._queue.put(_Request(X, fut, time.perf_counter()))
+        return fut
+
+    def score(self, records: List[Dict[str, Any]]) -> np.ndarray:
+        """Same as openai_utils.score_records, but batched with other callers."""
+        if not records:
+            return np.empty(0)
+        df = openai_utils.prepare_frame(records).sort_index()
+        return self._probs(df)
+
+    def detect(self, records: List[Dict[str, Any]], threshold: float = 0.5) -> List[Dict[str, Any]]:
+        """Same as openai_utils.detect_anomalies, but batched with other callers."""
+        if not records:
+            return []
+        df = openai_utils.prepare_frame(records)
+        df["anomaly_prob"] = self._probs(df)
+        return df[df["anomaly_prob"] > threshold].to_dict(orient="records")
+
+    def _model(self) -> Any:
+        return self.model if self.model is not None else openai_utils.load_anomaly_model(self.model_path)
+
+    def _probs(self, df: pd.DataFrame) -> np.ndarray:
+        # With ``prefilter``, lines the baseline index calls routine never enter a batch
+        X = openai_utils.model_input(df, self._model())
+        index = baseline_index.load_for_model(self.model_path) if self.prefilter else None
+        if index is None:
+            return self.submit(X).result()
+        with metrics.span("detect_prefilter"):
+            routine = index.routine_mask(df)
+        metrics.incr("prefilter_lines", len(df))
+        metrics.incr("prefilter_skipped", int(routine.sum()))
+        probs = np.zeros(len(df))
+        probs[~routine] = self.submit(X[~routine]).result()
+        return probs
+
+    def _collect(self):
+        while True:
+            first = self._queue.get()
+            batch, size = [first], len(first.X)
+            deadline = first.submitted + self.window
+            while size < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    req = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(req)
+                size += len(req.X)
+            self._pool.submit(self._run, batch)
+
+    def _run(self, batch: List[_Request]):
+        try:
+            X = pd.concat([r.X for r in batch], ignore_index=True) if len(batch) > 1 else batch[0].X
+            with metrics.span("batcher_inference"):
+                probs = self._model().predict_proba(X)[:, 1]
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+                return
+            # One bad request must not fail the others coalesced with it:
+            # score each on its own so only the bad one gets the error
+            metrics.incr("batcher_split_batches")
+            for r in batch:
+                self._run([r])
+            return
+
+        done = time.perf_counter()
+        metrics.observe_size("batcher_batch_records", len(X))
+        metrics.observe_size("batcher_batch_requests", len(batch))
+        offset = 0
+        for r in batch:
+            n = len(r.X)
+            r.future.set_result(probs[offset:offset + n])
+            offset += n
+            self.latency.observe((done - r.submitted) * 1000)
+        with self._lock:
+            if self._started is None:
+                self._started = batch[0].submitted
+            self.requests += len(batch)
+            self.records += offset
+            self.batches += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = time.perf_counter() - self._started if self._started else 0.0
+            requests, records, batches = self.requests, self.records, self.batches
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "requests": requests,
+            "records": records,
+            "batches": batches,
+            "mean_requests_per_batch": requests / batches if batches else 0.0,
+            "mean_records_per_batch": records / batches if batches else 0.0,
+            "throughput_rps": records / elapsed if elapsed > 0 else 0.0,
+            "p50_ms": self.latency.quantile(0.5),
+            "p99_ms": self.latency.quantile(0.99),
+        }
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# run_benchmarks.py
+"""Reproducible benchmarks for the ingest -> featurize -> score -> CLI path.
+
+Every measurement runs in a fresh interpreter, so peak RSS and the model
+load are per stage and not shared with earlier stages. Synthetic data comes
+from logs_extractor/generate_logs.py with a fixed seed and is cached per size.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import subprocess
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "logs_extractor"))
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+STAGES = ["convert", "load_data", "prepare_features", "load_model", "detect", "cli"]
+IMPORT_MODULES = ["openai_utils", "detect_cli", "train_model"]
+SEED = 42
+
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def generate_records(path: str, size: int):
+    """At least ``size`` records from generate_logs.generate_run, in one JSON file."""
+    import generate_logs
+
+    random.seed(SEED)
+    ts = datetime(2025, 1, 1)
+    n, run_id, first = 0, 1, True
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        while n < size:
+            for rec in generate_logs.generate_run(run_id, ts, 0.05):
+                f.write(("" if first else ",\n") + json.dumps(rec, ensure_ascii=False))
+                first = False
+                n += 1
+            run_id += 1
+            ts += timedelta(minutes=random.uniform(5, 10))
+        f.write("]\n")
+
+
+def generate_raw_log(path: str, size: int):
+    """A GitHub Actions style log of ``size`` lines with ::group:: stages."""
+    import generate_logs
+
+    random.seed(SEED)
+    ts = datetime(2025, 1, 1)
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while n < size:
+            for stage in generate_logs.STAGES:
+                f.write(f"::group::{stage}\n")
+                for msg in [f"Starting {stage}", *generate_logs.INTERMEDIATE[stage]]:
+                    ts += timedelta(seconds=random.uniform(1, 10))
+                    f.write(f"{ts.isoformat(timespec='milliseconds')}Z {msg}\n")
+                    n += 1
+                f.write("::endgroup::\n")
+
+
+def prepare_data(data_dir: str, size: int):
+    """Paths of the cached inputs for ``size``, generating missing ones."""
+    d = os.path.join(data_dir, str(size))
+    os.makedirs(d, exist_ok=True)
+    records, raw = os.path.join(d, "records.json"), os.path.join(d, "workflow.log")
+    if not os.path.exists(records):
+        print(f"Generating {size} records…", file=sys.stderr)
+        generate_records(records + ".tmp", size)
+        os.replace(records + ".tmp", records)
+    if not os.path.exists(raw):
+        generate_raw_log(raw + ".tmp", size)
+        os.replace(raw + ".tmp", raw)
+    return records, raw
+
+
+def run_stage(stage: str, records_path: str, raw_path: str, model_path: str):
+    """Run one stage in this process; returns (items, seconds, extra)."""
+    extra = {}
+    if stage == "convert":
+        import convert_workflow_logs
+        t0 = time.perf_counter()
+        n = sum(1 for _ in convert_workflow_logs.iter_log_file(raw_path))
+        return n, time.perf_counter() - t0, extra
+
+    if stage in ("load_data", "prepare_features"):
+        import train_model
+        t0 = time.perf_counter()
+        df = train_model.load_data(records_path, workers=1, use_cache=False)
+        t1 = time.perf_counter()
+        if stage == "load_data":
+            return len(df), t1 - t0, extra
+        X, _ = train_model.prepare_features(df)
+        return len(X), time.perf_counter() - t1, extra
+
+    import openai_utils
+    if stage == "load_model":
+        t0 = time.perf_counter()
+        openai_utils.load_anomaly_model(model_path)
+        return 1, time.perf_counter() - t0, extra
+
+    if stage == "detect":
+        with open(records_path, encoding="utf-8") as f:
+            records = json.load(f)
+        openai_utils.load_anomaly_model(model_path)
+        t0 = time.perf_counter()
+        anomalies = openai_utils.detect_anomalies(records, model_path=model_path)
+        extra["anomalies"] = len(anomalies)
+        return len(records), time.perf_counter() - t0, extra
+
+    if stage == "cli":
+        with open(records_path, encoding="utf-8") as f:
+            n = sum(1 for line in f if line.strip())
+        t0 = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, os.path.join(ROOT, "detect_cli.py"), records_path, "-m", model_path],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        seconds = time.perf_counter() - t0
+        # 1 means "anomalies found", anything else is a failure
+        if proc.returncode not in (0, 1):
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "detect_cli failed")
+        # Peak RSS of detect_cli itself, not of this wrapper
+        extra["peak_rss_mb"] = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+        return n, seconds, extra
+
+    raise ValueError(f"unknown stage {stage}")
+
+
+def measure(stage: str, size: int, records_path: str, raw_path: str, model_path: str):
+    """Run ``stage`` in a fresh interpreter and collect its measurement."""
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--_stage", stage,
+         "--_records", records_path, "--_raw", raw_path, "--model", model_path],
+        capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        err = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"
+        return {"stage": stage, "size": size, "error": err}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result.update(stage=stage, size=size)
+    return result
+
+
+def measure_import(module: str, repeat: int) -> float:
+    """Best wall time of ``import module`` in a fresh interpreter, minus interpreter startup."""
+    def best(code: str) -> float:
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.perf_counter() - t0)
+        return min(times)
+    return max(0.0, best(f"import {module}") - best("pass"))
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: list, old_path: str):
+    with open(old_path, encoding="utf-8") as f:
+        old = {(r["stage"], r["size"]): r for r in json.load(f)["results"] if "seconds" in r}
+    print(f"\n=== vs {old_path} (время: было → стало) ===")
+    for r in results:
+        o = old.get((r["stage"], r["size"]))
+        if o and "seconds" in r and r["seconds"] > 0:
+            print(f"{r['stage']:<17}{r['size']:>10}  {o['seconds']:.3f}s → {r['seconds']:.3f}s  "
+                  f"(×{o['seconds'] / r['seconds']:.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки pipeguard: чтение, признаки, модель, CLI")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="размеры корпусов в записях (default: 1000 10000 100000; до 10^7)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES,
+                        help="какие этапы измерять (по умолчанию — все)")
+    parser.add_argument("-m", "--model", default=os.path.join(ROOT, "model.pkl"),
+                        help="модель для load_model/detect/cli (default=model.pkl в корне репозитория)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="повторов каждого измерения, берётся лучшее (default=3)")
+    parser.add_argument("--data-dir", default=os.path.join(ROOT, ".bench_data"),
+                        help="кэш сгенерированных данных (default=.bench_data)")
+    parser.add_argument("-o", "--output", default="benchmark_results.json",
+                        help="файл результатов (default=benchmark_results.json)")
+    parser.add_argument("--compare", default=None,
+                        help="сравнить с результатами предыдущего запуска (JSON)")
+    parser.add_argument("--_stage", help=argparse.SUPPRESS)
+    parser.add_argument("--_records", help=argparse.SUPPRESS)
+    parser.add_argument("--_raw", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._stage:
+        # Child mode: one measurement, reported as a JSON line on stdout
+        rss_before = _peak_rss_mb()
+        items, seconds, extra = run_stage(args._stage, args._records, args._raw, args.model)
+        print(json.dumps({
+            "items": items,
+            "seconds": seconds,
+            "throughput": items / seconds if seconds > 0 else None,
+            "peak_rss_mb": extra.pop("peak_rss_mb", None) or _peak_rss_mb(),
+            "startup_rss_mb": rss_before,
+            **extra,
+        }))
+        return
+
+    model_path = os.path.abspath(args.model)
+    results = []
+    for size in args.sizes:
+        records_path, raw_path = prepare_data(args.data_dir, size)
+        for stage in args.stages:
+            runs = [measure(stage, size, records_path, raw_path, model_path) for _ in range(args.repeat)]
+            ok = [r for r in runs if "error" not in r]
+            r = min(ok, key=lambda r: r["seconds"]) if ok else runs[0]
+            results.append(r)
+            if "error" in r:
+                print(f"{stage:<17}{size:>10}  ошибка: {r['error']}", file=sys.stderr)
+            else:
+                print(f"{stage:<17}{size:>10}  {r['seconds']:8.3f}s  {r['throughput'] or 0:>12.0f} /s  "
+                      f"RSS {r['peak_rss_mb']:.0f} MB", flush=True)
+
+    imports = {m: measure_import(m, args.repeat) for m in IMPORT_MODULES}
+    for m, t in imports.items():
+        print(f"import {m:<14} {t * 1000:8.1f} ms")
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "model": model_path,
+        "repeat": args.repeat,
+        "import_seconds": imports,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Results saved to '{args.output}'")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""Pickle-free, NumPy-only inference for the trained scoring pipeline.
+
+``export_pipeline`` flattens the fitted sklearn Pipeline (StandardScaler,
+OneHotEncoder, TfidfVectorizer or TemplateEncoder, RandomForestClassifier)
+into plain arrays in an ``.npz`` file; ``CompiledModel`` reproduces its ``predict_proba`` without
+importing sklearn, pandas or joblib.
+"""
+
+import re
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+import log_templates
+
+FORMAT_VERSION = 1
+
+
+def export_pipeline(pipe: Any, path: str):
+    """Write the fitted ``train_model.build_pipeline()`` pipeline to ``path`` (.npz)."""
+    prep = pipe.named_steps["prep"]
+    clf = pipe.named_steps["clf"]
+    scaler = prep.named_transformers_["num"]
+    onehot = prep.named_transformers_["cat"]
+    text = "tpl" if "tpl" in prep.output_indices_ else "txt"
+    for name in ("num", "cat", text):
+        if name not in prep.output_indices_:
+            raise ValueError(f"pipeline has no '{name}' transformer")
+
+    offsets, left, right, feature, threshold, value = [0], [], [], [], [], []
+    positive = list(clf.classes_).index(1)
+    for est in clf.estimators_:
+        tree = est.tree_
+        base = offsets[-1]
+        is_leaf = tree.children_left == -1
+        left.append(np.where(is_leaf, -1, tree.children_left + base))
+        right.append(np.where(is_leaf, -1, tree.children_right + base))
+        feature.append(np.where(is_leaf, -1, tree.feature))
+        threshold.append(tree.threshold)
+        v = tree.value[:, 0, :]
+        value.append(v[:, positive] / v.sum(axis=1))
+        offsets.append(base + tree.node_count)
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "num_features": list(prep.transformers_[0][2]),
+        "cat_features": list(onehot.feature_names_in_),
+        "text_feature": prep.transformers_[2][2],
+        "slices": {k: [s.start, s.stop] for k, s in prep.output_indices_.items() if k != "remainder"},
+        "stage_baseline": getattr(pipe, "stage_baseline_", None),
+    }
+    arrays = {
+        "scaler_mean": np.asarray(scaler.mean_, dtype=np.float64),
+        "scaler_scale": np.asarray(scaler.scale_, dtype=np.float64),
+        "tree_offsets": np.asarray(offsets, dtype=np.int64),
+        "tree_left": np.concatenate(left).astype(np.int32),
+        "tree_right": np.concatenate(right).astype(np.int32),
+        "tree_feature": np.concatenate(feature).astype(np.int32),
+        "tree_threshold": np.concatenate(threshold).astype(np.float64),
+        "tree_value": np.concatenate(value).astype(np.float64),
+    }
+    if text == "tpl":
+        meta["templates"] = prep.named_transformers_["tpl"].miner_.to_dict()
+    else:
+        tfidf = prep.named_transformers_["txt"]
+        if tfidf.analyzer != "word" or tfidf.sublinear_tf or tfidf.binary or tfidf.strip_accents:
+            raise ValueError("unsupported TfidfVectorizer settings for export")
+        meta.update(
+            token_pattern=tfidf.token_pattern,
+            lowercase=bool(tfidf.lowercase),
+            ngram_range=list(tfidf.ngram_range),
+            norm=tfidf.norm,
+        )
+        terms = sorted(tfidf.vocabulary_, key=tfidf.vocabulary_.get)
+        arrays.update(
+            vocab=np.array(terms, dtype=str),
+            idf=np.asarray(tfidf.idf_, dtype=np.float64),
+            stop_words=np.array(sorted(tfidf.get_stop_words() or ()), dtype=str),
+        )
+    arrays["meta"] = np.array(json.dumps(meta))
+    for i, cats in enumerate(onehot.categories_):
+        arrays[f"cat_{i}"] = np.array([str(c) for c in cats], dtype=str)
+    np.savez(path, **arrays)
+
+
+class UnsupportedInput(Exception):
+    """Input or model the NumPy-only path cannot handle; use the pandas path."""
+
+
+class CompiledModel:
+    """Drop-in replacement for the Pipeline's ``predict_proba``.
+
+    Accepts a DataFrame or any mapping of column name -> sequence.
+    """
+
+    def __init__(self, path: str, chunk_size: int = 4096):
+        self.path = path
+        self.chunk_size = chunk_size
+        with np.load(path, allow_pickle=False) as z:
+            meta = json.loads(str(z["meta"]))
+            if meta["version"] != FORMAT_VERSION:
+                raise ValueError(f"unsupported compiled model version {meta['version']}")
+            self.meta = meta
+            self.mean = z["scaler_mean"]
+            self.scale = z["scaler_scale"]
+            if "templates" in meta:
+                self.templates = log_templates.TemplateMiner.from_dict(meta["templates"])
+            else:
+                self.templates = None
+                self.idf = z["idf"]
+                self.vocab = {t: i for i, t in enumerate(z["vocab"].tolist())}
+                self.stop_words = frozenset(z["stop_words"].tolist())
+            self.categories = [
+                {c: j for j, c in enumerate(z[f"cat_{i}"].tolist())}
+                for i in range(len(meta["cat_features"]))
+            ]
+            self.offsets = z["tree_offsets"]
+            self.left = z["tree_left"]
+            self.right = z["tree_right"]
+            self.feature = z["tree_feature"]
+            self.threshold = z["tree_threshold"]
+            self.value = z["tree_value"]
+
+        leaf = self.feature < 0
+        nodes = np.arange(len(leaf))
+        self._left = np.where(leaf, nodes, self.left)
+        self._right = np.where(leaf, nodes, self.right)
+        self._feature = np.where(leaf, 0, self.feature)
+        self._threshold = np.where(leaf, np.inf, self.threshold)
+
+        self.classes_ = np.array([0, 1])
+        self.stage_baseline_ = meta.get("stage_baseline")
+        self.n_features = max(stop for _, stop in meta["slices"].values())
+        self._token_re = re.compile(meta["token_pattern"]) if self.templates is None else None
+        self._text_cache: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def _text_row(self, text: Any) -> Tuple[np.ndarray, np.ndarray]:
+        cached = self._text_cache.get(text)
+        if cached is not None:
+            return cached
+
+        doc = str(text)
+        if self.meta["lowercase"]:
+            doc = doc.lower()
+        tokens = [t for t in self._token_re.findall(doc) if t not in self.stop_words]
+        lo, hi = self.meta["ngram_range"]
+        counts: Dict[int, int] = {}
+        for n in range(lo, hi + 1):
+            for i in range(len(tokens) - n + 1):
+                j = self.vocab.get(" ".join(tokens[i:i + n]))
+                if j is not None:
+                    counts[j] = counts.get(j, 0) + 1
+
+        idx = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        vals = np.fromiter(counts.values(), dtype=np.float64, count=len(counts)) * self.idf[idx]
+        if self.meta["norm"] == "l2" and len(vals):
+            vals /= np.sqrt(np.dot(vals, vals))
+        elif self.meta["norm"] == "l1" and len(vals):
+            vals /= np.abs(vals).sum()
+        if len(self._text_cache) < 100_000:
+            self._text_cache[text] = (idx, vals)
+        return idx, vals
+
+    def transform(self, X: Any) -> np.ndarray:
+        """Dense float32 feature matrix, column-compatible with the ColumnTransformer."""
+        n = len(X[self.meta["text_feature"]])
+        out = np.zeros((n, self.n_features), dtype=np.float64)
+
+        start, stop = self.meta["slices"]["num"]
+        num = np.column_stack([np.asarray(X[c], dtype=np.float64) for c in self.meta["num_features"]])
+        out[:, start:stop] = (num - self.mean) / self.scale
+
+        rows = np.arange(n)
+        pos = self.meta["slices"]["cat"][0]
+        for col, cats in zip(self.meta["cat_features"], self.categories):
+            codes = np.fromiter((cats.get(str(v), -1) for v in X[col]), dtype=np.int64, count=n)
+            hit = codes >= 0
+            out[rows[hit], pos + codes[hit]] = 1.0
+            pos += len(cats)
+
+        # Messages repeat a lot: featurize each distinct text once
+        uid: Dict[Any, int] = {}
+        codes = np.fromiter(
+            (uid.setdefault(t, len(uid)) for t in X[self.meta["text_feature"]]),
+            dtype=np.int64, count=n,
+        )
+        if self.templates is not None:
+            start, stop = self.meta["slices"]["tpl"]
+            tids = np.array([
+                -1 if (tid := self.templates.match(t)) is None or tid >= stop - start else tid
+                for t in uid
+            ], dtype=np.int64)[codes]
+            hit = tids >= 0
+            out[rows[hit], start + tids[hit]] = 1.0
+            return out.astype(np.float32)
+
+        start, stop = self.meta["slices"]["txt"]
+        text = np.zeros((len(uid), stop - start), dtype=np.float64)
+        for t, u in uid.items():
+            idx, vals = self._text_row(t)
+            text[u, idx] = vals
+        out[:, start:stop] = text[codes]
+        # Trees were fitted on float32 input
+        return out.astype(np.float32)
+
+    def _forest_proba(self, F: np.ndarray) -> np.ndarray:
+        n_trees = len(self.offsets) - 1
+        if len(F) * n_trees <= 200_000:
+            return self._forest_proba_flat(F, n_trees)
+        # Large batches: one vectorized pass per tree. Leaves point to
+        # themselves, so rows that reached a leaf stay there.
+        rows = np.arange(len(F))
+        total = np.zeros(len(F), dtype=np.float64)
+        for root in self.offsets[:-1]:
+            node = np.full(len(F), root, dtype=np.int64)
+            while True:
+                nxt = np.where(
+                    F[rows, self._feature[node]] <= self._threshold[node],
+                    self._left[node],
+                    self._right[node],
+                )
+                if np.array_equal(nxt, node):
+                    break
+                node = nxt
+            total += self.value[node]
+        return total / n_trees
+
+    def _forest_proba_flat(self, F: np.ndarray, n_trees: int) -> np.ndarray:
+        # Small batches: walk every (row, tree) pair at once, dropping pairs
+        # as they reach a leaf, so the Python loop runs max_depth times.
+        node = np.tile(self.offsets[:-1], len(F)).astype(np.int64)
+        row = np.repeat(np.arange(len(F)), n_trees)
+        leaf = np.empty_like(node)
+        active = np.arange(len(node))
+        while active.size:
+            nd = node[active]
+            feat = self.feature[nd]
+            done = feat < 0
+            if done.any():
+                leaf[active[done]] = nd[done]
+                keep = ~done
+                active, nd, feat = active[keep], nd[keep], feat[keep]
+            go_left = F[row[active], feat] <= self.threshold[nd]
+            node[active] = np.where(go_left, self.left[nd], self.right[nd])
+        return self.value[leaf].reshape(len(F), n_trees).mean(axis=1)
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        n = len(X[self.meta["text_feature"]])
+        p1 = np.empty(n, dtype=np.float64)
+        for start in range(0, n, self.chunk_size):
+            part = {c: _slice(X[c], start, start + self.chunk_size) for c in self._columns()}
+            with metrics.span("detect_transform"):
+                F = self.transform(part)
+            with metrics.span("detect_inference"):
+                p1[start:start + self.chunk_size] = self._forest_proba(F)
+        return np.column_stack([1.0 - p1, p1])
+
+    def _columns(self) -> List[str]:
+        return self.meta["num_features"] + self.meta["cat_features"] + [self.meta["text_feature"]]
+
+
+def _slice(values: Iterable, start: int, stop: int):
+    if hasattr(values, "iloc"):
+        return values.iloc[start:stop]
+    return values[start:stop]
+
+
+def load(path: str) -> CompiledModel:
+    return CompiledModel(path)
+
+
+def _parse_ts(value: Any) -> Optional[datetime]:
+    if value is None or value != value:  # None, NaN, NaT
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _value(v: Any) -> Any:
+    # NumPy scalars from column buffers back to plain Python values
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def detect_records(
+    model: CompiledModel,
+    records: Any,
+    threshold: float = 0.5,
+    index: Any = None,
+) -> List[Dict[str, Any]]:
+    """``openai_utils.detect_anomalies`` without pandas.
+
+    ``records`` is a list of dicts or columns (a mapping of name -> sequence,
+    e.g. from ``ingest.read_columns``). ``delta`` is computed in pure Python
+    over rows sorted by (run_id, timestamp); lines the baseline ``index``
+    calls routine skip the model. Raises UnsupportedInput for inputs it
+    cannot order (mixed run_id types, naive and aware timestamps) and for
+    models with run/stage features, so callers can fall back to the pandas path.
+    """
+    if model.stage_baseline_ is not None:
+        raise UnsupportedInput("models with run/stage features need the pandas path")
+    start = time.perf_counter()
+    if isinstance(records, list):
+        names = list(dict.fromkeys(k for r in records for k in r))
+        columns = {c: [r.get(c) for r in records] for c in names}
+    else:
+        columns = {c: (v.to_numpy() if hasattr(v, "to_numpy") else v) for c, v in records.items()}
+    if not columns or not len(columns["run_id"]):
+        return []
+
+    runs = columns["run_id"]
+    with metrics.span("detect_parse_timestamps"):
+        stamps = [_parse_ts(v) for v in columns["timestamp"]]
+    with metrics.span("detect_sort_delta"):
+        try:
+            # Unparseable timestamps sort last within their run, like NaT
+            order = sorted(
+                range(len(stamps)),
+                key=lambda i: (runs[i], stamps[i] is None, stamps[i] or datetime.min),
+            )
+            deltas, prev_run, prev_ts = [], object(), None
+            for i in order:
+                run, ts = runs[i], stamps[i]
+                same = run == prev_run and ts is not None and prev_ts is not None
+                deltas.append((ts - prev_ts).total_seconds() if same else 0.0)
+                prev_run, prev_ts = run, ts
+        except TypeError as e:
+            # Values Python cannot compare or subtract
+            raise UnsupportedInput(f"cannot order records: {e}") from e
+    metrics.observe_size("detect_batch_records", len(order))
+
+    X = {"delta": deltas}
+    for col in ("stage", "status", "message", "duration_sec"):
+        if col in columns:
+            X[col] = [columns[col][i] for i in order]
+
+    with metrics.span("detect_prefilter"):
+        routine = index.routine_mask(X) if index is not None else np.zeros(len(order), dtype=bool)
+    if index is not None:
+        metrics.incr("prefilter_lines", len(order))
+        metrics.incr("prefilter_skipped", int(routine.sum()))
+    probs = np.zeros(len(order))
+    if not routine.all():
+        keep = np.flatnonzero(~routine)
+        part = {c: [X[c][k] for k in keep] for c in model._columns()}
+        probs[keep] = model.predict_proba(part)[:, 1]
+
+    filter_start = time.perf_counter()
+    anomalies = []
+    for pos in np.flatnonzero(probs > threshold):
+        i = order[pos]
+        rec = {c: _value(v[i]) for c, v in columns.items()}
+        rec.update(
+            timestamp=stamps[i] if stamps[i] is not None else rec["timestamp"],
+            delta=deltas[pos],
+            anomaly_prob=float(probs[pos]),
+        )
+        anomalies.append(rec)
+    done = time.perf_counter()
+    metrics.registry.observe_ms("detect_filter", (done - filter_start) * 1000)
+    metrics.registry.observe_ms("detect", (done - start) * 1000)
+    metrics.incr("records_scored", len(order))
+    metrics.incr("anomalies_found", len(anomalies))
+    if done > start:
+        metrics.set_gauge("detect_records_per_second", len(order) / (done - start))
+    return anomalies
@@ -1,42 +1,126 @@
+import os
 import re
-import json
+import codecs
 import sys
+import json
+import time
 from datetime import datetime
 from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+GROUP_RE = re.compile(r"^::group::(.+)")
+ENDGROUP_PREFIX = "::endgroup::"
+TS_LINE_RE = re.compile(r"^(\d{4}-\d{2}-\d{2}T[\d:.]+Z)\s+(.*)")
+ERROR_RE = re.compile(r"\berror\b", re.IGNORECASE)
+
+
+class WorkflowLogParser:
+    """Turns raw GitHub Actions log lines into records, one line at a time.
+
+    Keeps the current ``::group::`` stage between calls, so the same parser can
+    be fed a whole file or lines appended to it later.
+    """
 
-if len(sys.argv) != 3:
-    print("Usage: convert_workflow_logs.py <raw_log.txt> <out.json>", file=sys.stderr)
-    sys.exit(1)
-
-raw_log, out_json = sys.argv[1], sys.argv[2]
-stage = "init"
-records = []
-with open(raw_log, encoding="utf-8") as f:
-    for line in f:
-        
-        m = re.match(r"^::group::(.+)", line)
-        if m:
-            stage = m.group(1).strip()
-            continue
-        if line.startswith("::endgroup::"):
-            stage = "init"
-            continue
-
-        ts_match = re.match(r"^(\d{4}-\d{2}-\d{2}T[\d:.]+Z)\s+(.*)", line)
+    def __init__(self, run_id: Any = 1):
+        self.run_id = run_id
+        self.stage = "init"
+
+    def feed(self, line: str) -> Optional[Dict[str, Any]]:
+        if line.startswith("::"):
+            m = GROUP_RE.match(line)
+            if m:
+                self.stage = m.group(1).strip()
+                return None
+            if line.startswith(ENDGROUP_PREFIX):
+                self.stage = "init"
+                return None
+
+        ts_match = TS_LINE_RE.match(line)
         if ts_match:
             ts, msg = ts_match.groups()
         else:
             ts = datetime.utcnow().isoformat()
             msg = line.strip()
 
-        status = "ERROR" if re.search(r"\berror\b", msg, re.IGNORECASE) else "INFO"
-        records.append({
-            "run_id": 1,
-            "stage": stage,
-            "status": status,
+        return {
+            "run_id": self.run_id,
+            "stage": self.stage,
+            "status": "ERROR" if ERROR_RE.search(msg) else "INFO",
             "message": msg,
             "timestamp": ts
-        })
+        }
+
+
+def iter_records(lines: Iterable[str], run_id: Any = 1) -> Iterator[Dict[str, Any]]:
+    parser = WorkflowLogParser(run_id)
+    for line in lines:
+        rec = parser.feed(line)
+        if rec is not None:
+            yield rec
+
+
+def iter_log_file(path, run_id: Any = 1) -> Iterator[Dict[str, Any]]:
+    """Lazily convert a raw workflow log into records, without a temp file."""
+    with open(path, encoding="utf-8") as f:
+        yield from iter_records(f, run_id)
+
+
+def follow_lines(
+    path,
+    poll_interval: float = 0.5,
+    idle_timeout: Optional[float] = None
+) -> Iterator[List[str]]:
+    """Tail a growing file from its beginning.
+
+    Every poll yields the complete lines appended since the previous one (an
+    empty list if nothing arrived), so the caller can act on timeouts. A
+    truncated or replaced file is re-read from the start. Stops after
+    ``idle_timeout`` seconds without new data, flushing a trailing partial line.
+    """
+    f, inode, partial, decoder = None, None, "", None
+    last_data = time.monotonic()
+    try:
+        while True:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                st = None
+            if st is not None and (f is None or st.st_ino != inode or st.st_size < f.tell()):
+                if f is not None:
+                    f.close()
+                f, inode, partial = open(path, "rb"), st.st_ino, ""
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+            chunk = decoder.decode(f.read(1 << 20)) if f is not None else ""
+            if chunk:
+                last_data = time.monotonic()
+                lines = (partial + chunk).split("\n")
+                partial = lines.pop()
+                yield [line.rstrip("\r") for line in lines]
+                continue
+
+            if idle_timeout is not None and time.monotonic() - last_data >= idle_timeout:
+                if partial:
+                    yield [partial]
+                return
+            yield []
+            time.sleep(poll_interval)
+    finally:
+        if f is not None:
+            f.close()
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("Usage: convert_workflow_logs.py <raw_log.txt> <out.json>", file=sys.stderr)
+        sys.exit(1)
+
+    raw_log, out_json = sys.argv[1], sys.argv[2]
+    records = list(iter_log_file(raw_log))
+
+    with open(out_json, "w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False, indent=2)
+
 
-with open(out_json, "w", encoding="utf-8") as f:
-    json.dump(records, f, ensure_ascii=False, indent=2)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# corpus.py
+"""Consolidated Parquet corpus of run_*.json logs with incremental append.
+
+The corpus is an append-only sequence of part files (``part-NNNNN.parquet``),
+one per build, listed in ``_manifest.json``. Parts are not partitioned by any
+column; every read scans all of them.
+"""
+
+import os
+import sys
+import glob
+import json
+import argparse
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import pandas as pd
+
+import ingest
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is only needed for corpus reads/builds
+    pa = pq = None
+
+MANIFEST = "_manifest.json"
+# 2: ingested files are keyed by absolute path instead of basename
+_MANIFEST_VERSION = 2
+
+TRAIN_COLUMNS = ["run_id", "timestamp", "stage", "status", "message", "duration_sec", "label"]
+# duration_sec feeds the duration bounds of the baseline index
+DETECT_COLUMNS = ["run_id", "timestamp", "stage", "status", "message", "duration_sec"]
+
+
+def _schema() -> "pa.Schema":
+    text = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("run_id", pa.int64()),
+        ("timestamp", pa.timestamp("us")),
+        ("stage", text),
+        ("status", text),
+        ("message", text),
+        ("host", text),
+        ("user", text),
+        ("pid", pa.int64()),
+        ("thread", pa.int64()),
+        ("duration_sec", pa.float64()),
+        ("label", pa.int64()),
+    ])
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Для работы с корпусом нужен pyarrow (pip install pyarrow)")
+
+
+def is_corpus(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def _read_manifest(out_dir: str, check_version: bool = True) -> Dict:
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {"version": _MANIFEST_VERSION, "files": {}, "parts": []}
+    if check_version and manifest.get("version") != _MANIFEST_VERSION:
+        raise ValueError(f"Неподдерживаемая версия корпуса в {out_dir} (пересоберите с --rebuild)")
+    return manifest
+
+
+def _write_manifest(out_dir: str, manifest: Dict):
+    path = os.path.join(out_dir, MANIFEST)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def _to_table(df: pd.DataFrame) -> "pa.Table":
+    schema = _schema()
+    arrays = []
+    for field in schema:
+        if field.name in df:
+            col = df[field.name]
+            if pa.types.is_dictionary(field.type):
+                arr = pa.array(col.astype(object).where(col.notna(), None), type=pa.string())
+                arrays.append(arr.dictionary_encode())
+            else:
+                arrays.append(pa.array(col, type=field.type, from_pandas=True))
+        else:
+            arrays.append(pa.nulls(len(df), type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def write_part(frames: Iterable[pd.DataFrame], path: str) -> int:
+    """Write ``frames`` as row groups of one part file (atomically).
+
+    Returns the number of rows written.
+    """
+    _require_pyarrow()
+    rows = 0
+    tmp = path + ".tmp"
+    with pq.ParquetWriter(tmp, _schema(), compression="zstd", use_dictionary=True) as writer:
+        for df in frames:
+            writer.write_table(_to_table(df))
+            rows += len(df)
+    os.replace(tmp, path)
+    return rows
+
+
+def add_parts(out_dir: str, parts: Sequence[str]):
+    """Register already written part files in the manifest of ``out_dir``."""
+    manifest = _read_manifest(out_dir)
+    manifest["parts"].extend(parts)
+    _write_manifest(out_dir, manifest)
+
+
+def next_part_index(out_dir: str) -> int:
+    return len(_read_manifest(out_dir)["parts"])
+
+
+def build_corpus(
+    logs_dir: str,
+    out_dir: str,
+    workers: Optional[int] = None,
+    rebuild: bool = False,
+) -> int:
+    """Append run_*.json files that are not yet in ``out_dir`` as a new part.
+
+    Files are tracked by absolute path, so same-named logs from different
+    directories are all added. Returns the number of files added.
+    """
+    _require_pyarrow()
+    os.makedirs(out_dir, exist_ok=True)
+    # an outdated manifest can still be rebuilt from scratch
+    manifest = _read_manifest(out_dir, check_version=not rebuild)
+    if rebuild:
+        for part in manifest["parts"]:
+            try:
+                os.remove(os.path.join(out_dir, part))
+            except FileNotFoundError:
+                pass
+        manifest = {"version": _MANIFEST_VERSION, "files": {}, "parts": []}
+
+    new_files = []
+    for fn in sorted(glob.glob(os.path.join(logs_dir, "run_*.json"))):
+        name = os.path.abspath(fn)
+        st = os.stat(fn)
+        seen = manifest["files"].get(name)
+        if seen is None:
+            new_files.append((fn, name, [st.st_size, st.st_mtime_ns]))
+        elif seen != [st.st_size, st.st_mtime_ns]:
+            print(f"Warning: {fn} изменился после добавления в корпус (используйте --rebuild)",
+                  file=sys.stderr)
+
+    if not new_files:
+        print(f"Корпус {out_dir} актуален, новых файлов нет")
+        return 0
+
+    df = ingest.read_logs([fn for fn, _, _ in new_files], workers=workers, cache_dir=None)
+    part = f"part-{len(manifest['parts']):05d}.parquet"
+    write_part([df], os.path.join(out_dir, part))
+
+    manifest["parts"].append(part)
+    for _, name, stamp in new_files:
+        manifest["files"][name] = stamp
+    _write_manifest(out_dir, manifest)
+    print(f"Добавлено {len(new_files)} файлов ({len(df)} записей) в {out_dir}/{part}")
+    return len(new_files)
+
+
+def read_corpus(path: str, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Read the corpus memory-mapped, loading only ``columns``.
+
+    Dictionary-encoded text columns come back as pandas categoricals.
+    """
+    _require_pyarrow()
+    manifest = _read_manifest(path)
+    tables: List["pa.Table"] = [
+        pq.read_table(os.path.join(path, part), columns=list(columns) if columns else None,
+                      memory_map=True)
+        for part in manifest["parts"]
+    ]
+    if not tables:
+        return pd.DataFrame(columns=list(columns or _schema().names))
+    # Parts are written separately, so their dictionaries differ
+    table = pa.concat_tables(tables).unify_dictionaries()
+    return table.to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Сборка колоночного корпуса (Parquet) из JSON-логов run_*.json"
+    )
+    parser.add_argument(
+        "--logs-dir", "-d", default="logs",
+        help="директория с JSON-логами (по умолчанию 'logs')"
+    )
+    parser.add_argument(
+        "--out", "-o", default="corpus",
+        help="директория корпуса (по умолчанию 'corpus')"
+    )
+    parser.add_argument(
+        "--workers", "-w", type=int, default=None,
+        help="число процессов для чтения логов"
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true",
+        help="пересобрать корпус с нуля"
+    )
+    args = parser.parse_args()
+
+    try:
+        build_corpus(args.logs_dir, args.out, workers=args.workers, rebuild=args.rebuild)
+    except (RuntimeError, ValueError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
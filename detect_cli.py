@@ -1,39 +1,341 @@
-import argparse
-import json
+import time
+_STARTED = time.perf_counter()
+
+import os
 import sys
+import glob
+import json
+import atexit
+import signal
+import argparse
+from contextlib import contextmanager
 from pathlib import Path
-import pandas as pd
-from openai import OpenAI
-import openai_utils
-import subprocess
-
-inp = Path(sys.argv[1])
-if inp.suffix == ".log":
-    tmp = Path("/tmp/all_logs.json")
-    subprocess.run([
-        sys.executable, "convert_workflow_logs.py",
-        str(inp), str(tmp)
-    ], check=True)
-    
-    sys.argv[1] = str(tmp)
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+import convert_workflow_logs
+
+# pandas, sklearn (via unpickling) and openai are imported only on the code
+# paths that need them: a short CI log scored with a compiled .npz model
+# never loads any of them.
+
+_phases = {}
+
+@contextmanager
+def _phase(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases[name] = _phases.get(name, 0.0) + time.perf_counter() - t0
+
+def print_startup_profile():
+    total = time.perf_counter() - _STARTED
+    print("\n=== Профиль запуска (--profile-startup) ===", file=sys.stderr)
+    for name, seconds in _phases.items():
+        print(f"  {name:<10} {seconds * 1000:9.1f} ms", file=sys.stderr)
+    print(f"  {'total':<10} {total * 1000:9.1f} ms (с момента импорта detect_cli)", file=sys.stderr)
+    heavy = ["numpy", "pandas", "pyarrow", "sklearn", "joblib", "openai", "matplotlib"]
+    loaded = ", ".join(f"{m}={'да' if m in sys.modules else 'нет'}" for m in heavy)
+    print(f"  модули: {loaded}", file=sys.stderr)
+
+def iter_input(path: Path):
+    """Yield records lazily: raw .log files are converted in-process, line by
+    line; JSONL is read line by line from a memory map."""
+    if path.suffix == ".log":
+        return convert_workflow_logs.iter_log_file(path)
+    import ingest
+    with open(path, "rb") as f:
+        head = f.read(1 << 16)
+    if ingest.sniff_format(head) == "jsonl":
+        return ingest.iter_file_records(str(path))
+    return ingest.iter_json_records(str(path))
+
+class InputError(Exception):
+    """The input file could not be read (as opposed to a scoring failure)."""
+
+def _read_stream(path: Path):
+    # Only errors raised while reading are tagged; scoring runs in the consumer
+    try:
+        yield from iter_input(path)
+    except Exception as e:
+        raise InputError(str(e)) from e
 
 def load_records(path: Path):
+    """Records of ``path``: a list of dicts for raw .log files, otherwise
+    columns (JSON/JSONL parsed once into arrays, or a corpus DataFrame) that
+    the scoring functions take as they are."""
+    if path.suffix == ".log":
+        return list(convert_workflow_logs.iter_log_file(path))
+    if path.is_dir():
+        import corpus
+        if corpus.is_corpus(str(path)):
+            return corpus.read_corpus(str(path), columns=corpus.DETECT_COLUMNS)
+    import ingest
+    return ingest.read_columns(str(path))
+
+def as_record_list(records):
+    """Columns as a list of dicts, for the few consumers that need rows."""
+    if isinstance(records, list):
+        return records
+    if not isinstance(records, dict):
+        return records.to_dict(orient="records")
+    names = list(records)
+    return [
+        {c: (v.item() if hasattr(v, "item") else v) for c, v in zip(names, row)}
+        for row in zip(*records.values())
+    ]
+
+def _load_compiled(model_path: str):
+    import model_registry
     try:
-        df = pd.read_json(path)
-        return df.to_dict(orient="records")
-    except ValueError:
-        with open(path, encoding="utf-8") as f:
-            data = json.load(f)
-        if isinstance(data, list):
-            return data
-        raise ValueError(f"Unsupported format in {path}")
+        return model_registry.registry.get(model_path)
+    except FileNotFoundError:
+        print(f"Ошибка: не найден файл модели по пути '{model_path}'", file=sys.stderr)
+        sys.exit(1)
+
+def detect_local(records, threshold: float, model_path: str = "model.pkl", jobs=None,
+                 prefilter: bool = False):
+    """Score records in this process.
+
+    Compiled ``.npz`` models go through the slim path (NumPy only, delta in
+    pure Python); other models, models with run/stage features, inputs
+    the slim path cannot order and ``jobs`` > 1 (run_id partitions scored
+    in a process pool) use openai_utils.detect_anomalies (pandas).
+    With ``prefilter``, lines the model's baseline index calls routine are skipped.
+    """
+    if model_path.endswith(".npz") and not (jobs and jobs > 1):
+        with _phase("model"):
+            model = _load_compiled(model_path)
+        with _phase("imports"):
+            import baseline_index
+            import compiled_model
+        try:
+            with _phase("score"):
+                index = baseline_index.load_for_model(model_path) if prefilter else None
+                return compiled_model.detect_records(model, records, threshold, index)
+        except compiled_model.UnsupportedInput:
+            pass
+    with _phase("imports"):
+        import openai_utils
+    with _phase("model"):
+        openai_utils.load_anomaly_model(model_path)
+    with _phase("score"):
+        return openai_utils.detect_anomalies(
+            records, threshold=threshold, model_path=model_path, prefilter=prefilter, workers=jobs
+        )
+
+INPUT_SUFFIXES = (".json", ".jsonl", ".log")
+
+def expand_inputs(inputs):
+    """Files to scan for the given paths, globs and directories, in a stable
+    order and without duplicates. Parquet corpora count as one input."""
+    paths = []
+    for item in inputs:
+        if glob.has_magic(item):
+            paths += [Path(p) for p in sorted(glob.glob(item))]
+        elif Path(item).is_dir() and not _is_corpus(item):
+            paths += sorted(p for p in Path(item).iterdir() if p.suffix in INPUT_SUFFIXES)
+        else:
+            paths.append(Path(item))
+    return list(dict.fromkeys(paths))
+
+def _is_corpus(path: str) -> bool:
+    import corpus
+    return corpus.is_corpus(path)
+
+_IN_WORKER = False
+
+def _init_worker(model_path: str):
+    # Loaded once per process, reused for every file it scans
+    if model_path.endswith(".npz"):
+        _load_compiled(model_path)
+    else:
+        import openai_utils
+        openai_utils.load_anomaly_model(model_path)
+
+def _start_worker(model_path: str):
+    global _IN_WORKER
+    _IN_WORKER = True
+    _init_worker(model_path)
+
+def scan_file(path: Path, threshold: float, model_path: str = "model.pkl", prefilter: bool = False):
+    """Anomalies of one file plus its timings; errors are reported, not raised."""
+    import ingest
+    result = {"file": str(path), "records": 0, "anomalies": 0, "read_s": 0.0, "score_s": 0.0, "error": None}
+    anomalies = []
+    try:
+        t0 = time.perf_counter()
+        records = load_records(path)
+        t1 = time.perf_counter()
+        anomalies = detect_local(records, threshold, model_path, prefilter=prefilter)
+        t2 = time.perf_counter()
+        result.update(records=ingest.n_records(records), anomalies=len(anomalies), read_s=t1 - t0, score_s=t2 - t1)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    if _IN_WORKER:
+        # Worker metrics would die with the process: ship them to the parent
+        result["metrics"] = metrics.registry.drain()
+    return result, anomalies
+
+def scan_files(paths, threshold: float, model_path: str = "model.pkl", workers=None,
+               prefilter: bool = False):
+    """Yield ``(summary, anomalies)`` per file in the order of ``paths``,
+    scanning up to ``workers`` files at a time in separate processes."""
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    if workers == 1:
+        _init_worker(model_path)
+        for p in paths:
+            yield scan_file(p, threshold, model_path, prefilter)
+        return
+    with ProcessPoolExecutor(workers, initializer=_start_worker, initargs=(model_path,)) as pool:
+        yield from pool.map(
+            scan_file, paths, [threshold] * len(paths), [model_path] * len(paths),
+            [prefilter] * len(paths)
+        )
+
+def _json_line(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, default=str)
+
+def batch_scan(paths, threshold: float, model_path: str, workers=None,
+               fmt: str = "text", keep: bool = False, prefilter: bool = False):
+    """Scan several files and print their anomalies file by file, each
+    followed by its timing summary. Returns ``(count, kept, failed_files)``."""
+    count, kept, failed = 0, [], 0
+    started = time.perf_counter()
+    for summary, found in scan_files(paths, threshold, model_path, workers, prefilter):
+        if "metrics" in summary:
+            metrics.registry.merge(summary.pop("metrics"))
+        metrics.incr("files_scanned")
+        count += len(found)
+        failed += summary["error"] is not None
+        if keep:
+            kept += found
+        if fmt == "jsonl":
+            for a in found:
+                print(_json_line({"type": "anomaly", "file": summary["file"], **a}))
+            print(_json_line({"type": "file", **summary}), flush=True)
+            continue
+        if summary["error"]:
+            print(f"== {summary['file']}: ошибка: {summary['error']}", flush=True)
+            continue
+        print(
+            f"== {summary['file']}: записей {summary['records']}, аномалий {summary['anomalies']} "
+            f"(чтение {summary['read_s']:.2f}s, оценка {summary['score_s']:.2f}s)"
+        )
+        for a in found:
+            print(format_anomaly(a))
+        sys.stdout.flush()
+
+    elapsed = time.perf_counter() - started
+    if fmt == "jsonl":
+        print(_json_line({
+            "type": "total", "files": len(paths), "failed": failed,
+            "anomalies": count, "threshold": threshold, "seconds": elapsed,
+        }))
+    else:
+        print(f"\nФайлов: {len(paths)} (с ошибками: {failed}), время: {elapsed:.2f}s")
+    return count, kept, failed
+
+def detect_remote(records, url: str, threshold: float):
+    """Score records on a running server.py instance instead of loading the model here."""
+    import server
+    records = as_record_list(records)
+    probs = server.score_remote(records, url)
+    return [
+        dict(rec, anomaly_prob=p)
+        for rec, p in zip(records, probs)
+        if p > threshold
+    ]
+
+def format_anomaly(a) -> str:
+    return (
+        f"- P={a['anomaly_prob']:.2f} | run {a['run_id']}, "
+        f"stage={a['stage']}, status={a['status']}, "
+        f"ts={a['timestamp']}, msg=\"{a['message']}\""
+    )
+
+def stream_anomalies(path: Path, threshold: float, chunk_size: int, keep: bool = False,
+                     model_path: str = "model.pkl", prefilter: bool = False):
+    """Score the file chunk by chunk and print anomalies as they are found.
+
+    Returns the number of anomalies and, if ``keep`` is set, the anomalies themselves.
+    """
+    import openai_utils
+    count, kept = 0, []
+    records = _read_stream(path)
+    for a in openai_utils.detect_anomalies_stream(
+        records, threshold=threshold, chunk_size=chunk_size, model_path=model_path,
+        prefilter=prefilter
+    ):
+        print(format_anomaly(a), flush=True)
+        count += 1
+        if keep:
+            kept.append(a)
+    return count, kept
+
+def follow_anomalies(path: Path, threshold: float, chunk_size: int, max_latency: float,
+                     idle_timeout=None, keep: bool = False, model_path: str = "model.pkl",
+                     metrics_out=None, prefilter: bool = False):
+    """Tail a growing raw workflow log and print anomalies as lines arrive.
+
+    New lines are scored at the latest ``max_latency`` seconds after the
+    first of them was read (or as soon as ``chunk_size`` are pending); one
+    StreamScorer keeps ``delta`` correct across batches. Runs until
+    ``idle_timeout`` seconds pass without new data or the process is
+    interrupted. ``metrics_out`` is a ``(path, format)`` pair the metrics are
+    exported to after every batch. Returns the same as stream_anomalies.
+    """
+    import openai_utils
+    scorer = openai_utils.StreamScorer(threshold=threshold, model_path=model_path, prefilter=prefilter)
+    log_parser = convert_workflow_logs.WorkflowLogParser()
+    count, kept = 0, []
+    pending, since = [], None
+
+    def flush():
+        nonlocal count, pending, since
+        batch, pending, since = pending, [], None
+        for a in scorer.score(batch):
+            print(format_anomaly(a), flush=True)
+            count += 1
+            if keep:
+                kept.append(a)
+        if metrics_out:
+            export_metrics(*metrics_out)
+
+    poll = min(0.5, max_latency / 2)
+    try:
+        for lines in convert_workflow_logs.follow_lines(path, poll_interval=poll, idle_timeout=idle_timeout):
+            for line in lines:
+                rec = log_parser.feed(line)
+                if rec is None:
+                    continue
+                pending.append(rec)
+                if since is None:
+                    since = time.monotonic()
+                if len(pending) >= chunk_size:
+                    flush()
+            if pending and time.monotonic() - since >= max_latency:
+                flush()
+    except KeyboardInterrupt:
+        pass
+    if pending:
+        flush()
+    return count, kept
+
+def export_metrics(path: str, fmt=None):
+    try:
+        metrics.registry.export(path, fmt)
+    except OSError as e:
+        print(f"Error: cannot write metrics to {path}: {e}", file=sys.stderr)
 
 def override_openai_key(key: str):
-    """Re-instantiate the OpenAI client inside openai_utils."""
-    import os
+    """Use ``key`` for the OpenAI client; the client is created on first use,
+    so nothing is imported here."""
     os.environ["OPENAI_API_KEY"] = key
-    
-    openai_utils.client = OpenAI(api_key=key)
+    openai_utils = sys.modules.get("openai_utils")
+    if openai_utils is not None:
+        openai_utils._client = None
 
 def main():
     parser = argparse.ArgumentParser(
@@ -41,7 +343,8 @@ def main():
     )
     parser.add_argument(
         "input",
-        help="путь к JSON-файлу логов"
+        nargs="+",
+        help="JSON-файлы логов, сырые .log workflow, Parquet-корпуса, директории или glob-шаблоны"
     )
     parser.add_argument(
         "-k", "--openai-key",
@@ -60,49 +363,227 @@ def main():
     )
     parser.add_argument(
         "-m", "--model",
-        default="model_supervised.pkl",
-        help="путь к файлу модели (default=model_supervised.pkl)"
+        default="model.pkl",
+        help="путь к файлу модели, .pkl или .npz (default=model.pkl)"
+    )
+    parser.add_argument(
+        "--prefilter",
+        action="store_true",
+        help="не оценивать моделью строки, типовые по baseline-индексу рядом с моделью "
+             "(model.baseline.json); их вероятность — 0"
+    )
+    parser.add_argument(
+        "-s", "--stream",
+        action="store_true",
+        help="потоковый режим: читать и оценивать записи порциями с ограниченной памятью"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=10_000,
+        help="размер порции записей в потоковом режиме (default=10000)"
+    )
+    parser.add_argument(
+        "-f", "--follow",
+        action="store_true",
+        help="следить за растущим сырым .log workflow и оценивать новые строки по мере появления"
+    )
+    parser.add_argument(
+        "--max-latency",
+        type=float,
+        default=2.0,
+        help="в режиме --follow: максимальная задержка оценки новых строк, сек (default=2)"
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=None,
+        help="в режиме --follow: завершиться, если файл не растёт столько секунд (по умолчанию — до Ctrl+C/SIGTERM)"
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=None,
+        help="число процессов для пакетной проверки нескольких файлов (по умолчанию — все ядра)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=["text", "jsonl"],
+        default="text",
+        help="формат вывода: text или jsonl (аномалии и сводка по файлам, по объекту в строке)"
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help="оценивать один большой файл в N процессах, разбив записи по run_id"
+    )
+    parser.add_argument(
+        "--server",
+        default=None,
+        help="адрес запущенного server.py (http://host:port или unix:///path.sock)"
+    )
+    parser.add_argument(
+        "--run-model",
+        default=None,
+        help="модель оценки целых прогонов (run_model.pkl из train_model.py --run-level)"
+    )
+    parser.add_argument(
+        "--metrics-out",
+        default=None,
+        help="записать метрики (тайминги этапов, счётчики, размеры батчей) в файл при выходе; "
+             "в режиме --follow — после каждого батча"
+    )
+    parser.add_argument(
+        "--metrics-format",
+        choices=["prometheus", "jsonl"],
+        default=None,
+        help="формат --metrics-out: текст Prometheus (node exporter textfile) или JSON lines "
+             "(по умолчанию — по расширению файла)"
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="вывести в stderr время импорта, загрузки модели, чтения и оценки"
     )
     args = parser.parse_args()
+    if args.profile_startup:
+        atexit.register(print_startup_profile)
+    metrics_out = (args.metrics_out, args.metrics_format) if args.metrics_out else None
+    if metrics_out:
+        atexit.register(export_metrics, *metrics_out)
+    if args.server and args.stream:
+        parser.error("--server нельзя использовать вместе с --stream")
+    if args.server and args.prefilter:
+        parser.error("с --server пре-фильтр включается при запуске server.py (--prefilter)")
+    if args.follow and (args.server or args.stream):
+        parser.error("--follow нельзя использовать вместе с --server или --stream")
 
     if args.openai_key:
         override_openai_key(args.openai_key)
 
-    path = Path(args.input)
-    if not path.exists():
-        print(f"Error: file {path} not found", file=sys.stderr)
-        sys.exit(1)
+    batch = False
+    if args.follow:
+        if len(args.input) != 1:
+            parser.error("--follow принимает ровно один файл")
+        path = Path(args.input[0])
+    else:
+        paths = expand_inputs(args.input)
+        if not paths:
+            print(f"Error: no log files match {' '.join(args.input)}", file=sys.stderr)
+            sys.exit(1)
+        for p in paths:
+            if not p.exists():
+                print(f"Error: file {p} not found", file=sys.stderr)
+                sys.exit(1)
+        path = paths[0]
+        batch = len(paths) > 1 or args.format == "jsonl" or args.workers is not None
+        if batch and (args.stream or args.server or args.run_model):
+            parser.error("--stream, --server и --run-model работают только с одним файлом")
+    if args.jobs and (batch or args.stream or args.server or args.follow):
+        parser.error("--jobs работает только при обычной проверке одного файла (для нескольких файлов — --workers)")
 
-    try:
-        records = load_records(path)
-    except Exception as e:
-        print(f"Error reading {path}: {e}", file=sys.stderr)
-        sys.exit(1)
-    
-    anomalies = openai_utils.detect_anomalies(
-        records,
-        threshold=args.threshold
-    )
+    if batch:
+        n_anom, anomalies, failed = batch_scan(
+            paths, args.threshold, args.model, workers=args.workers,
+            fmt=args.format, keep=args.describe, prefilter=args.prefilter
+        )
+        if failed == len(paths):
+            print(f"Ни один из {len(paths)} файлов не удалось проверить", file=sys.stderr)
+            sys.exit(1)
+        if not n_anom:
+            print("Аномалий не обнаружено ✅", file=sys.stderr if args.format == "jsonl" else sys.stdout)
+            sys.exit(1 if failed else 0)
+    elif args.follow:
+        # docker stop / CI cancellation send SIGTERM: finish like on Ctrl+C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        print(f"Следим за {path} (задержка ≤ {args.max_latency}s)…", file=sys.stderr, flush=True)
+        n_anom, anomalies = follow_anomalies(
+            path, args.threshold, args.chunk_size, args.max_latency,
+            idle_timeout=args.idle_timeout, keep=args.describe, model_path=args.model,
+            metrics_out=metrics_out, prefilter=args.prefilter
+        )
+        if not n_anom:
+            print("Аномалий не обнаружено ✅")
+            sys.exit(0)
+        print(f"\nНайдено аномалий: {n_anom} (threshold={args.threshold})")
+    elif args.stream:
+        import openai_utils
+        try:
+            with _phase("model"):
+                openai_utils.load_anomaly_model(args.model)
+        except Exception as e:
+            print(f"Error loading model {args.model}: {e}", file=sys.stderr)
+            sys.exit(1)
+        try:
+            n_anom, anomalies = stream_anomalies(
+                path, args.threshold, args.chunk_size, keep=args.describe,
+                model_path=args.model, prefilter=args.prefilter
+            )
+        except InputError as e:
+            print(f"Error reading {path}: {e}", file=sys.stderr)
+            sys.exit(1)
+        if not n_anom:
+            print("Аномалий не обнаружено ✅")
+            sys.exit(0)
+        print(f"\nНайдено аномалий: {n_anom} (threshold={args.threshold})")
+    else:
+        try:
+            with _phase("read"):
+                records = load_records(path)
+        except Exception as e:
+            print(f"Error reading {path}: {e}", file=sys.stderr)
+            sys.exit(1)
 
-    if not anomalies:
-        print("Аномалий не обнаружено ✅")
-        sys.exit(0)
+        if args.server:
+            try:
+                anomalies = detect_remote(records, args.server, args.threshold)
+            except Exception as e:
+                print(f"Error: scoring server {args.server} failed: {e}", file=sys.stderr)
+                sys.exit(1)
+        else:
+            anomalies = detect_local(
+                records, args.threshold, args.model, jobs=args.jobs, prefilter=args.prefilter
+            )
+
+        # Runs are scored before the early exit: a slow or error-heavy run
+        # can be anomalous without any single line crossing the threshold
+        runs = []
+        if args.run_model:
+            import openai_utils
+            runs = [
+                r for r in openai_utils.score_runs(records, model_path=args.run_model)
+                if r["run_prob"] > args.threshold
+            ]
+
+        if not anomalies and not runs:
+            print("Аномалий не обнаружено ✅")
+            sys.exit(0)
+
+        print(f"Найдено аномалий: {len(anomalies)} (threshold={args.threshold})\n")
+        for a in anomalies:
+            print(format_anomaly(a))
+
+        if args.run_model:
+            print(f"\nАномальных прогонов: {len(runs)}")
+            for r in runs:
+                print(
+                    f"- P={r['run_prob']:.2f} | run {r['run_id']}, lines={r['run_lines']:.0f}, "
+                    f"duration={r['run_duration']:.1f}s, errors={r['run_error_ratio']:.0%}"
+                )
 
-    
-    print(f"Найдено аномалий: {len(anomalies)} (threshold={args.threshold})\n")
-    for a in anomalies:
-        print(
-            f"- P={a['anomaly_prob']:.2f} | run {a['run_id']}, "
-            f"stage={a['stage']}, status={a['status']}, "
-            f"ts={a['timestamp']}, msg=\"{a['message']}\""
-        )
-    
     if args.describe:
-        print("\nГенерируем обзор аномалий через OpenAI…")
+        jsonl = args.format == "jsonl"
+        print("\nГенерируем обзор аномалий через OpenAI…", file=sys.stderr if jsonl else sys.stdout)
         try:
-            summary = openai_utils.describe_anomalies(anomalies)
-            print("\n=== ОБЗОР АНОМАЛИЙ ===")
-            print(summary)
+            with _phase("describe"):
+                import openai_utils
+                summary = openai_utils.describe_anomalies(anomalies)
+            if jsonl:
+                print(_json_line({"type": "summary", "text": summary}))
+            else:
+                print("\n=== ОБЗОР АНОМАЛИЙ ===")
+                print(summary)
         except Exception as e:
             print(f"[OpenAI error] {e}", file=sys.stderr)
 
@@ -0,0 +1,91 @@
+"""Line classifier that can be updated with new runs without a full retrain.
+
+Every step is stateless or supports ``partial_fit``: messages go through a
+HashingVectorizer (no vocabulary to refit), stage and status through a
+FeatureHasher, ``delta`` through a running StandardScaler and the classifier
+is an SGD logistic regression. ``train_model.py --incremental`` feeds it the
+corpus a chunk of files at a time, so memory is bounded by the chunk size.
+"""
+
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler
+
+import metrics
+
+CLASSES = np.array([0, 1])
+
+_VERSION_RE = re.compile(r"\.v\d+$")
+
+
+class IncrementalPipeline:
+    """Same ``predict_proba`` interface as the sklearn pipeline from train_model.py."""
+
+    # No run/stage features (openai_utils.model_input checks this)
+    stage_baseline_ = None
+
+    def __init__(self, n_features: int = 2 ** 18, alpha: float = 1e-5, random_state: int = 42):
+        self.text = HashingVectorizer(
+            n_features=n_features,
+            ngram_range=(1, 2),
+            stop_words="english",
+            alternate_sign=False,
+        )
+        self.cat = FeatureHasher(n_features=256, input_type="string", alternate_sign=False)
+        self.scaler = StandardScaler()
+        self.clf = SGDClassifier(loss="log_loss", alpha=alpha, random_state=random_state)
+        self.class_counts_ = np.zeros(len(CLASSES), dtype=np.int64)
+        self.version = 0
+        # Basenames of the files already learned from, so a rerun over the
+        # whole log directory only reads the new ones
+        self.trained_files: set = set()
+        self.history: List[Dict[str, Any]] = []
+
+    @property
+    def fitted(self) -> bool:
+        return bool(self.class_counts_.sum())
+
+    def transform(self, X: Any) -> sp.csr_matrix:
+        delta = np.asarray(X["delta"], dtype=np.float64).reshape(-1, 1)
+        cats = [[f"stage={s}", f"status={t}"] for s, t in zip(X["stage"], X["status"])]
+        return sp.hstack([
+            sp.csr_matrix(self.scaler.transform(np.nan_to_num(delta))),
+            self.cat.transform(cats),
+            self.text.transform(X["message"].astype(str)),
+        ], format="csr")
+
+    def partial_fit(self, X: Any, y: Any) -> "IncrementalPipeline":
+        y = np.asarray(y, dtype=np.int64)
+        self.class_counts_ += np.bincount(y, minlength=len(CLASSES))
+        self.scaler.partial_fit(np.nan_to_num(np.asarray(X["delta"], dtype=np.float64).reshape(-1, 1)))
+        # class_weight="balanced" over everything seen so far; sklearn only
+        # supports it in fit(), so pass it as sample weights
+        counts = np.maximum(self.class_counts_, 1)
+        weights = (counts.sum() / (len(CLASSES) * counts))[y]
+        self.clf.partial_fit(self.transform(X), y, classes=CLASSES, sample_weight=weights)
+        return self
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        with metrics.span("detect_transform"):
+            Xt = self.transform(X)
+        with metrics.span("detect_inference"):
+            return self.clf.predict_proba(Xt)
+
+    def predict(self, X: Any) -> np.ndarray:
+        return CLASSES[(self.predict_proba(X)[:, 1] > 0.5).astype(int)]
+
+    def new_files(self, files: Iterable[str]) -> List[str]:
+        return [f for f in sorted(files) if os.path.basename(f) not in self.trained_files]
+
+
+def versioned_path(base_path: Optional[str], version: int) -> str:
+    """``model.pkl`` / ``model.v3.pkl`` -> ``model.v<version>.pkl``."""
+    stem, ext = os.path.splitext(base_path or "model.pkl")
+    return f"{_VERSION_RE.sub('', stem)}.v{version}{ext or '.pkl'}"
@@ -0,0 +1,318 @@
+"""Parallel, columnar ingestion of JSON and JSONL logs."""
+
+import os
+import sys
+import json
+import mmap
+import time
+import pickle
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson is optional, stdlib json is a drop-in fallback
+    orjson = None
+    _loads = json.loads
+
+# pandas is imported only where a DataFrame is built, so detect_cli can read
+# inputs into column buffers without it
+
+CACHE_DIR = ".ingest_cache"
+_CACHE_VERSION = 1
+# Below this many files a process pool costs more than it saves
+_MIN_FILES_PER_CHUNK = 64
+# A record still undecodable after this many characters is taken as corrupt
+MAX_RECORD_CHARS = 16 << 20
+
+
+def _to_array(values: List[Any]) -> np.ndarray:
+    kinds = {type(v) for v in values}
+    if kinds == {int}:
+        return np.array(values, dtype=np.int64)
+    if kinds <= {int, float, type(None)}:
+        return np.array(values, dtype=np.float64)
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = values
+    return arr
+
+
+def _parse(buf: Any) -> Any:
+    if orjson:
+        # orjson parses memoryview slices of the mapping without copying
+        try:
+            return _loads(buf)
+        except orjson.JSONDecodeError:
+            # but rejects NaN/Infinity, which json and pd.read_json accept
+            pass
+    return json.loads(bytes(buf))
+
+
+def sniff_format(buf: Any) -> str:
+    """``"json"`` (one document, usually an array of records) or ``"jsonl"``
+    (one record per line), judged by the first bytes / first line of ``buf``."""
+    start, size = 0, len(buf)
+    while start < size and buf[start:start + 1] in (b" ", b"\t", b"\r", b"\n", b"\xef", b"\xbb", b"\xbf"):
+        start += 1
+    if buf[start:start + 1] != b"{":
+        return "json"
+    end = buf.find(b"\n", start)
+    view = memoryview(buf)
+    try:
+        first = _parse(view[start:end if end >= 0 else size])
+    except ValueError:
+        # the first object spans several lines: a pretty-printed document
+        return "json"
+    finally:
+        view.release()
+    # {"col": {"0": ...}} is a column-oriented document, not a record
+    if isinstance(first, dict) and first and all(isinstance(v, dict) for v in first.values()):
+        return "json"
+    return "jsonl"
+
+
+def _mapped_records(mm: mmap.mmap, path: str) -> Iterator[Dict[str, Any]]:
+    """Records of a memory-mapped JSON array or JSONL file, each parsed once."""
+    view = memoryview(mm)
+    try:
+        if sniff_format(mm) == "json":
+            data = _parse(view)
+            if isinstance(data, dict):
+                # column-oriented document: {"col": {"0": value, ...}, ...}
+                keys = list(next(iter(data.values()), {}))
+                data = [{c: data[c].get(k) for c in data} for k in keys]
+            if not isinstance(data, list):
+                raise ValueError(f"{path}: ожидался JSON-массив записей")
+            yield from data
+            return
+        pos, size = 0, len(mm)
+        while pos < size:
+            end = mm.find(b"\n", pos)
+            if end < 0:
+                end = size
+            line_start, pos = pos, end + 1
+            # skip blank lines without copying ordinary ones
+            if end == line_start or (mm[line_start:line_start + 1] in b" \t\r" and not mm[line_start:end].strip()):
+                continue
+            rec = _parse(view[line_start:end])
+            if not isinstance(rec, dict):
+                raise ValueError(f"{path}: строка {rec!r:.40} — не JSON-объект")
+            yield rec
+    finally:
+        view.release()
+
+
+def iter_file_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Records of a JSON array or JSONL file (format detected from its
+    first bytes), read through a memory map."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from _mapped_records(mm, path)
+
+
+class _ColumnBuilder:
+    """Appends records to per-key lists, padding missing keys with None."""
+
+    def __init__(self):
+        self.columns: Dict[str, List[Any]] = {}
+        self.n_rows = 0
+
+    def add(self, rec: Dict[str, Any]):
+        columns, n = self.columns, self.n_rows
+        for key, value in rec.items():
+            col = columns.get(key)
+            if col is None:
+                col = columns[key] = [None] * n
+            col.append(value)
+        self.n_rows = n = n + 1
+        if len(rec) < len(columns):
+            for col in columns.values():
+                if len(col) < n:
+                    col.append(None)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {k: _to_array(v) for k, v in self.columns.items()}
+
+
+def n_records(records: Any) -> int:
+    """Row count of records given as a list of dicts, a mapping of column ->
+    array (read_columns) or a DataFrame; all scoring functions accept each."""
+    if isinstance(records, dict):
+        return len(next(iter(records.values()), ()))
+    return len(records)
+
+
+def read_columns(path: str) -> Dict[str, np.ndarray]:
+    """One JSON or JSONL file as typed column arrays, parsed once."""
+    builder = _ColumnBuilder()
+    for rec in iter_file_records(path):
+        builder.add(rec)
+    return builder.arrays()
+
+
+def _parse_files(paths: Sequence[str]) -> Tuple[Dict[str, np.ndarray], int, List[Tuple[str, str]]]:
+    """Parse a chunk of files straight into typed column arrays."""
+    builder = _ColumnBuilder()
+    errors = []
+    for fn in paths:
+        # Records go into the builder only once the whole file parsed
+        try:
+            recs = list(iter_file_records(fn))
+        except (OSError, ValueError) as e:
+            errors.append((fn, str(e)))
+            continue
+        for rec in recs:
+            builder.add(rec)
+    return builder.arrays(), builder.n_rows, errors
+
+
+def _merge_chunks(chunks: Iterable[Tuple[Dict[str, np.ndarray], int]]) -> "pd.DataFrame":
+    import pandas as pd
+
+    chunks = list(chunks)
+    order: List[str] = []
+    for cols, _ in chunks:
+        order.extend(k for k in cols if k not in order)
+
+    merged = {}
+    for name in order:
+        parts = [cols.get(name) for cols, _ in chunks]
+        present = [p for p in parts if p is not None]
+        if all(p.dtype == np.int64 for p in present) and len(present) == len(parts):
+            dtype = np.int64
+        elif all(p.dtype != object for p in present):
+            dtype = np.float64
+        else:
+            dtype = object
+        filled = []
+        for part, (_, n) in zip(parts, chunks):
+            if part is None:
+                part = np.full(n, np.nan if dtype == np.float64 else None, dtype=dtype)
+            filled.append(part.astype(dtype, copy=False))
+        merged[name] = np.concatenate(filled) if filled else np.empty(0, dtype=dtype)
+    return pd.DataFrame(merged)
+
+
+def _fingerprint(files: Sequence[str]) -> str:
+    h = hashlib.sha1(str(_CACHE_VERSION).encode())
+    for fn in files:
+        st = os.stat(fn)
+        h.update(f"{os.path.abspath(fn)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def _chunked(files: Sequence[str], workers: int) -> List[Sequence[str]]:
+    size = max(_MIN_FILES_PER_CHUNK, -(-len(files) // (workers * 4)))
+    return [files[i:i + size] for i in range(0, len(files), size)]
+
+
+def read_logs(
+    files: Sequence[str],
+    workers: Optional[int] = None,
+    cache_dir: Optional[str] = CACHE_DIR,
+    verbose: bool = True,
+) -> "pd.DataFrame":
+    """Load JSON (or JSONL) log files into one DataFrame with the same schema as
+    ``pd.concat([pd.read_json(f) for f in files])``.
+
+    Files are parsed in a process pool; the result is cached in ``cache_dir``
+    and reused while none of the files change (path, size and mtime).
+    """
+    files = sorted(files)
+    workers = workers or os.cpu_count() or 1
+
+    cache_path = fingerprint = None
+    if cache_dir:
+        fingerprint = _fingerprint(files)
+        key = hashlib.sha1("\n".join(os.path.abspath(f) for f in files).encode()).hexdigest()
+        cache_path = os.path.join(cache_dir, f"{key}.pkl")
+        try:
+            with open(cache_path, "rb") as f:
+                cached = pickle.load(f)
+            if cached["fingerprint"] == fingerprint:
+                if verbose:
+                    print(f"Ingest: {len(files)} files loaded from cache {cache_path}")
+                return cached["frame"]
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError):
+            pass
+
+    start = time.perf_counter()
+    chunks = _chunked(files, workers)
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_parse_files, chunks))
+    else:
+        results = [_parse_files(c) for c in chunks]
+
+    for _, _, errors in results:
+        for fn, msg in errors:
+            print(f"Warning: не удалось прочитать {fn}: {msg}", file=sys.stderr)
+    import pandas as pd
+
+    frame = _merge_chunks((cols, n) for cols, n, _ in results if n)
+    # pd.read_json converts date-like columns on its own; keep that schema
+    if "timestamp" in frame:
+        frame["timestamp"] = pd.to_datetime(frame["timestamp"], errors="coerce")
+    elapsed = time.perf_counter() - start
+
+    if verbose:
+        rate = len(files) / elapsed if elapsed > 0 else float("inf")
+        print(
+            f"Ingest: {len(files)} files, {len(frame)} records in {elapsed:.2f}s "
+            f"({rate:.0f} files/s, workers={workers}, parser={'orjson' if orjson else 'json'})"
+        )
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = cache_path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump({"fingerprint": fingerprint, "frame": frame}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_path)
+    return frame
+
+
+def iter_json_records(path: str, block_size: int = 1 << 20,
+                      max_record: int = MAX_RECORD_CHARS) -> Iterator[Dict[str, Any]]:
+    """Yield records of a top-level JSON array one by one, reading ``block_size``
+    characters at a time, so memory does not grow with the file size.
+
+    A record that does not decode within ``max_record`` characters is
+    reported as corrupt instead of buffering the rest of the file.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buf = f.read(block_size).lstrip()
+        if not buf.startswith("["):
+            raise ValueError(f"{path}: ожидался JSON-массив записей")
+        pos, eof = 1, False
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf):
+                if buf[pos] == "]":
+                    return
+                try:
+                    rec, pos = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError as e:
+                    if eof:
+                        raise
+                    if len(buf) - pos > max_record:
+                        raise ValueError(
+                            f"{path}: запись не разбирается в пределах {max_record} символов: {e}"
+                        ) from e
+                else:
+                    yield rec
+                    continue
+            elif eof:
+                raise ValueError(f"{path}: неожиданный конец JSON-массива")
+            # Record may be cut at the block boundary: refill and retry
+            chunk = f.read(block_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
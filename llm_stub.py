@@ -0,0 +1,46 @@
+"""Offline stand-in for the OpenAI client, for tests and air-gapped runs.
+
+Enabled by ``PIPEGUARD_LLM_STUB=1``; mimics the part of the
+``client.chat.completions.create`` API that openai_utils uses.
+"""
+
+import time
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+
+class _Completions:
+    def __init__(self, owner: "StubClient"):
+        self._owner = owner
+
+    def create(self, model: str, messages: List[Dict[str, str]], max_tokens: int = 256, **kwargs: Any):
+        prompt = messages[-1]["content"]
+        with self._owner._lock:
+            self._owner.calls.append(prompt)
+        if self._owner.delay:
+            time.sleep(self._owner.delay)
+
+        items = [line for line in prompt.splitlines() if line.startswith("- ")]
+        content = f"[stub:{model}] {len(items)} пунктов во входных данных."
+        if items:
+            content += " Первый: " + items[0][2:][:200]
+        words = content.split()[:max_tokens]
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=" ".join(words)))],
+            usage=SimpleNamespace(
+                prompt_tokens=len(prompt.split()),
+                completion_tokens=len(words),
+                total_tokens=len(prompt.split()) + len(words),
+            ),
+        )
+
+
+class StubClient:
+    """Deterministic fake client; records every prompt in ``calls``."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls: List[str] = []
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=_Completions(self))
@@ -0,0 +1,141 @@
+"""Message templates: log messages with their variable parts masked."""
+
+import re
+
+_MASKS = [
+    (re.compile(r"(?:[A-Za-z]:)?(?:[/\\][\w.\-]+){2,}[/\\]?"), "<PATH>"),
+    (re.compile(r"\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{7,64}\b"), "<HEX>"),
+    (re.compile(r"[-+]?\d+(?:\.\d+)?"), "<NUM>"),
+]
+
+
+def message_template(message) -> str:
+    """``"Build completed in 12.34s"`` -> ``"Build completed in <NUM>s"``."""
+    text = str(message)
+    for pattern, token in _MASKS:
+        text = pattern.sub(token, text)
+    return text
+
+
+WILDCARD = "<*>"
+FORMAT_VERSION = 1
+
+
+def _variable(token: str) -> bool:
+    return token == WILDCARD or "<" in token or any(c.isdigit() for c in token)
+
+
+class TemplateMiner:
+    """Online Drain-style template miner.
+
+    Masked messages are routed by token count and their first ``depth``
+    tokens (variable tokens count as ``<*>``) to a short list of templates;
+    a message joins the most similar one if at least ``similarity`` of its
+    tokens match, and positions that differ become ``<*>``. Template IDs
+    are stable: a template only ever gets more general.
+    """
+
+    def __init__(self, depth: int = 2, similarity: float = 0.5):
+        self.depth = depth
+        self.similarity = similarity
+        self.templates = []
+        self.counts = []
+        self._tree = {}
+        self._ids = {}
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    def _candidates(self, tokens):
+        keys = [(len(tokens),)]
+        for token in tokens[:self.depth]:
+            keys = [k + (t,) for k in keys for t in {token, WILDCARD}]
+        return [tid for k in keys for tid in self._tree.get(k, ())]
+
+    def _insert(self, tokens, tid: int):
+        key = (len(tokens),) + tuple(WILDCARD if _variable(t) else t for t in tokens[:self.depth])
+        self._tree.setdefault(key, []).append(tid)
+
+    def _search(self, tokens):
+        best, best_score = None, -1.0
+        for tid in self._candidates(tokens):
+            template = self.templates[tid]
+            same = sum(a == b for a, b in zip(template, tokens) if a != WILDCARD)
+            score = same / len(tokens) if tokens else 1.0
+            if score > best_score:
+                best, best_score = tid, score
+        return best if best_score >= self.similarity else None
+
+    def add(self, message):
+        """Learn from ``message``; returns ``(template_id, parameters)``."""
+        text = str(message)
+        tid = self._ids.get(text)
+        raw = text.split()
+        if tid is None:
+            tokens = message_template(text).split()
+            tid = self._search(tokens)
+            if tid is None:
+                tid = len(self.templates)
+                self.templates.append(tokens)
+                self.counts.append(0)
+                self._insert(tokens, tid)
+            else:
+                self.templates[tid] = [a if a == b else WILDCARD for a, b in zip(self.templates[tid], tokens)]
+            self._remember(text, tid)
+        self.counts[tid] += 1
+        return tid, self._params(raw, tid)
+
+    def match(self, message):
+        """Template ID of ``message`` without learning, or None."""
+        text = str(message)
+        tid = self._ids.get(text)
+        if tid is None:
+            tid = self._search(message_template(text).split())
+            if tid is not None:
+                self._remember(text, tid)
+        return tid
+
+    def extract(self, message):
+        """``(template_id, parameters)`` without learning; ``(None, [])`` if unknown."""
+        tid = self.match(message)
+        return (None, []) if tid is None else (tid, self._params(str(message).split(), tid))
+
+    def _remember(self, text: str, tid: int):
+        # Exact-message index: repeated lines skip masking and the tree
+        if len(self._ids) > 200_000:
+            self._ids.clear()
+        self._ids[text] = tid
+
+    def _params(self, raw, tid: int):
+        template = self.templates[tid]
+        if len(raw) != len(template):
+            return []
+        return [r for r, t in zip(raw, template) if r != t]
+
+    def template(self, tid: int) -> str:
+        return " ".join(self.templates[tid])
+
+    def to_dict(self):
+        return {
+            "version": FORMAT_VERSION,
+            "depth": self.depth,
+            "similarity": self.similarity,
+            "templates": [self.template(i) for i in range(len(self.templates))],
+            "counts": self.counts,
+        }
+
+    @classmethod
+    def from_dict(cls, d) -> "TemplateMiner":
+        if d.get("version") != FORMAT_VERSION:
+            raise ValueError("unsupported template table version")
+        miner = cls(d["depth"], d["similarity"])
+        for tid, template in enumerate(d["templates"]):
+            tokens = template.split()
+            miner.templates.append(tokens)
+            miner._insert(tokens, tid)
+        miner.counts = list(d["counts"])
+        return miner
+
+    def __getstate__(self):
+        # The message index is a cache; keep pickled models small
+        return dict(self.__dict__, _ids={})
@@ -2,13 +2,18 @@
 # generate_logs.py
 
 import os
+import sys
 import json
+import math
+import time
 import random
 import argparse
 import socket
 import getpass
 import threading
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 STAGES = ["checkout", "install", "build", "test", "deploy"]
 
@@ -59,16 +64,67 @@ FINAL_MSG = {
     }
 }
 
-def generate_run(run_id: int, start_ts: datetime, anomaly_prob: float):
+ANOMALY_KINDS = ("error", "slow")
+
+
+@lru_cache(maxsize=None)
+def _identity():
+    # Host and user do not change during a run of the generator
+    return socket.gethostname(), getpass.getuser()
+
+
+def _wait(rng, lo: float, hi: float, long_tail: bool) -> float:
+    """Seconds between two log lines: uniform in [lo, hi] or, with
+    ``long_tail``, log-normal with the same median and a heavy right tail."""
+    if not long_tail:
+        return rng.uniform(lo, hi)
+    return max(lo / 2, rng.lognormvariate(math.log((lo + hi) / 2), 0.8))
+
+
+def parse_anomaly_mix(spec: str):
+    """``"error=0.7,slow=0.3"`` -> normalized ``{"error": 0.7, "slow": 0.3}``."""
+    mix = {}
+    for item in spec.split(","):
+        kind, _, weight = item.partition("=")
+        kind = kind.strip()
+        if kind not in ANOMALY_KINDS:
+            raise ValueError(f"неизвестный тип аномалии '{kind}' (допустимы: {', '.join(ANOMALY_KINDS)})")
+        mix[kind] = float(weight) if weight else 1.0
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError("сумма весов аномалий должна быть больше нуля")
+    return {k: w / total for k, w in mix.items()}
+
+
+def _anomaly_kind(rng, mix) -> str:
+    if len(mix) == 1:
+        return next(iter(mix))
+    x, acc = rng.random(), 0.0
+    for kind, w in mix.items():
+        acc += w
+        if x < acc:
+            return kind
+    return kind
+
+
+def generate_run(run_id: int, start_ts: datetime, anomaly_prob: float,
+                 rng=random, long_tail: bool = False, anomaly_mix=None):
+    """Records of one pipeline run.
+
+    Anomalies are ``error`` (failed stage, ERROR status) or ``slow`` (the
+    stage succeeds but takes 8-20x longer), drawn by ``anomaly_mix``
+    (default: errors only).
+    """
+    mix = anomaly_mix or {"error": 1.0}
     records = []
     ts = start_ts
-    host = socket.gethostname()
-    user = getpass.getuser()
+    host, user = _identity()
     pid = os.getpid()
     thread = threading.get_ident()
 
     for stage in STAGES:
         # 1) Старт этапа
+        prev_ts = ts
         records.append({
             "run_id": run_id,
             "timestamp": ts.isoformat(),
@@ -82,12 +138,13 @@ def generate_run(run_id: int, start_ts: datetime, anomaly_prob: float):
             "label": 0
         })
 
-        ts += timedelta(seconds=random.uniform(1, 5))
+        ts += timedelta(seconds=_wait(rng, 1, 5, long_tail))
 
         # 2) 0–2 промежуточных лога
-        for _ in range(random.randint(0, 2)):
-            ts += timedelta(seconds=random.uniform(1, 10))
-            msg = random.choice(INTERMEDIATE[stage])
+        for _ in range(rng.randint(0, 2)):
+            ts += timedelta(seconds=_wait(rng, 1, 10, long_tail))
+            prev_ts = ts
+            msg = rng.choice(INTERMEDIATE[stage])
             records.append({
                 "run_id": run_id,
                 "timestamp": ts.isoformat(),
@@ -101,12 +158,15 @@ def generate_run(run_id: int, start_ts: datetime, anomaly_prob: float):
                 "label": 0
             })
 
-        # 3) Финал этапа
-        ts += timedelta(seconds=random.uniform(5, 30))
-        is_anomaly = random.random() < anomaly_prob
-        status = "ERROR" if is_anomaly else "INFO"
-        # рассчитаем длительность этого этапа
-        duration = (ts - datetime.fromisoformat(records[-1]["timestamp"])).total_seconds()
+        # 3) Финал этапа; его длительность — время от предыдущей записи
+        wait = _wait(rng, 5, 30, long_tail)
+        is_anomaly = rng.random() < anomaly_prob
+        kind = _anomaly_kind(rng, mix) if is_anomaly else None
+        if kind == "slow":
+            wait *= rng.uniform(8, 20)
+        ts += timedelta(seconds=wait)
+        duration = (ts - prev_ts).total_seconds()
+        status = "ERROR" if kind == "error" else "INFO"
 
         msg_template = FINAL_MSG[status][stage]
         msg = msg_template.format(duration_sec=duration)
@@ -126,30 +186,153 @@ def generate_run(run_id: int, start_ts: datetime, anomaly_prob: float):
         })
 
         # Немного отложим старт следующего прогона
-        ts += timedelta(seconds=random.uniform(1, 3))
+        ts += timedelta(seconds=rng.uniform(1, 3))
 
     return records
 
+
+def _shard_runs(shard: dict):
+    """Runs of one shard with its own seeded RNG, so the output does not
+    depend on how shards are spread over workers."""
+    seed = shard["seed"]
+    rng = random.Random(seed * 1_000_003 + shard["index"]) if seed is not None else random.Random()
+    ts = shard["start"]
+    for run_id in range(shard["first_run"], shard["last_run"] + 1):
+        yield generate_run(run_id, ts, shard["anomaly_prob"], rng, shard["long_tail"], shard["mix"])
+        # сдвиг начала следующего прогона на 5–10 минут
+        ts += timedelta(minutes=rng.uniform(5, 10))
+
+
+def _chunks(runs, chunk_records: int):
+    buf = []
+    for recs in runs:
+        buf += recs
+        if len(buf) >= chunk_records:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+def _import_corpus():
+    # corpus.py lives in the repository root, next to this directory
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    import corpus
+    return corpus
+
+
+def write_shard(shard: dict):
+    """Generate one shard into its output file(s); returns (runs, records)."""
+    fmt, out = shard["format"], shard["output"]
+    runs = shard["last_run"] - shard["first_run"] + 1
+    n = 0
+    if fmt == "json":
+        for recs in _shard_runs(shard):
+            fname = os.path.join(out, f"run_{recs[0]['run_id']:03d}.json")
+            with open(fname, "w", encoding="utf-8") as f:
+                json.dump(recs, f, indent=2, ensure_ascii=False)
+            n += len(recs)
+    elif fmt == "jsonl":
+        path = os.path.join(out, shard["name"])
+        with open(path + ".tmp", "w", encoding="utf-8", buffering=1 << 20) as f:
+            for chunk in _chunks(_shard_runs(shard), shard["chunk_records"]):
+                f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in chunk))
+                n += len(chunk)
+        os.replace(path + ".tmp", path)
+    else:
+        import pandas as pd
+        corpus = _import_corpus()
+        frames = (
+            # isoformat() drops zero microseconds, so formats vary within a chunk
+            pd.DataFrame(chunk).assign(timestamp=lambda d: pd.to_datetime(d["timestamp"], format="ISO8601"))
+            for chunk in _chunks(_shard_runs(shard), shard["chunk_records"])
+        )
+        n = corpus.write_part(frames, os.path.join(out, shard["name"]))
+    return runs, n
+
+
+def plan_shards(args, start: datetime, mix, part_offset: int = 0):
+    shards = []
+    for index, first in enumerate(range(1, args.runs + 1, args.shard_runs)):
+        last = min(first + args.shard_runs - 1, args.runs)
+        name = {
+            "jsonl": f"runs-{index:05d}.jsonl",
+            "parquet": f"part-{part_offset + index:05d}.parquet",
+        }.get(args.format)
+        shards.append({
+            "index": index, "name": name, "first_run": first, "last_run": last,
+            # shards start where the previous one ends on average (7.5 min per run)
+            "start": start + timedelta(minutes=7.5 * (first - 1)),
+            "seed": args.seed, "anomaly_prob": args.anomaly_prob, "long_tail": args.long_tail,
+            "mix": mix, "format": args.format, "output": args.output_dir,
+            "chunk_records": args.chunk_records,
+        })
+    return shards
+
+
 def main():
     parser = argparse.ArgumentParser(description="Генератор синтетических CI/CD логов")
     parser.add_argument("-o", "--output-dir", default="logs", help="куда сохранить файлы")
     parser.add_argument("-r", "--runs", type=int, default=100, help="количество прогонов")
     parser.add_argument("-p", "--anomaly-prob", type=float, default=0.05,
                         help="вероятность аномалии на этапе")
+    parser.add_argument("-f", "--format", choices=["json", "jsonl", "parquet"], default="json",
+                        help="json — файл run_XXX.json на прогон; jsonl — шарды по --shard-runs прогонов; "
+                             "parquet — Parquet-корпус (как corpus.py)")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="число процессов генерации (default=1)")
+    parser.add_argument("--shard-runs", type=int, default=100_000,
+                        help="прогонов в одном шарде (default=100000)")
+    parser.add_argument("--chunk-records", type=int, default=200_000,
+                        help="записей в одном буфере записи / row group (default=200000)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed для воспроизводимой генерации (у каждого шарда свой, производный)")
+    parser.add_argument("--start", default=None,
+                        help="время начала первого прогона, ISO 8601 (по умолчанию — сейчас)")
+    parser.add_argument("--long-tail", action="store_true",
+                        help="длительности шагов с тяжёлым хвостом (log-normal) вместо равномерных")
+    parser.add_argument("--anomaly-mix", default="error=1",
+                        help="доли типов аномалий, например error=0.7,slow=0.3 (default=error=1)")
     args = parser.parse_args()
 
+    try:
+        mix = parse_anomaly_mix(args.anomaly_mix)
+        start = datetime.fromisoformat(args.start) if args.start else datetime.now()
+    except ValueError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        sys.exit(1)
+
     os.makedirs(args.output_dir, exist_ok=True)
-    base_ts = datetime.now()
+    if args.format == "parquet":
+        corpus = _import_corpus()
+        try:
+            offset = corpus.next_part_index(args.output_dir)
+        except ValueError as e:
+            print(f"Ошибка: {e}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        offset = 0
+    shards = plan_shards(args, start, mix, offset)
 
-    for run_id in range(1, args.runs + 1):
-        recs = generate_run(run_id, base_ts, args.anomaly_prob)
-        fname = os.path.join(args.output_dir, f"run_{run_id:03d}.json")
-        with open(fname, "w", encoding="utf-8") as f:
-            json.dump(recs, f, indent=2, ensure_ascii=False)
-        # сдвиг начала следующего прогона на 5–10 минут
-        base_ts += timedelta(minutes=random.uniform(5, 10))
+    t0 = time.perf_counter()
+    workers = max(1, min(args.workers, len(shards)))
+    if workers == 1:
+        results = [write_shard(s) for s in shards]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(write_shard, shards))
+    if args.format == "parquet":
+        corpus.add_parts(args.output_dir, [s["name"] for s in shards])
+    elapsed = time.perf_counter() - t0
 
-    print(f"Сгенерировано {args.runs} файлов в '{args.output_dir}/'")
+    runs = sum(r for r, _ in results)
+    records = sum(n for _, n in results)
+    where = "файлов" if args.format == "json" else "шардов"
+    count = runs if args.format == "json" else len(shards)
+    print(f"Сгенерировано {runs} прогонов ({records} записей, {count} {where}) в '{args.output_dir}/' "
+          f"за {elapsed:.1f}s ({records / elapsed if elapsed > 0 else 0:.0f} записей/s)")
 
 if __name__ == "__main__":
     main()
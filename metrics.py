@@ -0,0 +1,209 @@
+"""Lightweight in-process metrics shared by the detector and the long-running modes.
+
+``registry`` collects timing spans, counters, gauges and size histograms from
+the hot path (a span costs two ``perf_counter`` calls and a short lock) and
+exports them as Prometheus text or JSON lines.
+"""
+
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Sequence
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+SIZE_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, float("inf"))
+
+PREFIX = "pipeguard"
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.total = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = min(bisect.bisect_left(self.buckets, value), len(self.buckets) - 1)
+        with self._lock:
+            self.counts[i] += 1
+            self.total += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket containing the q-th quantile."""
+        with self._lock:
+            target = q * self.total
+            seen = 0
+            for upper, n in zip(self.buckets, self.counts):
+                seen += n
+                if n and seen >= target:
+                    return upper
+            return 0.0
+
+    def merge_snapshot(self, snap: Dict[str, Any]):
+        with self._lock:
+            for i, n in enumerate(snap["buckets"].values()):
+                self.counts[i] += n
+            self.total += snap["count"]
+            self.sum += snap.get("sum", snap.get("sum_ms", 0.0))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "count": self.total,
+                "sum": round(self.sum, 3),
+                "buckets": {str(b): n for b, n in zip(self.buckets, self.counts)},
+            }
+
+
+class LatencyHistogram(Histogram):
+    """Histogram of durations in milliseconds."""
+
+    @property
+    def sum_ms(self) -> float:
+        return self.sum
+
+    def snapshot(self) -> Dict[str, Any]:
+        snap = super().snapshot()
+        snap["sum_ms"] = snap.pop("sum")
+        return snap
+
+
+class MetricsRegistry:
+    """Named spans (latency histograms, ms), counters, gauges and size histograms."""
+
+    def __init__(self):
+        self.started = time.time()
+        self._spans: Dict[str, LatencyHistogram] = {}
+        self._sizes: Dict[str, Histogram] = {}
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, table: Dict[str, Histogram], name: str, factory) -> Histogram:
+        h = table.get(name)
+        if h is None:
+            with self._lock:
+                h = table.setdefault(name, factory())
+        return h
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_ms(name, (time.perf_counter() - t0) * 1000)
+
+    def observe_ms(self, name: str, ms: float):
+        self._histogram(self._spans, name, LatencyHistogram).observe(ms)
+
+    def observe_size(self, name: str, value: float):
+        self._histogram(self._sizes, name, lambda: Histogram(SIZE_BUCKETS)).observe(value)
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+
+    def counter(self, name: str) -> float:
+        return self._counters.get(name, 0)
+
+    def span_histogram(self, name: str) -> Optional[LatencyHistogram]:
+        return self._spans.get(name)
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._sizes.clear()
+            self._counters.clear()
+            self._gauges.clear()
+            self.started = time.time()
+
+    def merge(self, snap: Dict[str, Any]):
+        """Add a snapshot taken in another process (e.g. a batch worker)."""
+        with self._lock:
+            for name, v in snap["counters"].items():
+                self._counters[name] = self._counters.get(name, 0) + v
+            self._gauges.update(snap["gauges"])
+        for name, h in snap["spans_ms"].items():
+            self._histogram(self._spans, name, LatencyHistogram).merge_snapshot(h)
+        for name, h in snap["sizes"].items():
+            self._histogram(self._sizes, name, lambda: Histogram(SIZE_BUCKETS)).merge_snapshot(h)
+
+    def drain(self) -> Dict[str, Any]:
+        """Snapshot and reset, for shipping deltas out of a worker process."""
+        snap = self.snapshot()
+        self.reset()
+        return snap
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            spans, sizes = dict(self._spans), dict(self._sizes)
+            counters, gauges = dict(self._counters), dict(self._gauges)
+        return {
+            "time": time.time(),
+            "uptime_s": round(time.time() - self.started, 3),
+            "counters": counters,
+            "gauges": gauges,
+            "spans_ms": {
+                name: dict(h.snapshot(), p50=h.quantile(0.5), p99=h.quantile(0.99))
+                for name, h in spans.items()
+            },
+            "sizes": {name: h.snapshot() for name, h in sizes.items()},
+        }
+
+    def to_prometheus(self) -> str:
+        snap = self.snapshot()
+        lines = []
+
+        def metric(name: str, kind: str, samples):
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        for name, v in sorted(snap["counters"].items()):
+            metric(f"{PREFIX}_{name}_total", "counter", [f"{PREFIX}_{name}_total {v}"])
+        for name, v in sorted(snap["gauges"].items()):
+            metric(f"{PREFIX}_{name}", "gauge", [f"{PREFIX}_{name} {v}"])
+        for table, suffix in ((snap["spans_ms"], "_ms"), (snap["sizes"], "")):
+            for name, h in sorted(table.items()):
+                full = f"{PREFIX}_{name}{suffix}"
+                samples, seen = [], 0
+                for le, n in h["buckets"].items():
+                    seen += n
+                    samples.append(f'{full}_bucket{{le="{"+Inf" if le == "inf" else le}"}} {seen}')
+                samples.append(f"{full}_sum {h.get('sum', h.get('sum_ms'))}")
+                samples.append(f"{full}_count {h['count']}")
+                metric(full, "histogram", samples)
+        metric(f"{PREFIX}_uptime_seconds", "gauge", [f"{PREFIX}_uptime_seconds {snap['uptime_s']}"])
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str, fmt: Optional[str] = None):
+        """Write a Prometheus text file (replaced atomically, for the node
+        exporter textfile collector) or append one JSON line to ``path``.
+        ``fmt`` defaults to ``jsonl`` for *.jsonl/*.json paths, else ``prometheus``."""
+        if fmt is None:
+            fmt = "jsonl" if path.endswith((".jsonl", ".json")) else "prometheus"
+        if fmt == "jsonl":
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.snapshot(), ensure_ascii=False) + "\n")
+            return
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
+
+
+registry = MetricsRegistry()
+span = registry.span
+incr = registry.incr
+observe_size = registry.observe_size
+set_gauge = registry.set_gauge
@@ -0,0 +1,154 @@
+"""Path-aware model cache with content hashing, LRU eviction and background
+hot reload."""
+
+import io
+import os
+import sys
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+import metrics
+
+
+class _Loaded(NamedTuple):
+    model: Any
+    size: int
+
+
+class _PathState(NamedTuple):
+    digest: str
+    stat: Tuple[int, int]
+    checked: float
+
+
+def _stat(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def _deserialize(path: str, data: bytes) -> Any:
+    if path.endswith(".npz"):
+        # Exported by train_model.py: NumPy-only engine, no sklearn unpickling
+        import compiled_model
+        return compiled_model.CompiledModel(io.BytesIO(data))
+    import joblib
+    return joblib.load(io.BytesIO(data))
+
+
+class ModelRegistry:
+    """Holds several models at once, keyed by path and content hash.
+
+    Files with identical content share one loaded model. Once a path is loaded,
+    changes on disk are noticed (at most every ``check_interval`` seconds) and
+    the new version is loaded in a background thread; until it is ready callers
+    keep getting the previous model. Least recently used models are evicted
+    when their total file size exceeds ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes: int = 1 << 30, check_interval: float = 2.0):
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self._models: "OrderedDict[str, _Loaded]" = OrderedDict()
+        self._paths: Dict[str, _PathState] = {}
+        self._reloading: set = set()
+        self._lock = threading.RLock()
+        self._watcher: Optional[threading.Thread] = None
+
+    def get(self, path: str) -> Any:
+        key = os.path.abspath(path)
+        with self._lock:
+            state = self._paths.get(key)
+            loaded = self._models.get(state.digest) if state else None
+            if loaded is not None:
+                self._models.move_to_end(state.digest)
+                if time.monotonic() - state.checked >= self.check_interval:
+                    self._check(key, state)
+                return loaded.model
+        # First load (or the model was evicted) has to block the caller
+        return self._load(key)
+
+    def _check(self, key: str, state: _PathState):
+        try:
+            current = _stat(key)
+        except OSError:
+            current = state.stat  # file briefly missing while being replaced
+        self._paths[key] = state._replace(checked=time.monotonic())
+        if current != state.stat and key not in self._reloading:
+            self._reloading.add(key)
+            threading.Thread(target=self._reload, args=(key,), name="model-reload", daemon=True).start()
+
+    def _reload(self, key: str):
+        try:
+            self._load(key)
+        except Exception as e:
+            print(f"Warning: не удалось перезагрузить модель {key}: {e}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._reloading.discard(key)
+
+    def _load(self, key: str) -> Any:
+        stat = _stat(key)
+        with open(key, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+
+        with self._lock:
+            loaded = self._models.get(digest)
+        if loaded is None:
+            start = time.perf_counter()
+            loaded = _Loaded(_deserialize(key, data), len(data))
+            metrics.registry.observe_ms("model_load", (time.perf_counter() - start) * 1000)
+            metrics.incr("model_loads")
+
+        with self._lock:
+            self._models[digest] = loaded
+            self._models.move_to_end(digest)
+            self._paths[key] = _PathState(digest, stat, time.monotonic())
+            self._drop_unreferenced()
+            self._evict()
+        return loaded.model
+
+    def _drop_unreferenced(self):
+        # A hot reload leaves the previous version without any path
+        live = {s.digest for s in self._paths.values()}
+        for digest in [d for d in self._models if d not in live]:
+            del self._models[digest]
+
+    def _evict(self):
+        total = sum(m.size for m in self._models.values())
+        while total > self.max_bytes and len(self._models) > 1:
+            digest, dropped = self._models.popitem(last=False)
+            total -= dropped.size
+            for key in [k for k, s in self._paths.items() if s.digest == digest]:
+                del self._paths[key]
+
+    def watch(self, interval: Optional[float] = None):
+        """Poll loaded paths in a background thread, so long-running processes
+        pick up a new model even between requests."""
+        if self._watcher is not None:
+            return
+        interval = interval or self.check_interval
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                with self._lock:
+                    for key, state in list(self._paths.items()):
+                        self._check(key, state)
+
+        self._watcher = threading.Thread(target=loop, name="model-watch", daemon=True)
+        self._watcher.start()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "models": len(self._models),
+                "bytes": sum(m.size for m in self._models.values()),
+                "paths": {k: s.digest[:12] for k, s in self._paths.items()},
+            }
+
+
+registry = ModelRegistry()
@@ -1,15 +1,36 @@
 import os
 import sys
-import joblib
+import json
+import time
+import atexit
+import asyncio
+import threading
+import hashlib
+import itertools
+import numpy as np
 import pandas as pd
 
-from typing import List, Dict, Any
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+
+import baseline_index
+import ingest
+import log_templates
+import metrics
+import model_registry
+import run_features
 
 _client: Any = None
 
 def _get_openai_client() -> Any:
     global _client
     if _client is None:
+        if os.getenv("PIPEGUARD_LLM_STUB"):
+            import llm_stub
+            _client = llm_stub.StubClient()
+            return _client
         from openai import OpenAI, OpenAIError
         key = os.getenv("OPENAI_API_KEY")
         if not key:
@@ -17,80 +38,562 @@ def _get_openai_client() -> Any:
         _client = OpenAI(api_key=key)
     return _client
 
-_model: Any = None
 def load_anomaly_model(path: str = "model.pkl") -> Any:
-    global _model
-    if _model is None:
-        if not os.path.isfile(path):
-            print(f"Ошибка: не найден файл модели по пути '{path}'", file=sys.stderr)
-            sys.exit(1)
-        _model = joblib.load(path)
-    return _model
+    """Model for ``path`` from the shared registry (loaded once, reloaded
+    in the background when the file changes)."""
+    try:
+        return model_registry.registry.get(path)
+    except FileNotFoundError:
+        print(f"Ошибка: не найден файл модели по пути '{path}'", file=sys.stderr)
+        sys.exit(1)
+
+FEATURE_COLUMNS = ["delta", "stage", "status", "message"]
+
+# kept here too: callers count records before scoring them
+n_records = ingest.n_records
+
+def prepare_frame(records: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Records as a frame sorted by (run_id, timestamp) with the ``delta`` feature."""
+    with metrics.span("detect_frame"):
+        df = pd.DataFrame(records)
+    with metrics.span("detect_parse_timestamps"):
+        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    with metrics.span("detect_sort_delta"):
+        df = df.sort_values(["run_id", "timestamp"])
+        df["delta"] = (
+            df.groupby("run_id")["timestamp"]
+              .diff()
+              .dt.total_seconds()
+              .fillna(0)
+        )
+    return df
+
+def model_input(df: pd.DataFrame, model: Any) -> pd.DataFrame:
+    """The columns ``model`` was trained on; models fitted with run/stage
+    features (train_model.py --run-features) carry their baseline."""
+    baseline = getattr(model, "stage_baseline_", None)
+    if baseline is None:
+        return df[FEATURE_COLUMNS]
+    df = run_features.add_line_features(df, baseline)
+    return df[FEATURE_COLUMNS + run_features.LINE_FEATURES]
+
+def _predict_proba(model: Any, X: pd.DataFrame) -> np.ndarray:
+    if hasattr(model, "steps"):
+        # sklearn Pipeline: time the feature transform (TF-IDF, one-hot,
+        # scaling) and the forest separately; same result as predict_proba
+        with metrics.span("detect_transform"):
+            Xt = model[:-1].transform(X)
+        with metrics.span("detect_inference"):
+            return model[-1].predict_proba(Xt)[:, 1]
+    # CompiledModel records the same two spans itself
+    return model.predict_proba(X)[:, 1]
+
+def predict_frame(
+    df: pd.DataFrame,
+    model: Any,
+    model_path: str = "model.pkl",
+    prefilter: bool = False
+) -> np.ndarray:
+    """Probabilities for the rows of a prepare_frame() frame, in frame order.
+
+    With ``prefilter`` and a baseline index next to ``model_path`` (written
+    by train_model.py), lines the index calls routine get probability 0 and
+    skip the model; otherwise every line gets the model's probability.
+    """
+    metrics.observe_size("detect_batch_records", len(df))
+    with metrics.span("detect_features"):
+        X = model_input(df, model)
+    index = baseline_index.load_for_model(model_path) if prefilter else None
+    if index is None:
+        return _predict_proba(model, X)
+
+    with metrics.span("detect_prefilter"):
+        routine = index.routine_mask(df)
+    probs = np.zeros(len(df))
+    if not routine.all():
+        probs[~routine] = _predict_proba(model, X[~routine])
+    metrics.incr("prefilter_lines", len(df))
+    metrics.incr("prefilter_skipped", int(routine.sum()))
+    return probs
+
+def _count_detection(n: int, n_anomalies: int, seconds: float):
+    metrics.registry.observe_ms("detect", seconds * 1000)
+    metrics.incr("records_scored", n)
+    metrics.incr("anomalies_found", n_anomalies)
+    if seconds > 0:
+        metrics.set_gauge("detect_records_per_second", n / seconds)
+
+# What scoring reads from the input; other columns are never touched
+SCORING_COLUMNS = ["run_id", "timestamp", "stage", "status", "message", "duration_sec"]
+
+def _is_arrow(data: Any) -> bool:
+    return hasattr(data, "column_names") and hasattr(data, "select")
+
+def _scoring_view(data: Any) -> pd.DataFrame:
+    """The SCORING_COLUMNS of ``data`` as a frame indexed by input position.
+
+    A DataFrame is not copied (pandas copy-on-write: the view is read
+    only); an Arrow table converts only these columns; a list of dicts is
+    the one input that has to be built into a frame.
+    """
+    if _is_arrow(data):
+        cols = [c for c in SCORING_COLUMNS if c in data.column_names]
+        return data.select(cols).to_pandas()
+    if isinstance(data, pd.DataFrame):
+        cols = [c for c in SCORING_COLUMNS if c in data.columns]
+        view = data[cols]
+        view.index = pd.RangeIndex(len(view))
+        return view
+    if isinstance(data, dict):
+        return pd.DataFrame({c: data[c] for c in SCORING_COLUMNS if c in data})
+    return pd.DataFrame(data)
+
+# Smaller inputs are scored in one block: a pool costs more than it saves
+PARALLEL_MIN_RECORDS = 10_000
+
+def partition_runs(df: pd.DataFrame, n: int) -> List[pd.DataFrame]:
+    """Split ``df`` into up to ``n`` frames by a hash of ``run_id``; every run
+    lands whole in one partition and rows keep their index."""
+    key = pd.util.hash_array(df["run_id"].astype(str).to_numpy()) % n
+    return [df[key == i] for i in range(n) if (key == i).any()]
+
+def _init_partition_worker(model_path: str):
+    # A forked worker starts with a copy of the parent's metrics
+    metrics.registry.reset()
+    load_anomaly_model(model_path)
+
+def _score_partition(part: pd.DataFrame, model: Any, model_path: str,
+                     prefilter: bool, ship_metrics: bool = False):
+    """``run_id``, parsed ``timestamp``, ``delta`` and ``anomaly_prob`` of
+    one partition, indexed by input position."""
+    df = prepare_frame(part)
+    model = model if model is not None else load_anomaly_model(model_path)
+    df["anomaly_prob"] = predict_frame(df, model, model_path, prefilter)
+    scored = df[["run_id", "timestamp", "delta", "anomaly_prob"]]
+    return scored, metrics.registry.drain() if ship_metrics else None
+
+# Pools outlive a call: starting workers (and loading the model in each)
+# costs more than scoring a typical partition
+_pools: Dict[tuple, Executor] = {}
+_pools_lock = threading.Lock()
+
+def _pool(executor: str, workers: int, model_path: str) -> Executor:
+    """The shared pool for (``executor``, ``workers``, ``model_path``),
+    started on first use."""
+    key = (executor, workers, model_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            if executor == "thread":
+                pool = ThreadPoolExecutor(workers, thread_name_prefix="score")
+            else:
+                # The model is loaded before the fork, so workers share its pages
+                load_anomaly_model(model_path)
+                pool = ProcessPoolExecutor(
+                    workers, initializer=_init_partition_worker, initargs=(model_path,)
+                )
+            _pools[key] = pool
+        return pool
+
+def shutdown_pools():
+    """Stop the scoring pools; the next parallel call starts new ones."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown()
+
+atexit.register(shutdown_pools)
+
+def _score_view(view: pd.DataFrame, model: Any, model_path: str, prefilter: bool,
+                workers: Optional[int], executor: str) -> pd.DataFrame:
+    """_score_partition over the whole view, hash-partitioned by ``run_id``
+    across a pool when ``workers`` > 1; rows come back in any order."""
+    if not (workers and workers > 1 and len(view) >= PARALLEL_MIN_RECORDS):
+        return _score_partition(view, model, model_path, prefilter)[0]
+
+    parts = partition_runs(view, workers)
+    # A model object passed in is pickled to each process worker
+    args = ([model] * len(parts), [model_path] * len(parts), [prefilter] * len(parts),
+            [executor != "thread"] * len(parts))
+    pool = _pool(executor, workers, model_path)
+    try:
+        results = list(pool.map(_score_partition, parts, *args))
+    except BrokenProcessPool:
+        # A dead worker breaks the whole pool: drop it so the next call starts afresh
+        with _pools_lock:
+            if _pools.get((executor, workers, model_path)) is pool:
+                del _pools[(executor, workers, model_path)]
+        raise
+    for _, snap in results:
+        if snap is not None:
+            metrics.registry.merge(snap)
+    return pd.concat([scored for scored, _ in results])
+
+def score_frame(
+    data: Any,
+    model: Any = None,
+    model_path: str = "model.pkl",
+    prefilter: bool = False,
+    workers: Optional[int] = None,
+    executor: str = "process"
+) -> pd.Series:
+    """Anomaly probability of every row of a DataFrame or Arrow table (or of
+    records / a mapping of columns), as an ``anomaly_prob`` Series in input
+    order and, for a DataFrame, with its index.
+
+    Only SCORING_COLUMNS are read and the input is neither copied nor
+    modified. ``workers`` > 1 scores run_id partitions in a ``"process"``
+    or ``"thread"`` pool; ``delta`` is per run, so the result is the same.
+    """
+    n = n_records(data) if not _is_arrow(data) else data.num_rows
+    if not n:
+        return pd.Series(np.empty(0), name="anomaly_prob")
+    probs = _score_view(_scoring_view(data), model, model_path, prefilter, workers, executor)
+    probs = probs["anomaly_prob"].sort_index()
+    if isinstance(data, pd.DataFrame):
+        probs.index = data.index
+    return probs
+
+def detect_frame(
+    data: Any,
+    threshold: float = 0.5,
+    model_path: str = "model.pkl",
+    prefilter: bool = False,
+    workers: Optional[int] = None,
+    executor: str = "process",
+    return_probs: bool = False
+) -> Any:
+    """Rows of ``data`` scored above ``threshold`` as a DataFrame ordered by
+    (run_id, timestamp), with parsed ``timestamp``, ``delta`` and
+    ``anomaly_prob``; only these rows are taken from the input.
+
+    With ``return_probs`` returns ``(anomalies, probs)`` with probs as in
+    score_frame (a NumPy array in input order).
+    """
+    n = n_records(data) if not _is_arrow(data) else data.num_rows
+    if not n:
+        empty = pd.DataFrame()
+        return (empty, np.empty(0)) if return_probs else empty
+
+    start = time.perf_counter()
+    scored = _score_view(_scoring_view(data), None, model_path, prefilter, workers, executor)
+    with metrics.span("detect_filter"):
+        # Input order first, then a stable (run_id, timestamp) sort: the
+        # same order however the rows were partitioned
+        flagged = scored[scored["anomaly_prob"] > threshold].sort_index()
+        flagged = flagged.sort_values(["run_id", "timestamp"], kind="stable")
+        pos = flagged.index.to_numpy()
+        if _is_arrow(data):
+            rows = data.take(pos).to_pandas()
+        elif isinstance(data, pd.DataFrame):
+            rows = data.iloc[pos]
+        elif isinstance(data, dict):
+            rows = pd.DataFrame({c: np.asarray(v)[pos] for c, v in data.items()})
+        else:
+            rows = pd.DataFrame([data[i] for i in pos])
+        anomalies = rows.assign(
+            timestamp=flagged["timestamp"].to_numpy(),
+            delta=flagged["delta"].to_numpy(),
+            anomaly_prob=flagged["anomaly_prob"].to_numpy(),
+        )
+    _count_detection(n, len(anomalies), time.perf_counter() - start)
+    if return_probs:
+        return anomalies, scored["anomaly_prob"].sort_index().to_numpy()
+    return anomalies
+
+def score_records(
+    records: List[Dict[str, Any]],
+    model: Any = None,
+    model_path: str = "model.pkl",
+    prefilter: bool = False
+) -> np.ndarray:
+    """Anomaly probability for every record, in input order."""
+    return score_frame(records, model, model_path, prefilter).to_numpy()
 
 def detect_anomalies(
     records: List[Dict[str, Any]],
-    threshold: float = 0.5
+    threshold: float = 0.5,
+    model_path: str = "model.pkl",
+    return_probs: bool = False,
+    prefilter: bool = False,
+    workers: Optional[int] = None,
+    executor: str = "process"
+) -> Any:
+    """Records scored above ``threshold``: detect_frame as a list of dicts.
+
+    With ``return_probs`` returns ``(anomalies, probs)``, where ``probs`` holds
+    the probability of every record in input order, so callers can attach it
+    to their own frame without matching anomalies back. ``prefilter``: see
+    predict_frame; ``workers``/``executor``: see score_frame.
+    """
+    result = detect_frame(records, threshold, model_path, prefilter, workers, executor, return_probs)
+    if return_probs:
+        return result[0].to_dict(orient="records"), result[1]
+    return result.to_dict(orient="records")
+
+
+def score_runs(
+    records: List[Dict[str, Any]],
+    model_path: str = "run_model.pkl"
 ) -> List[Dict[str, Any]]:
-    if not records:
+    """Run-level scores: one row per ``run_id`` with its aggregate features
+    and ``run_prob`` from the model trained by ``train_model.py --run-level``."""
+    if not n_records(records):
         return []
+    model = load_anomaly_model(model_path)
+    runs = model.score_runs(prepare_frame(records))
+    return runs.sort_values("run_prob", ascending=False).to_dict(orient="records")
 
-    df = pd.DataFrame(records)
-    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-    df = df.sort_values(["run_id", "timestamp"])
-    df["delta"] = (
-        df.groupby("run_id")["timestamp"]
-          .diff()
-          .dt.total_seconds()
-          .fillna(0)
-    )
 
-    X = df[["delta", "stage", "status", "message"]]
-    model = load_anomaly_model()
-    probs = model.predict_proba(X)[:, 1]
-    df["anomaly_prob"] = probs
+class StreamScorer:
+    """Scores records chunk by chunk, carrying each run's last timestamp
+    between chunks so ``delta`` matches a whole-file computation.
 
-    anomalies = df[df["anomaly_prob"] > threshold]
-    return anomalies.to_dict(orient="records")
+    Records of one run are expected in chronological order across chunks.
+    At most ``max_runs`` runs are remembered (least recently seen are dropped).
+    """
 
+    def __init__(
+        self,
+        threshold: float = 0.5,
+        model: Any = None,
+        max_runs: int = 100_000,
+        model_path: str = "model.pkl",
+        prefilter: bool = False
+    ):
+        self.threshold = threshold
+        self.model = model if model is not None else load_anomaly_model(model_path)
+        self.model_path = model_path
+        self.prefilter = prefilter
+        self.max_runs = max_runs
+        self._last_ts: "OrderedDict[Any, pd.Timestamp]" = OrderedDict()
 
-def describe_anomalies(
-    anomalies: List[Dict[str, Any]],
-    max_tokens: int = 256
-) -> str:
-    if not anomalies:
-        return "Аномалий не обнаружено."
- 
-    client = _get_openai_client()
+    def score(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not records:
+            return []
+
+        start = time.perf_counter()
+        df = pd.DataFrame(records)
+        with metrics.span("detect_parse_timestamps"):
+            df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+        df = df.sort_values(["run_id", "timestamp"], kind="stable")
+        delta = df.groupby("run_id")["timestamp"].diff().dt.total_seconds()
+        first = df.loc[df.groupby("run_id").cumcount() == 0, ["run_id", "timestamp"]]
+        for idx, run_id, ts in zip(first.index, first["run_id"], first["timestamp"]):
+            last = self._last_ts.get(run_id)
+            if last is not None and pd.notna(ts):
+                delta.loc[idx] = (ts - last).total_seconds()
+        df["delta"] = delta.fillna(0)
+
+        for run_id, ts in df.groupby("run_id")["timestamp"].last().items():
+            self._last_ts[run_id] = ts
+            self._last_ts.move_to_end(run_id)
+        while len(self._last_ts) > self.max_runs:
+            self._last_ts.popitem(last=False)
 
-    details = "\n".join(
-        f"- [P={a['anomaly_prob']:.2f}] run {a['run_id']}, "
-        f"stage='{a['stage']}', status={a['status']}, "
-        f"time={a['timestamp']}, msg=\"{a['message']}\""
-        for a in anomalies
+        # Stage/run aggregates (if the model uses them) only see this chunk
+        df["anomaly_prob"] = predict_frame(df, self.model, self.model_path, self.prefilter)
+        with metrics.span("detect_filter"):
+            anomalies = df[df["anomaly_prob"] > self.threshold].to_dict(orient="records")
+        _count_detection(len(df), len(anomalies), time.perf_counter() - start)
+        return anomalies
+
+
+def detect_anomalies_stream(
+    records: Iterable[Dict[str, Any]],
+    threshold: float = 0.5,
+    chunk_size: int = 10_000,
+    model_path: str = "model.pkl",
+    prefilter: bool = False
+) -> Iterator[Dict[str, Any]]:
+    """Like detect_anomalies, but consumes ``records`` lazily in chunks of
+    ``chunk_size`` and yields anomalies as soon as their chunk is scored."""
+    scorer = StreamScorer(threshold=threshold, model_path=model_path, prefilter=prefilter)
+    it = iter(records)
+    while True:
+        chunk = list(itertools.islice(it, chunk_size))
+        if not chunk:
+            return
+        yield from scorer.score(chunk)
+
+
+LLM_MODEL = "gpt-3.5-turbo"
+LLM_CACHE_DIR = ".llm_cache"
+_PROMPT_HEAD = "Ты — ассистент по анализу CI/CD-логов. "
+_PROMPT_TAIL = (
+    "Составь краткий обзор (2–3 предложения), указав наиболее вероятные причины "
+    "и рекомендации по устранению."
+)
+
+def group_anomalies(anomalies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Collapse anomalies into (stage, status, message template) groups,
+    most probable first."""
+    groups: Dict[Any, Dict[str, Any]] = {}
+    for a in anomalies:
+        key = (str(a["stage"]), str(a["status"]), log_templates.message_template(a["message"]))
+        g = groups.get(key)
+        if g is None:
+            g = groups[key] = {
+                "stage": key[0], "status": key[1], "template": key[2],
+                "count": 0, "max_prob": 0.0, "runs": [], "first": None, "last": None,
+                "example": a["message"],
+            }
+        g["count"] += 1
+        g["max_prob"] = max(g["max_prob"], float(a["anomaly_prob"]))
+        if len(g["runs"]) < 5 and a["run_id"] not in g["runs"]:
+            g["runs"].append(a["run_id"])
+        ts = str(a["timestamp"])
+        g["first"] = ts if g["first"] is None else min(g["first"], ts)
+        g["last"] = ts if g["last"] is None else max(g["last"], ts)
+    return sorted(groups.values(), key=lambda g: (-g["max_prob"], -g["count"]))
+
+def _group_line(g: Dict[str, Any]) -> str:
+    runs = ", ".join(str(r) for r in g["runs"]) + ("…" if g["count"] > len(g["runs"]) else "")
+    return (
+        f"- [P≤{g['max_prob']:.2f}, ×{g['count']}] stage='{g['stage']}', status={g['status']}, "
+        f"шаблон=\"{g['template']}\", пример=\"{g['example']}\", runs: {runs}, "
+        f"time={g['first']}…{g['last']}"
     )
 
-    prompt = (
-        "Ты — ассистент по анализу CI/CD-логов. Ниже список потенциальных аномалий с их вероятностями:\n\n"
-        f"{details}\n\n"
-        "Составь краткий обзор (2–3 предложения), указав наиболее вероятные причины и рекомендации по устранению."
+def _pack_prompts(lines: List[str], max_chars: int) -> List[str]:
+    prompts, current, size = [], [], 0
+    for line in lines:
+        line = line[:max_chars]
+        if current and size + len(line) > max_chars:
+            prompts.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        prompts.append("\n".join(current))
+    return prompts
+
+def _anomalies_digest(groups: List[Dict[str, Any]], max_tokens: int) -> str:
+    # Keyed by failure pattern, not by run ids or times, so a repeated
+    # failure of the same kind is answered from the cache
+    key = [LLM_MODEL, max_tokens] + sorted(
+        [g["stage"], g["status"], g["template"], round(g["max_prob"], 1)] for g in groups
     )
+    return hashlib.sha256(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()
 
-    try:
+def _complete(client: Any, prompt: str, max_tokens: int) -> str:
+    with metrics.span("llm_call"):
         resp = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+            model=LLM_MODEL,
             messages=[{"role": "user", "content": prompt}],
             max_tokens=max_tokens,
             temperature=0.7,
         )
+    metrics.incr("llm_calls")
+    usage = getattr(resp, "usage", None)
+    if usage is not None:
+        metrics.incr("llm_prompt_tokens", usage.prompt_tokens or 0)
+        metrics.incr("llm_completion_tokens", usage.completion_tokens or 0)
+    return resp.choices[0].message.content.strip()
+
+_PART_HEAD = (
+    "Ниже часть сгруппированного списка потенциальных аномалий "
+    "(вероятность, число повторов, шаблон сообщения):"
+)
+_PARTIALS_HEAD = "Ниже часть частичных обзоров аномалий одного прогона пайплайна:"
+
+async def _summarize_parts(client: Any, parts: List[str], max_tokens: int, concurrency: int,
+                           head: str = _PART_HEAD) -> List[str]:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(part: str) -> str:
+        prompt = (
+            _PROMPT_HEAD + head + "\n\n"
+            f"{part}\n\n"
+            "Кратко (2–3 предложения) опиши, что пошло не так в этой части."
+        )
+        async with sem:
+            return await asyncio.to_thread(_complete, client, prompt, max_tokens)
+
+    return await asyncio.gather(*(one(p) for p in parts))
+
+def _run_async(coro: Any) -> Any:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    # Called from inside an event loop: run ours on a helper thread
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        return ex.submit(asyncio.run, coro).result()
+
+def describe_anomalies(
+    anomalies: List[Dict[str, Any]],
+    max_tokens: int = 256,
+    max_prompt_chars: int = 6000,
+    concurrency: int = 4,
+    cache_dir: Optional[str] = LLM_CACHE_DIR
+) -> str:
+    """Summarize anomalies with the LLM.
+
+    Anomalies are grouped by stage and message template; if the groups do not
+    fit into one prompt of ``max_prompt_chars``, parts are summarized
+    concurrently and the partial summaries are merged the same way, level by
+    level, until they fit into one final call.
+    Summaries are cached in ``cache_dir`` by a digest of the groups.
+    """
+    if not anomalies:
+        return "Аномалий не обнаружено."
+
+    groups = group_anomalies(anomalies)
+    digest = _anomalies_digest(groups, max_tokens)
+    cache_path = os.path.join(cache_dir, f"{digest}.txt") if cache_dir else None
+    if cache_path and os.path.isfile(cache_path):
+        metrics.incr("llm_cache_hits")
+        with open(cache_path, encoding="utf-8") as f:
+            return f.read()
+
+    client = _get_openai_client()
+    parts = _pack_prompts([_group_line(g) for g in groups], max_prompt_chars)
+
+    start = time.perf_counter()
+    try:
+        if len(parts) == 1:
+            prompt = (
+                _PROMPT_HEAD + "Ниже сгруппированный список потенциальных аномалий "
+                "(вероятность, число повторов, шаблон сообщения):\n\n"
+                f"{parts[0]}\n\n" + _PROMPT_TAIL
+            )
+            summary = _complete(client, prompt, max_tokens)
+        else:
+            partial = _run_async(_summarize_parts(client, parts, max_tokens, concurrency))
+            while True:
+                # At most half a prompt per summary, so every level at least halves them
+                merged = _pack_prompts([f"- {p}"[:(max_prompt_chars - 1) // 2] for p in partial], max_prompt_chars)
+                if len(merged) == 1:
+                    break
+                partial = _run_async(_summarize_parts(
+                    client, merged, max_tokens, concurrency, head=_PARTIALS_HEAD
+                ))
+            merged = merged[0]
+            prompt = (
+                _PROMPT_HEAD + "Ниже частичные обзоры аномалий одного прогона пайплайна:\n\n"
+                f"{merged}\n\n" + _PROMPT_TAIL
+            )
+            summary = _complete(client, prompt, max_tokens)
     except Exception as e:
+        metrics.incr("llm_errors")
         return f"Ошибка при запросе к OpenAI: {e}"
+    metrics.registry.observe_ms("describe", (time.perf_counter() - start) * 1000)
 
-    return resp.choices[0].message.content.strip()
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = cache_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(summary)
+        os.replace(tmp, cache_path)
+    return summary
 
 def detect_and_describe(
     records: List[Dict[str, Any]],
     threshold: float = 0.5,
-    max_tokens: int = 256
+    max_tokens: int = 256,
+    model_path: str = "model.pkl"
 ) -> str:
-    ann = detect_anomalies(records, threshold=threshold)
+    ann = detect_anomalies(records, threshold=threshold, model_path=model_path)
     return describe_anomalies(ann, max_tokens=max_tokens)
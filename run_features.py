@@ -0,0 +1,118 @@
+"""Run- and stage-level aggregate features.
+
+All features are computed with grouped vectorized operations over a frame
+that already has ``delta`` (see ``openai_utils.prepare_frame`` and
+``train_model.prepare_features``), so training and detection share one code
+path. ``delta`` and stage durations are compared with per-stage percentiles
+from the training corpus (the "baseline").
+"""
+
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Added to every line, usable by the line-level model
+LINE_FEATURES = [
+    "stage_duration",
+    "stage_lines",
+    "run_error_ratio",
+    "delta_vs_p95",
+    "duration_vs_p95",
+]
+
+# One row per run, used by the run-level model
+RUN_FEATURES = [
+    "run_lines",
+    "run_stages",
+    "run_duration",
+    "run_error_ratio",
+    "max_delta_vs_p95",
+    "max_duration_vs_p95",
+    "lines_over_p99",
+]
+
+
+def _stage_durations(df: pd.DataFrame) -> pd.Series:
+    by_stage = df.groupby(["run_id", "stage"], sort=False, observed=True)["timestamp"]
+    return (by_stage.transform("max") - by_stage.transform("min")).dt.total_seconds().fillna(0)
+
+
+def fit_baseline(df: pd.DataFrame) -> Dict[str, Any]:
+    """Per-stage percentiles of ``delta`` and stage duration; anomalous rows
+    are left out when the frame has labels."""
+    frame = df.assign(stage_duration=_stage_durations(df))
+    if "label" in frame:
+        frame = frame[frame["label"] == 0]
+    q = list(QUANTILES)
+
+    def summary(part: pd.DataFrame) -> Dict[str, list]:
+        return {
+            "delta": part["delta"].quantile(q).tolist(),
+            "duration": part["stage_duration"].quantile(q).tolist(),
+        }
+
+    return {
+        "quantiles": q,
+        "stages": {str(stage): summary(part) for stage, part in frame.groupby("stage", observed=True)},
+        "global": summary(frame),
+    }
+
+
+def _per_stage(df: pd.DataFrame, baseline: Dict[str, Any], field: str, qi: int) -> np.ndarray:
+    fallback = baseline["global"][field][qi]
+    table = {stage: v[field][qi] for stage, v in baseline["stages"].items()}
+    values = df["stage"].astype(str).map(table).fillna(fallback).to_numpy(dtype=np.float64)
+    return np.maximum(values, 1e-9)
+
+
+def add_line_features(df: pd.DataFrame, baseline: Dict[str, Any]) -> pd.DataFrame:
+    """Return ``df`` with LINE_FEATURES added (index and row order preserved)."""
+    is_error = (df["status"].astype(str) == "ERROR").astype(np.float64)
+    by_stage = df.groupby(["run_id", "stage"], sort=False, observed=True)
+    stage_duration = _stage_durations(df)
+    p95 = QUANTILES.index(0.95)
+    return df.assign(
+        stage_duration=stage_duration,
+        stage_lines=by_stage["run_id"].transform("size").astype(np.float64),
+        run_error_ratio=is_error.groupby(df["run_id"], sort=False).transform("mean"),
+        delta_vs_p95=df["delta"].to_numpy(dtype=np.float64) / _per_stage(df, baseline, "delta", p95),
+        duration_vs_p95=stage_duration.to_numpy() / _per_stage(df, baseline, "duration", p95),
+    )
+
+
+def run_table(df: pd.DataFrame, baseline: Dict[str, Any]) -> pd.DataFrame:
+    """Aggregate lines into one row per run with RUN_FEATURES (and ``label``,
+    1 if any line of the run is labelled, when the frame has labels)."""
+    lines = df if "delta_vs_p95" in df else add_line_features(df, baseline)
+    p99 = QUANTILES.index(0.99)
+    over = lines["delta"].to_numpy(dtype=np.float64) > _per_stage(lines, baseline, "delta", p99)
+    lines = lines.assign(_over=over, _one=1)
+    g = lines.groupby("run_id", sort=False)
+    runs = pd.DataFrame({
+        "run_lines": g["_one"].sum().astype(np.float64),
+        "run_stages": g["stage"].nunique().astype(np.float64),
+        "run_duration": (g["timestamp"].max() - g["timestamp"].min()).dt.total_seconds().fillna(0),
+        "run_error_ratio": g["run_error_ratio"].first(),
+        "max_delta_vs_p95": g["delta_vs_p95"].max(),
+        "max_duration_vs_p95": g["duration_vs_p95"].max(),
+        "lines_over_p99": g["_over"].sum().astype(np.float64),
+    })
+    if "label" in lines:
+        runs["label"] = g["label"].max().astype(int)
+    return runs.reset_index()
+
+
+class RunLevelModel:
+    """Classifier over RUN_FEATURES together with the baseline it was fitted with."""
+
+    def __init__(self, clf: Any, baseline: Dict[str, Any]):
+        self.clf = clf
+        self.baseline = baseline
+
+    def score_runs(self, df: pd.DataFrame) -> pd.DataFrame:
+        runs = run_table(df, self.baseline)
+        runs["run_prob"] = self.clf.predict_proba(runs[RUN_FEATURES])[:, 1] if len(runs) else []
+        return runs
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# server.py
+"""Long-running scoring daemon: keeps the model loaded and serves
+probabilities over HTTP (TCP or Unix socket)."""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import http.client
+import socketserver
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlparse
+
+import metrics
+import model_registry
+from batching import MicroBatcher
+from metrics import LatencyHistogram
+
+
+# Fields prepare_frame and the model read from every record
+REQUIRED_FIELDS = ("run_id", "timestamp", "stage", "status", "message")
+# ... of which the text features need strings
+STRING_FIELDS = ("stage", "status", "message")
+
+
+def _is_timestamp(value: Any) -> bool:
+    if not isinstance(value, str):
+        return False
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def validate_records(records: Any):
+    """Raise ValueError describing the first record the model cannot score."""
+    if not isinstance(records, list):
+        raise ValueError("'records' must be a list")
+    for i, rec in enumerate(records):
+        if not isinstance(rec, dict):
+            raise ValueError(f"record {i} is not an object")
+        missing = [f for f in REQUIRED_FIELDS if f not in rec]
+        if missing:
+            raise ValueError(f"record {i} is missing {', '.join(missing)}")
+        for f in STRING_FIELDS:
+            if not isinstance(rec[f], str):
+                raise ValueError(f"record {i}: '{f}' must be a string")
+        if not _is_timestamp(rec["timestamp"]):
+            raise ValueError(f"record {i}: 'timestamp' must be an ISO 8601 string")
+
+
+def parse_payload(body: bytes) -> List[Dict[str, Any]]:
+    """Records of a /score request body; ValueError if it is not
+    ``{"records": [...]}`` with records the model can score."""
+    payload = json.loads(body)
+    if not isinstance(payload, dict) or "records" not in payload:
+        raise ValueError('body must be a JSON object {"records": [...]}')
+    validate_records(payload["records"])
+    return payload["records"]
+
+
+class ScoringService:
+    """Scores incoming batches through a MicroBatcher, so concurrent
+    requests share one ``predict_proba`` call."""
+
+    def __init__(
+        self,
+        model_path: str,
+        workers: int = 2,
+        max_batch: int = 100_000,
+        window_ms: float = 5.0,
+        batch_size: int = 8192,
+        prefilter: bool = False,
+    ):
+        self.model_path = model_path
+        self.max_batch = max_batch
+        self.batcher = MicroBatcher(
+            window_ms=window_ms, max_batch=batch_size, workers=workers, model_path=model_path,
+            prefilter=prefilter,
+        )
+        # Pick up a retrained model file without restarting the server
+        model_registry.registry.watch()
+        self.latency = LatencyHistogram()
+        self.records_scored = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def score(self, records: List[Dict[str, Any]]) -> List[float]:
+        start = time.perf_counter()
+        probs = self.batcher.score(records)
+        self.latency.observe((time.perf_counter() - start) * 1000)
+        with self._lock:
+            self.requests += 1
+            self.records_scored += len(records)
+        return probs.tolist()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_path,
+            "requests": self.requests,
+            "records_scored": self.records_scored,
+            "latency_ms": self.latency.snapshot(),
+            "p50_ms": self.latency.quantile(0.5),
+            "p99_ms": self.latency.quantile(0.99),
+            "batching": self.batcher.stats(),
+            "models": model_registry.registry.stats(),
+            "pipeline": metrics.registry.snapshot(),
+        }
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    service: ScoringService = None
+
+    def _send_json(self, code: int, payload: Dict[str, Any]):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, code: int, text: str):
+        body = text.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/healthz":
+            self._send_json(200, {"status": "ok"})
+        elif url.path == "/metrics":
+            if parse_qs(url.query).get("format") == ["prometheus"]:
+                self._send_text(200, metrics.registry.to_prometheus())
+            else:
+                self._send_json(200, self.service.metrics())
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/score":
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            records = parse_payload(self.rfile.read(length))
+        except ValueError as e:
+            self._send_json(400, {"error": f"bad request: {e}"})
+            return
+        if len(records) > self.service.max_batch:
+            self._send_json(413, {"error": f"batch larger than {self.service.max_batch} records"})
+            return
+        try:
+            probs = self.service.score(records)
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, {"probabilities": probs})
+
+    def address_string(self) -> str:
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        pass
+
+
+# The default listen backlog of 5 refuses bursts of concurrent clients
+LISTEN_BACKLOG = 128
+
+
+class ScoringHTTPServer(ThreadingHTTPServer):
+    request_queue_size = LISTEN_BACKLOG
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+        self.server_name, self.server_port = "localhost", 0
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def score_remote(records: List[Dict[str, Any]], url: str, timeout: float = 60.0) -> List[float]:
+    """Send records to a running server (``http://host:port`` or
+    ``unix:///path/to.sock``) and return probabilities in input order."""
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        conn = _UnixHTTPConnection(parsed.path, timeout)
+    elif parsed.scheme == "http":
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+    else:
+        raise ValueError(f"Unsupported server URL: {url}")
+
+    body = json.dumps({"records": records}, ensure_ascii=False, default=str).encode("utf-8")
+    try:
+        conn.request("POST", "/score", body=body, headers={"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        payload = json.loads(resp.read())
+    finally:
+        conn.close()
+    if resp.status != 200:
+        raise RuntimeError(f"server error {resp.status}: {payload.get('error')}")
+    return payload["probabilities"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Сервер оценки аномалий: держит модель в памяти и отвечает по HTTP"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="адрес (default=127.0.0.1)")
+    parser.add_argument("--port", "-p", type=int, default=8765, help="порт (default=8765)")
+    parser.add_argument("--unix-socket", "-u", default=None,
+                        help="слушать Unix-сокет вместо TCP")
+    parser.add_argument("--model", "-m", default="model.pkl",
+                        help="путь к файлу модели (default=model.pkl)")
+    parser.add_argument("--workers", "-w", type=int, default=2,
+                        help="число потоков оценки (default=2)")
+    parser.add_argument("--batch-window-ms", type=float, default=5.0,
+                        help="сколько ждать попутных запросов перед оценкой, мс (default=5)")
+    parser.add_argument("--batch-size", type=int, default=8192,
+                        help="максимум записей в одном вызове модели (default=8192)")
+    parser.add_argument("--max-batch", type=int, default=100_000,
+                        help="максимум записей в одном запросе (default=100000)")
+    parser.add_argument("--prefilter", action="store_true",
+                        help="не оценивать моделью строки, типовые по baseline-индексу рядом с моделью "
+                             "(их вероятность — 0)")
+    args = parser.parse_args()
+
+    ScoringHandler.service = ScoringService(
+        args.model,
+        workers=args.workers,
+        max_batch=args.max_batch,
+        window_ms=args.batch_window_ms,
+        batch_size=args.batch_size,
+        prefilter=args.prefilter,
+    )
+    if args.unix_socket:
+        httpd = ThreadingUnixHTTPServer(args.unix_socket, ScoringHandler)
+        where = f"unix://{args.unix_socket}"
+    else:
+        httpd = ScoringHTTPServer((args.host, args.port), ScoringHandler)
+        where = f"http://{args.host}:{args.port}"
+
+    print(f"Serving model '{args.model}' on {where}", file=sys.stderr)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.unlink(args.unix_socket)
+
+
+if __name__ == "__main__":
+    main()
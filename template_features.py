@@ -0,0 +1,49 @@
+"""Template-ID text features: a cheap alternative to TF-IDF over ``message``.
+
+Used by ``train_model.build_pipeline(text_features="templates")``; the
+fitted template table is pickled with the model (and exported into the
+compiled .npz), so detection maps each message to its template with a
+dictionary lookup instead of tokenizing it.
+"""
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.base import BaseEstimator, TransformerMixin
+
+import log_templates
+
+
+class TemplateEncoder(BaseEstimator, TransformerMixin):
+    """One-hot encoding of the mined template ID of a message column.
+
+    Templates are mined in ``fit``; messages that match none of them at
+    detection time get an all-zero row, like OneHotEncoder's
+    ``handle_unknown="ignore"``.
+    """
+
+    def __init__(self, depth: int = 2, similarity: float = 0.5):
+        self.depth = depth
+        self.similarity = similarity
+
+    def fit(self, X, y=None):
+        self.miner_ = log_templates.TemplateMiner(self.depth, self.similarity)
+        for message in _column(X):
+            self.miner_.add(message)
+        self.n_templates_ = len(self.miner_)
+        return self
+
+    def transform(self, X):
+        ids = [self.miner_.match(m) for m in _column(X)]
+        rows = [i for i, t in enumerate(ids) if t is not None and t < self.n_templates_]
+        cols = [ids[i] for i in rows]
+        return sp.csr_matrix(
+            (np.ones(len(rows)), (rows, cols)), shape=(len(ids), self.n_templates_)
+        )
+
+    def get_feature_names_out(self, input_features=None):
+        return np.array([f"template_{i}" for i in range(self.n_templates_)], dtype=object)
+
+
+def _column(X):
+    # ColumnTransformer passes a Series for a string column spec
+    return X.iloc[:, 0] if getattr(X, "ndim", 1) == 2 else X
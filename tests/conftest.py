@@ -0,0 +1,66 @@
+import os
+import sys
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import random
+from datetime import datetime, timedelta
+
+import joblib
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs_extractor"))
+
+
+@pytest.fixture(scope="session")
+def records():
+    """Seeded generate_logs runs with a few anomalies."""
+    import generate_logs
+
+    rng = random.Random(7)
+    ts, out = datetime(2025, 1, 1, 0, 0, 0, 500_000), []
+    for run_id in range(1, 61):
+        out += generate_logs.generate_run(run_id, ts, 0.3, rng=rng)
+        ts += timedelta(minutes=10)
+    return out
+
+
+@pytest.fixture(scope="session")
+def model_path(records, tmp_path_factory):
+    """A small pipeline from train_model.build_pipeline, saved as model.pkl."""
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+
+    import train_model
+
+    df = pd.DataFrame(records)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601")
+    X, y = train_model.prepare_features(df)
+    pipe = train_model.build_pipeline(clf=RandomForestClassifier(n_estimators=10, random_state=0))
+    pipe.fit(X, y)
+    path = tmp_path_factory.mktemp("model") / "model.pkl"
+    joblib.dump(pipe, path)
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def compiled_path(model_path):
+    """model_path exported by compiled_model.export_pipeline."""
+    import compiled_model
+
+    path = model_path[:-len(".pkl")] + ".npz"
+    compiled_model.export_pipeline(joblib.load(model_path), path)
+    return path
+
+
+@pytest.fixture(scope="session")
+def log_dir(records, tmp_path_factory):
+    """``records`` written as run_XXX.json files, one per run (as generate_logs does)."""
+    import json
+    from itertools import groupby
+
+    path = tmp_path_factory.mktemp("logs")
+    for run_id, recs in groupby(records, key=lambda r: r["run_id"]):
+        (path / f"run_{run_id:03d}.json").write_text(json.dumps(list(recs), indent=2), encoding="utf-8")
+    return path
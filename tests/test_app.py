@@ -0,0 +1,115 @@
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+import streamlit as st
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+from streamlit.testing.v1 import AppTest
+
+import app
+import openai_utils
+
+
+def _converted(df, **kwargs):
+    data, _ = convert_data_to_bytes_and_infer_mime(
+        app.csv_export(df, **kwargs), unsupported_error=AssertionError("unsupported")
+    )
+    return data
+
+
+def test_csv_export_is_accepted_by_download_button():
+    df = pd.DataFrame({"run_id": range(5), "message": list("abcde")})
+    assert _converted(df, chunk_rows=2) == df.to_csv(index=False).encode("utf-8")
+
+
+def test_csv_export_empty_frame_keeps_header():
+    df = pd.DataFrame(columns=["run_id", "message"])
+    assert _converted(df) == b"run_id,message\n"
+
+
+@pytest.fixture
+def app_test(model_path, tmp_path, monkeypatch):
+    """The Streamlit app run by AppTest next to a copy of the test model."""
+    shutil.copy(model_path, tmp_path / "model.pkl")
+    monkeypatch.chdir(tmp_path)
+    st.cache_resource.clear()
+    at = AppTest.from_file(app.__file__, default_timeout=60)
+    at.run()
+    return at
+
+
+def _upload(at, runs):
+    files = [(f"run_{i}.json", json.dumps(recs).encode("utf-8"), "application/json") for i, recs in enumerate(runs)]
+    at.file_uploader[0].set_value(files).run()
+    assert not at.exception
+
+
+def _metric(at, label):
+    return next(int(m.value) for m in at.metric if m.label == label)
+
+
+def test_anomaly_table_matches_scored_records(app_test, records, model_path):
+    runs = [records[:40], records[40:90]]
+    _upload(app_test, runs)
+    table = app_test.dataframe[0].value
+
+    probs = np.concatenate([openai_utils.score_records(r, model_path=model_path) for r in runs])
+    expected = [(r["run_id"], r["message"], p) for r, p in zip(runs[0] + runs[1], probs) if p > 0.5]
+    assert _metric(app_test, "Всего записей") == 90
+    assert _metric(app_test, "Найдено аномалий") == len(expected) > 0
+    assert sorted(zip(table["run_id"], table["message"], table["anomaly_prob"])) == sorted(expected)
+    assert list(table["anomaly_prob"]) == sorted(table["anomaly_prob"], reverse=True)
+
+
+def test_threshold_change_does_not_rescore(app_test, records, monkeypatch):
+    calls = []
+    score_frame = openai_utils.score_frame
+
+    def counting(*args, **kwargs):
+        calls.append(1)
+        return score_frame(*args, **kwargs)
+
+    monkeypatch.setattr(openai_utils, "score_frame", counting)
+    _upload(app_test, [records[:40], records[40:90]])
+    assert len(calls) == 2
+    found = _metric(app_test, "Найдено аномалий")
+
+    app_test.slider[0].set_value(1.0).run()
+    assert len(calls) == 2
+    assert found and _metric(app_test, "Найдено аномалий") == 0
+    app_test.slider[0].set_value(0.5).run()
+    assert len(calls) == 2
+    assert _metric(app_test, "Найдено аномалий") == found
+
+    # Adding a file scores only the new one
+    _upload(app_test, [records[:40], records[40:90], records[90:120]])
+    assert len(calls) == 3
+
+
+def test_baseline_prefilter_is_opt_in_and_keyed_on_the_index(app_test, records, tmp_path):
+    import baseline_index
+    import train_model
+
+    runs = [records[:90]]
+    _upload(app_test, runs)
+    raw = _metric(app_test, "Найдено аномалий")
+    assert raw
+
+    # An index that calls every line routine: changes nothing until enabled
+    df = pd.DataFrame(records)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601")
+    index = baseline_index.BaselineIndex(min_count=1, quantile_range=(0.0, 1.0))
+    index.update(train_model.add_delta(df))
+    index.save(baseline_index.index_path(str(tmp_path / "model.pkl")))
+    app_test.run()
+    assert _metric(app_test, "Найдено аномалий") == raw
+
+    app_test.checkbox[0].check().run()
+    assert _metric(app_test, "Найдено аномалий") < raw
+
+    # Deleting the index invalidates the cached scores
+    (tmp_path / "model.baseline.json").unlink()
+    app_test.run()
+    assert _metric(app_test, "Найдено аномалий") == raw
@@ -0,0 +1,52 @@
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline_index
+import detect_cli
+import openai_utils
+import train_model
+
+
+@pytest.fixture
+def indexed_model(model_path, compiled_path, records, tmp_path):
+    """Copies of the test models with a baseline index that calls most lines routine."""
+    pkl, npz = tmp_path / "model.pkl", tmp_path / "model.npz"
+    shutil.copy(model_path, pkl)
+    shutil.copy(compiled_path, npz)
+    df = pd.DataFrame(records)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601")
+    index = baseline_index.BaselineIndex(min_count=1, quantile_range=(0.0, 1.0))
+    index.update(train_model.add_delta(df))
+    index.save(baseline_index.index_path(str(pkl)))
+    index.save(baseline_index.index_path(str(npz)))
+    return str(pkl), str(npz)
+
+
+def test_prefilter_is_opt_in(indexed_model, records, model_path):
+    pkl, _ = indexed_model
+    raw = openai_utils.score_records(records, model_path=model_path)
+    np.testing.assert_array_equal(openai_utils.score_records(records, model_path=pkl), raw)
+
+    filtered = openai_utils.score_records(records, model_path=pkl, prefilter=True)
+    skipped = filtered != raw
+    assert skipped.any()
+    assert (filtered[skipped] == 0).all()
+
+
+def test_cli_prefilter_flag(indexed_model, records, tmp_path, monkeypatch, capsys):
+    import json
+
+    logs = tmp_path / "runs.json"
+    logs.write_text(json.dumps(records), encoding="utf-8")
+    for model in indexed_model:
+        counts = []
+        for flags in ([], ["--prefilter"]):
+            monkeypatch.setattr(sys, "argv", ["detect_cli.py", str(logs), "-m", model, *flags])
+            with pytest.raises(SystemExit):
+                detect_cli.main()
+            counts.append(sum(line.startswith("- P=") for line in capsys.readouterr().out.splitlines()))
+        assert counts[0] > counts[1], model
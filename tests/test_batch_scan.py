@@ -0,0 +1,65 @@
+import json
+import sys
+
+import pytest
+
+import detect_cli
+import openai_utils
+
+
+def _keys(anomalies):
+    return sorted((a["run_id"], str(a["timestamp"]), a["message"], round(a["anomaly_prob"], 6)) for a in anomalies)
+
+
+def _main(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["detect_cli.py", *argv])
+    with pytest.raises(SystemExit) as exc:
+        detect_cli.main()
+    return exc.value.code
+
+
+def test_worker_pool_matches_serial_scan(log_dir, model_path):
+    paths = detect_cli.expand_inputs([str(log_dir)])[:12]
+    serial = list(detect_cli.scan_files(paths, 0.5, model_path, workers=1))
+    pooled = list(detect_cli.scan_files(paths, 0.5, model_path, workers=2))
+    assert [s["file"] for s, _ in pooled] == [str(p) for p in paths]
+    for (s1, a1), (s2, a2) in zip(serial, pooled):
+        assert s1["records"] == s2["records"] and s1["error"] is s2["error"] is None
+        assert _keys(a1) == _keys(a2)
+    found = [a for _, anomalies in serial for a in anomalies]
+    records = [r for p in paths for r in json.loads(p.read_text(encoding="utf-8"))]
+    assert _keys(found) == _keys(openai_utils.detect_anomalies(records, model_path=model_path))
+
+
+def test_expand_inputs_globs_and_directories(log_dir):
+    pattern = str(log_dir / "run_00*.json")
+    paths = detect_cli.expand_inputs([pattern, str(log_dir / "run_001.json"), str(log_dir)])
+    assert len(paths) == len(set(paths)) == len(list(log_dir.glob("run_*.json")))
+    assert paths[0].name == "run_001.json"
+
+
+def test_jsonl_report_keeps_going_after_a_bad_file(log_dir, model_path, tmp_path, monkeypatch, capsys):
+    bad = tmp_path / "broken.json"
+    bad.write_text("[{", encoding="utf-8")
+    good = [str(p) for p in sorted(log_dir.glob("run_*.json"))[:3]]
+    code = _main(monkeypatch, *good, str(bad), "--model", model_path, "--format", "jsonl", "-w", "1")
+    assert code == 1
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    files = [line for line in lines if line["type"] == "file"]
+    assert [f["file"] for f in files] == good + [str(bad)]
+    assert [f["error"] is None for f in files] == [True, True, True, False]
+    total = lines[-1]
+    assert total["type"] == "total" and (total["files"], total["failed"]) == (4, 1)
+    assert total["anomalies"] == sum(line["type"] == "anomaly" for line in lines)
+
+
+def test_no_all_clear_when_every_file_failed(tmp_path, model_path, monkeypatch, capsys):
+    bad = []
+    for name in ("a.json", "b.json"):
+        path = tmp_path / name
+        path.write_text("[{", encoding="utf-8")
+        bad.append(str(path))
+    assert _main(monkeypatch, *bad, "--model", model_path, "-w", "1") == 1
+    out, err = capsys.readouterr()
+    assert "Аномалий не обнаружено" not in out + err
+    assert "Ни один из 2 файлов не удалось проверить" in err
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import openai_utils
+from batching import MicroBatcher
+
+
+def _model_input(records, model):
+    return openai_utils.model_input(openai_utils.prepare_frame(records), model)
+
+
+def test_bad_request_does_not_fail_its_batch(model_path, records):
+    model = openai_utils.load_anomaly_model(model_path)
+    good = _model_input(records[:30], model)
+    bad = good.head(5).copy()
+    bad["message"] = None
+    # A wide window so both requests land in one batch
+    batcher = MicroBatcher(model=model, window_ms=500, model_path=model_path)
+    good_fut, bad_fut = batcher.submit(good), batcher.submit(bad)
+
+    np.testing.assert_allclose(good_fut.result(timeout=10), model.predict_proba(good)[:, 1])
+    with pytest.raises(Exception):
+        bad_fut.result(timeout=10)
+
+
+def test_concurrent_callers_share_a_batch(model_path, records):
+    from concurrent.futures import ThreadPoolExecutor
+
+    model = openai_utils.load_anomaly_model(model_path)
+    runs = [[r for r in records if r["run_id"] == run_id] for run_id in range(1, 9)]
+    batcher = MicroBatcher(model=model, window_ms=200, model_path=model_path)
+    with ThreadPoolExecutor(len(runs)) as pool:
+        results = list(pool.map(batcher.score, runs))
+
+    for run, probs in zip(runs, results):
+        np.testing.assert_allclose(probs, openai_utils.score_records(run, model=model, model_path=model_path))
+    stats = batcher.stats()
+    assert stats["requests"] == len(runs)
+    assert stats["batches"] < len(runs)
@@ -0,0 +1,33 @@
+import json
+import os
+import subprocess
+import sys
+
+BENCH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "run_benchmarks.py")
+
+
+def test_benchmark_smoke_run(model_path, tmp_path):
+    out = tmp_path / "results.json"
+    subprocess.run(
+        [sys.executable, BENCH, "--sizes", "200", "--stages", "convert", "load_data", "detect",
+         "--repeat", "1", "-m", model_path, "--data-dir", str(tmp_path / "data"), "-o", str(out)],
+        check=True, capture_output=True, cwd=tmp_path,
+    )
+    report = json.loads(out.read_text(encoding="utf-8"))
+    results = {r["stage"]: r for r in report["results"]}
+    assert set(results) == {"convert", "load_data", "detect"}
+    assert all("error" not in r and r["items"] >= 200 for r in results.values())
+    assert set(report["import_seconds"]) == {"openai_utils", "detect_cli", "train_model"}
+
+
+def test_generated_data_is_reproducible(tmp_path):
+    sys.path.insert(0, os.path.dirname(BENCH))
+    try:
+        import run_benchmarks
+    finally:
+        sys.path.remove(os.path.dirname(BENCH))
+    a, b = tmp_path / "a.json", tmp_path / "b.json"
+    run_benchmarks.generate_records(str(a), 100)
+    run_benchmarks.generate_records(str(b), 100)
+    assert len(json.loads(a.read_text(encoding="utf-8"))) >= 100
+    assert a.read_bytes() == b.read_bytes()
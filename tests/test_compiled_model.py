@@ -0,0 +1,73 @@
+import pytest
+
+import compiled_model
+import detect_cli
+import openai_utils
+
+
+def _keys(anomalies):
+    return sorted((str(a["run_id"]), str(a["message"]), round(a["anomaly_prob"], 6)) for a in anomalies)
+
+
+def test_slim_path_matches_pandas_path(compiled_path, records):
+    slim = detect_cli.detect_local(records, 0.5, compiled_path)
+    full = openai_utils.detect_anomalies(records, model_path=compiled_path)
+    assert slim and _keys(slim) == _keys(full)
+
+
+def test_unorderable_input_falls_back(compiled_path, records):
+    mixed = [dict(r, run_id=str(r["run_id"]) if i % 2 else r["run_id"]) for i, r in enumerate(records)]
+    model = compiled_model.CompiledModel(compiled_path)
+    with pytest.raises(compiled_model.UnsupportedInput):
+        compiled_model.detect_records(model, mixed)
+    assert _keys(detect_cli.detect_local(mixed, 0.5, compiled_path)) == _keys(
+        openai_utils.detect_anomalies(mixed, model_path=compiled_path)
+    )
+
+
+def test_engine_errors_are_not_swallowed(compiled_path, records, monkeypatch):
+    predict_proba = compiled_model.CompiledModel.predict_proba
+
+    def broken(self, X):
+        # Only the slim path passes a plain mapping of columns
+        if isinstance(X, dict):
+            raise TypeError("bug in the engine")
+        return predict_proba(self, X)
+
+    monkeypatch.setattr(compiled_model.CompiledModel, "predict_proba", broken)
+    with pytest.raises(TypeError, match="bug in the engine"):
+        detect_cli.detect_local(records, 0.5, compiled_path)
+
+
+def test_predict_proba_matches_pipeline(model_path, compiled_path, records):
+    import joblib
+    import numpy as np
+
+    pipe = joblib.load(model_path)
+    X = openai_utils.model_input(openai_utils.prepare_frame(records), pipe)
+    compiled = compiled_model.CompiledModel(compiled_path, chunk_size=64)
+    np.testing.assert_allclose(compiled.predict_proba(X), pipe.predict_proba(X), atol=1e-12)
+
+
+
+def test_cli_cold_start_skips_heavy_imports(compiled_path, model_path, records, tmp_path):
+    import subprocess
+    import sys
+
+    log = tmp_path / "job.log"
+    log.write_text(
+        "".join(f"::group::{r['stage']}\n{r['timestamp']}Z {r['message']}\n" for r in records[:60]),
+        encoding="utf-8",
+    )
+
+    def run(model):
+        return subprocess.run(
+            [sys.executable, detect_cli.__file__, str(log), "-m", model, "--profile-startup"],
+            capture_output=True, text=True,
+        )
+
+    slim, full = run(compiled_path), run(model_path)
+    assert slim.returncode == full.returncode == 1
+    assert "pandas=нет" in slim.stderr and "sklearn=нет" in slim.stderr
+    assert "sklearn=да" in full.stderr
+    assert sorted(slim.stdout.splitlines()) == sorted(full.stdout.splitlines())
@@ -0,0 +1,48 @@
+import json
+import subprocess
+import sys
+
+import convert_workflow_logs
+
+RAW = """2025-01-01T00:00:00.1000000Z Requested labels: ubuntu-latest
+::group::Run actions/checkout@v4
+2025-01-01T00:00:01.2000000Z Syncing repository
+2025-01-01T00:00:02.3000000Z Error: fatal: could not read from remote
+::endgroup::
+2025-01-01T00:00:03.4000000Z Cleaning up orphan processes
+"""
+
+
+def test_stages_and_statuses(tmp_path):
+    log = tmp_path / "job.log"
+    log.write_text(RAW, encoding="utf-8")
+    records = list(convert_workflow_logs.iter_log_file(log))
+    assert [(r["stage"], r["status"]) for r in records] == [
+        ("init", "INFO"),
+        ("Run actions/checkout@v4", "INFO"),
+        ("Run actions/checkout@v4", "ERROR"),
+        ("init", "INFO"),
+    ]
+    assert records[1] == {
+        "run_id": 1,
+        "stage": "Run actions/checkout@v4",
+        "status": "INFO",
+        "message": "Syncing repository",
+        "timestamp": "2025-01-01T00:00:01.2000000Z",
+    }
+
+
+def test_parser_keeps_stage_between_feeds():
+    parser = convert_workflow_logs.WorkflowLogParser(run_id=7)
+    assert parser.feed("::group::build") is None
+    rec = parser.feed("2025-01-01T00:00:01.0Z compiling")
+    assert (rec["run_id"], rec["stage"]) == (7, "build")
+
+
+def test_in_process_matches_command_line_converter(tmp_path):
+    log, out = tmp_path / "job.log", tmp_path / "job.json"
+    log.write_text(RAW, encoding="utf-8")
+    subprocess.run(
+        [sys.executable, convert_workflow_logs.__file__, str(log), str(out)], check=True
+    )
+    assert json.loads(out.read_text(encoding="utf-8")) == list(convert_workflow_logs.iter_log_file(log))
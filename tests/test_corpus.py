@@ -0,0 +1,66 @@
+import json
+import itertools
+from pathlib import Path
+
+import pytest
+
+import corpus
+import baseline_index
+import detect_cli
+import train_model
+
+
+def _build(records, tmp_path):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    for run_id, recs in itertools.groupby(records, key=lambda r: r["run_id"]):
+        (logs / f"run_{run_id:03d}.json").write_text(json.dumps(list(recs)), encoding="utf-8")
+    out = str(tmp_path / "corpus")
+    corpus.build_corpus(str(logs), out, workers=1)
+    return out
+
+
+def test_corpus_trained_index_has_duration_bounds(records, tmp_path):
+    path = _build(records, tmp_path)
+    df = train_model.add_delta(train_model.load_data(path))
+    assert "duration_sec" in df
+
+    index = baseline_index.BaselineIndex(min_count=1)
+    index.update(df[df["label"] == 0])
+    final = [e for e in index.entries.values() if e["duration"].count]
+    assert final, "no duration sketches were built"
+
+    # A routine final line becomes non-routine once its duration is way off
+    normal = df[(df["label"] == 0) & df["duration_sec"].notna()].head(1)
+    assert index.routine_mask(normal).all()
+    assert not index.routine_mask(normal.assign(duration_sec=1e6)).any()
+
+
+def test_corpus_detect_columns_include_duration(records, tmp_path):
+    frame = detect_cli.load_records(Path(_build(records, tmp_path)))
+    assert "duration_sec" in frame
+
+
+def test_same_named_logs_from_different_dirs_are_all_added(records, tmp_path):
+    out = str(tmp_path / "corpus")
+    by_run = [list(recs) for _, recs in itertools.groupby(records, key=lambda r: r["run_id"])]
+    for name, recs in (("a", by_run[0]), ("b", by_run[1])):
+        logs = tmp_path / name
+        logs.mkdir()
+        (logs / "run_001.json").write_text(json.dumps(recs), encoding="utf-8")
+        assert corpus.build_corpus(str(logs), out, workers=1) == 1
+
+    frame = corpus.read_corpus(out, columns=["run_id"])
+    assert len(frame) == len(by_run[0]) + len(by_run[1])
+    # nothing new on a second pass over either directory
+    assert corpus.build_corpus(str(tmp_path / "a"), out, workers=1) == 0
+
+
+def test_outdated_manifest_needs_rebuild(records, tmp_path):
+    out = Path(_build(records, tmp_path))
+    manifest = json.loads((out / corpus.MANIFEST).read_text(encoding="utf-8"))
+    (out / corpus.MANIFEST).write_text(json.dumps(dict(manifest, version=1)), encoding="utf-8")
+    logs = str(tmp_path / "logs")
+    with pytest.raises(ValueError, match="--rebuild"):
+        corpus.build_corpus(logs, str(out), workers=1)
+    assert corpus.build_corpus(logs, str(out), workers=1, rebuild=True) == len(manifest["files"])
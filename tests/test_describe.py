@@ -0,0 +1,60 @@
+import llm_stub
+import openai_utils
+
+
+def _anomalies(n):
+    # Letters only: every message is its own template, hence its own group
+    words = ["".join(chr(97 + (i // 26 ** k) % 26) for k in range(3)) for i in range(n)]
+    return [
+        {"run_id": 1, "stage": "build", "status": "ERROR", "timestamp": "2025-01-01T00:00:00",
+         "message": f"Build error in module {w} while linking target {w}", "anomaly_prob": 0.9}
+        for w in words
+    ]
+
+
+def _content(prompt):
+    # head:\n\n<list>\n\n<tail>
+    return prompt.split("\n\n")[1]
+
+
+def test_pack_prompts_respects_budget():
+    lines = [c * n for c, n in zip("abcdefgh", (50, 100, 5, 59, 1, 60, 30, 29))]
+    prompts = openai_utils._pack_prompts(lines, 60)
+    assert all(len(p) <= 60 for p in prompts)
+    assert prompts[1] == "b" * 60
+    assert [line[:60] for line in lines] == "\n".join(prompts).split("\n")
+
+
+def test_every_prompt_is_capped(monkeypatch):
+    client = llm_stub.StubClient()
+    monkeypatch.setattr(openai_utils, "_client", client)
+    max_chars = 300
+    summary = openai_utils.describe_anomalies(
+        _anomalies(400), max_prompt_chars=max_chars, cache_dir=None
+    )
+    assert summary.startswith("[stub:")
+    # Many parts, several merge levels, one final call
+    assert len(client.calls) > 100
+    assert all(len(_content(p)) <= max_chars for p in client.calls)
+    assert sum(openai_utils._PROMPT_TAIL in p for p in client.calls) == 1
+
+
+def test_summaries_are_cached(monkeypatch, tmp_path):
+    client = llm_stub.StubClient()
+    monkeypatch.setattr(openai_utils, "_client", client)
+    anomalies = _anomalies(30)
+    first = openai_utils.describe_anomalies(anomalies, cache_dir=str(tmp_path))
+    n_calls = len(client.calls)
+    assert n_calls
+    # Same groups in another order: answered from the cache
+    assert openai_utils.describe_anomalies(anomalies[::-1], cache_dir=str(tmp_path)) == first
+    assert len(client.calls) == n_calls
+
+
+def test_repeated_messages_are_grouped(monkeypatch):
+    client = llm_stub.StubClient()
+    monkeypatch.setattr(openai_utils, "_client", client)
+    anomalies = _anomalies(3) * 50
+    openai_utils.describe_anomalies(anomalies, cache_dir=None)
+    assert len(client.calls) == 1
+    assert _content(client.calls[0]).count("\n") == 2
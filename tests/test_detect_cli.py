@@ -0,0 +1,98 @@
+import json
+import sys
+
+import pytest
+
+import detect_cli
+import openai_utils
+
+
+def _run(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["detect_cli.py", *argv])
+    with pytest.raises(SystemExit) as exc:
+        detect_cli.main()
+    return exc.value.code
+
+
+def test_stream_model_error_is_not_a_read_error(tmp_path, records, monkeypatch, capsys):
+    logs = tmp_path / "run.json"
+    logs.write_text(json.dumps(records[:20]), encoding="utf-8")
+    bad = tmp_path / "bad.pkl"
+    bad.write_bytes(b"not a pickle")
+    assert _run(monkeypatch, str(logs), "--stream", "--model", str(bad)) == 1
+    err = capsys.readouterr().err
+    assert "bad.pkl" in err and "Error reading" not in err
+
+
+def test_stream_scoring_errors_are_not_read_errors(tmp_path, records, model_path, monkeypatch):
+    logs = tmp_path / "run.json"
+    logs.write_text(json.dumps(records[:20]), encoding="utf-8")
+
+    def broken(self, chunk):
+        raise RuntimeError("bug in scoring")
+
+    monkeypatch.setattr(openai_utils.StreamScorer, "score", broken)
+    monkeypatch.setattr(sys, "argv", ["detect_cli.py", str(logs), "--stream", "--model", model_path])
+    with pytest.raises(RuntimeError, match="bug in scoring"):
+        detect_cli.main()
+
+
+def test_stream_unreadable_input_is_a_read_error(tmp_path, model_path, monkeypatch, capsys):
+    logs = tmp_path / "run.json"
+    logs.write_text("[{\"run_id\": 1,", encoding="utf-8")
+    assert _run(monkeypatch, str(logs), "--stream", "--model", model_path) == 1
+    assert "Error reading" in capsys.readouterr().err
+
+
+def test_run_anomaly_without_line_anomalies(tmp_path, records, model_path, monkeypatch, capsys):
+    import random
+    from datetime import datetime
+
+    import joblib
+    import pandas as pd
+    from sklearn.tree import DecisionTreeClassifier
+
+    import generate_logs
+    import run_features
+    import train_model
+
+    # A run without failed stages whose every step took ten times longer
+    start = datetime(2025, 2, 1, 0, 0, 0, 500_000)
+    slow = generate_logs.generate_run(999, start, 0.0, rng=random.Random(1))
+    for r in slow:
+        ts = datetime.fromisoformat(r["timestamp"])
+        r["timestamp"] = (start + (ts - start) * 10).isoformat()
+    logs = tmp_path / "slow.json"
+    logs.write_text(json.dumps(slow), encoding="utf-8")
+    assert not detect_cli.detect_local(detect_cli.load_records(logs), 0.5, model_path)
+
+    df = pd.DataFrame(records + slow)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601")
+    df = train_model.add_delta(df)
+    baseline = run_features.fit_baseline(df[df["run_id"] != 999])
+    runs = run_features.run_table(df, baseline)
+    clf = DecisionTreeClassifier(random_state=0).fit(
+        runs[run_features.RUN_FEATURES], (runs["run_id"] == 999).astype(int)
+    )
+    run_model = tmp_path / "run_model.pkl"
+    joblib.dump(run_features.RunLevelModel(clf, baseline), run_model)
+
+    code = _run(monkeypatch, str(logs), "--model", model_path, "--run-model", str(run_model))
+    out = capsys.readouterr().out
+    assert code == 1
+    assert "Аномальных прогонов: 1" in out and "run 999" in out
+
+
+def _keys(anomalies):
+    return sorted((a["run_id"], str(a["timestamp"]), a["message"], round(a["anomaly_prob"], 6)) for a in anomalies)
+
+
+def test_stream_matches_whole_file_detection(tmp_path, records, model_path, capsys):
+    logs = tmp_path / "runs.json"
+    logs.write_text(json.dumps(records, indent=2), encoding="utf-8")
+    # Chunks much smaller than a run, so delta has to be carried between them
+    count, streamed = detect_cli.stream_anomalies(logs, 0.3, 7, keep=True, model_path=model_path)
+    expected = openai_utils.detect_anomalies(records, threshold=0.3, model_path=model_path)
+    assert count == len(streamed) == len(expected) > 0
+    assert _keys(streamed) == _keys(expected)
+    assert len(capsys.readouterr().out.splitlines()) == count
@@ -0,0 +1,69 @@
+import threading
+import time
+
+import convert_workflow_logs
+import detect_cli
+import openai_utils
+
+
+def _log_lines(records):
+    lines, stage = [], None
+    for r in records:
+        if r["stage"] != stage:
+            if stage is not None:
+                lines.append("::endgroup::")
+            stage = r["stage"]
+            lines.append(f"::group::{stage}")
+        lines.append(f"{r['timestamp']}Z {r['message']}")
+    return [line + "\n" for line in lines]
+
+
+def _keys(anomalies):
+    return sorted((str(a["timestamp"]), a["message"], round(a["anomaly_prob"], 6)) for a in anomalies)
+
+
+def test_follow_matches_whole_file_detection(tmp_path, records, model_path, capsys):
+    path = tmp_path / "job.log"
+    path.write_text("", encoding="utf-8")
+    lines = _log_lines(records[:120])
+
+    def writer():
+        # Three bursts, the middle one cut in the middle of a line
+        with open(path, "a", encoding="utf-8") as f:
+            for part in (lines[:40], lines[40:80], lines[80:]):
+                text = "".join(part)
+                f.write(text[:-5])
+                f.flush()
+                time.sleep(0.3)
+                f.write(text[-5:])
+                f.flush()
+
+    t = threading.Thread(target=writer)
+    t.start()
+    count, found = detect_cli.follow_anomalies(
+        path, 0.3, 1000, max_latency=0.2, idle_timeout=1.5, keep=True, model_path=model_path
+    )
+    t.join()
+
+    expected = openai_utils.detect_anomalies(
+        list(convert_workflow_logs.iter_log_file(path)), threshold=0.3, model_path=model_path
+    )
+    assert count == len(found) == len(expected) > 0
+    assert _keys(found) == _keys(expected)
+
+
+def test_follow_lines_rereads_a_truncated_file(tmp_path):
+    path = tmp_path / "job.log"
+    path.write_text("a\nb\n", encoding="utf-8")
+    polls = convert_workflow_logs.follow_lines(path, poll_interval=0.01, idle_timeout=0.5)
+    assert next(polls) == ["a", "b"]
+    assert next(polls) == []
+    path.write_text("c\n", encoding="utf-8")
+    assert [line for lines in polls for line in lines] == ["c"]
+
+
+def test_follow_lines_flushes_a_partial_line_on_idle(tmp_path):
+    path = tmp_path / "job.log"
+    path.write_text("a\nb", encoding="utf-8")
+    polls = convert_workflow_logs.follow_lines(path, poll_interval=0.01, idle_timeout=0.1)
+    assert [line for lines in polls for line in lines] == ["a", "b"]
@@ -0,0 +1,73 @@
+import random
+from datetime import datetime
+
+import pytest
+
+import generate_logs
+
+
+@pytest.mark.parametrize("long_tail", [False, True])
+def test_final_duration_is_gap_to_previous_record(long_tail):
+    rng = random.Random(3)
+    records = generate_logs.generate_run(
+        1, datetime(2025, 1, 1), 0.5, rng=rng, long_tail=long_tail,
+        anomaly_mix={"error": 0.5, "slow": 0.5},
+    )
+    finals = 0
+    for prev, rec in zip(records, records[1:]):
+        if "duration_sec" in rec:
+            gap = datetime.fromisoformat(rec["timestamp"]) - datetime.fromisoformat(prev["timestamp"])
+            assert rec["duration_sec"] == pytest.approx(gap.total_seconds(), abs=1e-6)
+            finals += 1
+    assert finals == len(generate_logs.STAGES)
+
+
+def _generate(tmp_path, name, *args):
+    import subprocess
+    import sys
+
+    out = tmp_path / name
+    subprocess.run(
+        [sys.executable, generate_logs.__file__, "-o", str(out), "-r", "12", "--seed", "5",
+         "--start", "2025-01-01T00:00:00", *args],
+        check=True, capture_output=True,
+    )
+    return out
+
+
+def _jsonl_records(out):
+    import json
+
+    # pid/thread identify the generating process, not the data
+    return [
+        {k: v for k, v in json.loads(line).items() if k not in ("pid", "thread")}
+        for path in sorted(out.glob("*.jsonl"))
+        for line in path.read_text(encoding="utf-8").splitlines()
+    ]
+
+
+def test_output_does_not_depend_on_workers(tmp_path):
+    serial = _generate(tmp_path, "serial", "-f", "jsonl", "--shard-runs", "5", "-w", "1")
+    pooled = _generate(tmp_path, "pooled", "-f", "jsonl", "--shard-runs", "5", "-w", "3")
+    assert [p.name for p in sorted(serial.glob("*.jsonl"))] == [
+        "runs-00000.jsonl", "runs-00001.jsonl", "runs-00002.jsonl"
+    ]
+    records = _jsonl_records(serial)
+    assert records == _jsonl_records(pooled)
+    assert sorted({r["run_id"] for r in records}) == list(range(1, 13))
+
+
+def test_parquet_output_is_a_corpus(tmp_path):
+    import corpus
+
+    out = _generate(tmp_path, "corpus", "-f", "parquet", "--shard-runs", "5", "-w", "2")
+    frame = corpus.read_corpus(str(out))
+    assert sorted(frame["run_id"].unique()) == list(range(1, 13))
+    assert frame["timestamp"].dtype.kind == "M"
+
+
+def test_parse_anomaly_mix():
+    assert generate_logs.parse_anomaly_mix("error=3,slow=1") == {"error": 0.75, "slow": 0.25}
+    assert generate_logs.parse_anomaly_mix("slow") == {"slow": 1.0}
+    with pytest.raises(ValueError):
+        generate_logs.parse_anomaly_mix("disk=1")
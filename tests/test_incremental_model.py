@@ -0,0 +1,63 @@
+import shutil
+
+import joblib
+import numpy as np
+import pytest
+
+import incremental_model
+import openai_utils
+import train_model
+
+
+def _copy(log_dir, dest, first, last):
+    dest.mkdir(exist_ok=True)
+    for i in range(first, last + 1):
+        shutil.copy(log_dir / f"run_{i:03d}.json", dest / f"run_{i:03d}.json")
+    return str(dest / "run_*.json")
+
+
+def test_update_learns_only_new_files(log_dir, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pattern = _copy(log_dir, tmp_path / "logs", 1, 30)
+    v1 = train_model.train_incremental(pattern, chunk_files=10, workers=1)
+    assert v1 == "model.v1.pkl"
+
+    _copy(log_dir, tmp_path / "logs", 31, 60)
+    v2 = train_model.train_incremental(pattern, base_path=v1, chunk_files=10, workers=1)
+    assert v2 == "model.v2.pkl"
+    model = joblib.load(v2)
+    assert model.version == 2 and len(model.trained_files) == 60
+    assert [h["files"] for h in model.history] == [30, 30]
+    # The base model is left as it was
+    assert joblib.load(v1).version == 1
+
+    # Nothing new: no new version
+    assert train_model.train_incremental(pattern, base_path=v2, workers=1) is None
+
+    # Two updates learn the same as one pass over the same chunks
+    (tmp_path / "all").mkdir()
+    once = train_model.train_incremental(
+        _copy(log_dir, tmp_path / "all", 1, 60), out_path="once.pkl", chunk_files=10, workers=1
+    )
+    np.testing.assert_allclose(joblib.load(once).clf.coef_, model.clf.coef_)
+
+
+def test_incremental_model_scores_like_a_pipeline(log_dir, records, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = train_model.train_incremental(str(log_dir / "run_*.json"), chunk_files=20, workers=1)
+    probs = openai_utils.score_records(records, model_path=str(tmp_path / path), prefilter=False)
+    assert probs.shape == (len(records),)
+    assert ((probs >= 0) & (probs <= 1)).all()
+    assert probs[[r["label"] == 1 for r in records]].mean() > probs[[r["label"] == 0 for r in records]].mean()
+
+
+def test_full_pipeline_cannot_be_updated(model_path, log_dir, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(SystemExit):
+        train_model.train_incremental(str(log_dir / "run_*.json"), base_path=model_path, workers=1)
+
+
+def test_versioned_path():
+    assert incremental_model.versioned_path(None, 1) == "model.v1.pkl"
+    assert incremental_model.versioned_path("models/model.v3.pkl", 4) == "models/model.v4.pkl"
+    assert incremental_model.versioned_path("m", 2) == "m.v2.pkl"
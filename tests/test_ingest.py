@@ -0,0 +1,154 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+
+
+def _files(log_dir):
+    return sorted(str(p) for p in log_dir.glob("run_*.json"))
+
+
+def test_read_logs_matches_read_json(log_dir, monkeypatch):
+    files = _files(log_dir)
+    expected = pd.concat([pd.read_json(f) for f in files], ignore_index=True)
+    # Small chunks, so the files really are split over the pool
+    monkeypatch.setattr(ingest, "_MIN_FILES_PER_CHUNK", 4)
+    pd.testing.assert_frame_equal(ingest.read_logs(files, workers=2, cache_dir=None), expected)
+    pd.testing.assert_frame_equal(ingest.read_logs(files, workers=1, cache_dir=None), expected)
+
+
+def test_read_logs_cache_follows_file_changes(log_dir, tmp_path, monkeypatch, capsys):
+    files = _files(log_dir)[:3]
+    copies = []
+    for f in files:
+        copy = tmp_path / os.path.basename(f)
+        copy.write_bytes(open(f, "rb").read())
+        copies.append(str(copy))
+    cache = str(tmp_path / "cache")
+
+    first = ingest.read_logs(copies, workers=1, cache_dir=cache)
+    assert "from cache" not in capsys.readouterr().out
+    second = ingest.read_logs(copies, workers=1, cache_dir=cache)
+    assert "from cache" in capsys.readouterr().out
+    pd.testing.assert_frame_equal(first, second)
+
+    # A changed file invalidates the cached frame
+    with open(copies[0], "w", encoding="utf-8") as f:
+        f.write('[{"run_id": 1, "timestamp": "2025-01-01T00:00:00", "stage": "build",'
+                ' "status": "INFO", "message": "ok", "label": 0}]')
+    third = ingest.read_logs(copies, workers=1, cache_dir=cache)
+    assert "from cache" not in capsys.readouterr().out
+    assert len(third) < len(first)
+
+
+def test_unreadable_file_is_skipped_with_a_warning(log_dir, tmp_path, capsys):
+    broken = tmp_path / "run_999.json"
+    broken.write_text("[{", encoding="utf-8")
+    files = _files(log_dir)[:2]
+    frame = ingest.read_logs(files + [str(broken)], workers=1, cache_dir=None)
+    assert len(frame) == len(ingest.read_logs(files, workers=1, cache_dir=None))
+    assert "run_999.json" in capsys.readouterr().err
+
+
+def test_iter_json_records_across_block_boundaries(log_dir):
+    path = _files(log_dir)[0]
+    expected = json.load(open(path, encoding="utf-8"))
+    # Blocks far smaller than a record: every record is cut at least once
+    assert list(ingest.iter_json_records(path, block_size=16)) == expected
+
+
+def _as_jsonl(records, path):
+    # Blank and CRLF lines are allowed between records
+    path.write_text("\r\n\n".join(json.dumps(r) for r in records) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_jsonl_reads_like_json(records, tmp_path):
+    as_json = tmp_path / "runs.json"
+    as_json.write_text(json.dumps(records, indent=2), encoding="utf-8")
+    as_jsonl = _as_jsonl(records, tmp_path / "runs.jsonl")
+
+    assert list(ingest.iter_file_records(as_jsonl)) == records == list(ingest.iter_file_records(str(as_json)))
+    a, b = ingest.read_columns(str(as_json)), ingest.read_columns(as_jsonl)
+    assert list(a) == list(b)
+    for name in a:
+        np.testing.assert_array_equal(a[name], b[name])
+    pd.testing.assert_frame_equal(
+        ingest.read_logs([str(as_json)], workers=1, cache_dir=None),
+        ingest.read_logs([as_jsonl], workers=1, cache_dir=None),
+    )
+
+
+def test_sniff_format():
+    assert ingest.sniff_format(b'\xef\xbb\xbf\n[{"a": 1}]') == "json"
+    assert ingest.sniff_format(b'{"a": 1}\n{"a": 2}\n') == "jsonl"
+    assert ingest.sniff_format(b'  {"a": 1}') == "jsonl"
+    # A pretty-printed object and a column-oriented document are one document
+    assert ingest.sniff_format(b'{\n  "a": 1\n}\n') == "json"
+    assert ingest.sniff_format(b'{"run_id": {"0": 1, "1": 2}}') == "json"
+
+
+def test_column_oriented_document(tmp_path):
+    frame = pd.DataFrame({"run_id": [1, 2], "message": ["a", "b"]})
+    path = tmp_path / "cols.json"
+    frame.to_json(path)
+    assert list(ingest.iter_file_records(str(path))) == frame.to_dict(orient="records")
+
+
+def test_jsonl_line_that_is_not_an_object(tmp_path):
+    path = tmp_path / "bad.jsonl"
+    path.write_text('{"a": 1}\n[1, 2]\n', encoding="utf-8")
+    with pytest.raises(ValueError, match="не JSON-объект"):
+        list(ingest.iter_file_records(str(path)))
+
+
+@pytest.mark.parametrize("suffix", [".json", ".jsonl"])
+def test_nan_and_infinity_literals(tmp_path, suffix):
+    path = tmp_path / f"nan{suffix}"
+    recs = ['{"run_id": 1, "duration_sec": NaN}', '{"run_id": 2, "duration_sec": Infinity}']
+    path.write_text("[" + ", ".join(recs) + "]" if suffix == ".json" else "\n".join(recs), encoding="utf-8")
+    values = [r["duration_sec"] for r in ingest.iter_file_records(str(path))]
+    assert np.isnan(values[0]) and values[1] == float("inf")
+
+
+def test_iter_json_records_stops_early_on_a_corrupt_record(tmp_path, monkeypatch):
+    path = tmp_path / "big.json"
+    good = json.dumps({"run_id": 1, "message": "x" * 100})
+    path.write_text("[" + good + ', {"run_id": 2, "message": "oops}, ' + ", ".join([good] * 5000) + "]",
+                    encoding="utf-8")
+    read = []
+
+    class TrackingFile:
+        def __init__(self, f):
+            self.f = f
+
+        def read(self, n):
+            chunk = self.f.read(n)
+            read.append(len(chunk))
+            return chunk
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self.f.close()
+
+    monkeypatch.setattr(ingest, "open", lambda *a, **kw: TrackingFile(open(*a, **kw)), raising=False)
+    it = ingest.iter_json_records(str(path), block_size=256, max_record=4096)
+    assert next(it)["run_id"] == 1
+    with pytest.raises(ValueError, match="4096"):
+        next(it)
+    # Stopped far from the end of the ~600 KB file
+    assert sum(read) < 16 * 1024
+
+
+def test_n_records_for_every_input_shape(log_dir):
+    path = str(next(log_dir.glob("run_*.json")))
+    rows = json.loads(open(path, encoding="utf-8").read())
+    columns = ingest.read_columns(path)
+    for records in (rows, columns, pd.DataFrame(rows), {}, []):
+        assert ingest.n_records(records) == (len(rows) if len(records) else 0)
@@ -0,0 +1,64 @@
+import pickle
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+import compiled_model
+import log_templates
+import openai_utils
+import train_model
+
+
+@pytest.fixture(scope="module")
+def miner(records):
+    m = log_templates.TemplateMiner()
+    for r in records:
+        m.add(r["message"])
+    return m
+
+
+def test_variable_parts_share_a_template():
+    m = log_templates.TemplateMiner()
+    a, params = m.add("Build completed in 12.34s")
+    b, _ = m.add("Build completed in 5.00s")
+    c, _ = m.add("Deploy to /srv/app/releases/42 failed")
+    assert a == b != c
+    assert m.template(a) == "Build completed in <NUM>s"
+    assert params == ["12.34s"]
+    assert m.extract("Build completed in 7.5s") == (a, ["7.5s"])
+    assert m.match("Something never seen before") is None
+
+
+def test_template_ids_survive_pickling_and_export(miner, records):
+    ids = [miner.match(r["message"]) for r in records]
+    assert None not in ids
+    assert len(miner) < len({r["message"] for r in records})
+    for restored in (pickle.loads(pickle.dumps(miner)), log_templates.TemplateMiner.from_dict(miner.to_dict())):
+        assert [restored.match(r["message"]) for r in records] == ids
+        assert restored.counts == miner.counts
+
+
+def test_templates_pipeline_matches_its_compiled_export(records, tmp_path):
+    from sklearn.ensemble import RandomForestClassifier
+
+    df = pd.DataFrame(records)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601")
+    X, y = train_model.prepare_features(df)
+    pipe = train_model.build_pipeline(
+        clf=RandomForestClassifier(n_estimators=10, random_state=0), text_features="templates"
+    ).fit(X, y)
+    path = tmp_path / "model.pkl"
+    joblib.dump(pipe, path)
+    restored = joblib.load(path)
+    np.testing.assert_array_equal(restored.predict_proba(X), pipe.predict_proba(X))
+
+    compiled_model.export_pipeline(restored, str(tmp_path / "model.npz"))
+    compiled = compiled_model.CompiledModel(str(tmp_path / "model.npz"))
+    np.testing.assert_allclose(compiled.predict_proba(X), pipe.predict_proba(X), atol=1e-12)
+
+    # Unseen messages get no template and still score
+    unseen = X.head(3).assign(message="completely new text")
+    assert restored.predict_proba(unseen).shape == (3, 2)
+    np.testing.assert_allclose(compiled.predict_proba(unseen), restored.predict_proba(unseen), atol=1e-12)
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+import metrics
+
+
+def test_histogram_quantiles_and_merge():
+    a = metrics.LatencyHistogram()
+    for ms in (0.5, 3, 3, 40, 4000):
+        a.observe(ms)
+    assert (a.quantile(0.5), a.quantile(0.99)) == (5, 5000)
+
+    b = metrics.LatencyHistogram()
+    b.merge_snapshot(a.snapshot())
+    b.merge_snapshot(a.snapshot())
+    assert b.snapshot()["count"] == 10
+    assert b.snapshot()["sum_ms"] == pytest.approx(2 * a.sum_ms)
+    assert b.snapshot()["buckets"] == {k: 2 * v for k, v in a.snapshot()["buckets"].items()}
+
+
+def test_worker_snapshots_add_up():
+    worker, parent = metrics.MetricsRegistry(), metrics.MetricsRegistry()
+    worker.incr("files_scanned", 2)
+    worker.observe_size("batch_records", 500)
+    with worker.span("detect_inference"):
+        pass
+    parent.incr("files_scanned")
+    parent.merge(worker.drain())
+    assert worker.snapshot()["counters"] == {}
+
+    snap = parent.snapshot()
+    assert snap["counters"]["files_scanned"] == 3
+    assert snap["spans_ms"]["detect_inference"]["count"] == 1
+    assert snap["sizes"]["batch_records"]["buckets"]["1000"] == 1
+
+
+def test_prometheus_text():
+    reg = metrics.MetricsRegistry()
+    reg.incr("records_scored", 7)
+    reg.set_gauge("models_loaded", 1)
+    reg.observe_ms("detect_total", 30)
+    text = reg.to_prometheus()
+    assert "# TYPE pipeguard_records_scored_total counter\npipeguard_records_scored_total 7\n" in text
+    assert "pipeguard_models_loaded 1\n" in text
+    assert 'pipeguard_detect_total_ms_bucket{le="25"} 0\n' in text
+    assert 'pipeguard_detect_total_ms_bucket{le="50"} 1\n' in text
+    assert 'pipeguard_detect_total_ms_bucket{le="+Inf"} 1\n' in text
+    assert "pipeguard_detect_total_ms_count 1\n" in text
+
+
+def test_export_formats(tmp_path):
+    reg = metrics.MetricsRegistry()
+    reg.incr("files_scanned")
+    prom, lines = tmp_path / "pipeguard.prom", tmp_path / "metrics.jsonl"
+    reg.export(str(prom))
+    reg.export(str(prom))
+    reg.export(str(lines))
+    reg.export(str(lines))
+    # Replaced in place, not appended
+    assert prom.read_text(encoding="utf-8").count("pipeguard_files_scanned_total 1\n") == 1
+    assert not (tmp_path / "pipeguard.prom.tmp").exists()
+    snaps = [json.loads(line) for line in lines.read_text(encoding="utf-8").splitlines()]
+    assert len(snaps) == 2 and snaps[0]["counters"] == {"files_scanned": 1}
+
+
+def test_cli_collects_worker_metrics(log_dir, model_path, tmp_path, monkeypatch):
+    import sys
+
+    import detect_cli
+
+    out = tmp_path / "metrics.jsonl"
+    files = [str(p) for p in sorted(log_dir.glob("run_*.json"))[:4]]
+    monkeypatch.setattr(sys, "argv", [
+        "detect_cli.py", *files, "-m", model_path, "-w", "2", "--metrics-out", str(out),
+    ])
+    # Exported below instead of at interpreter exit
+    monkeypatch.setattr(detect_cli.atexit, "register", lambda *args: None)
+    metrics.registry.reset()
+    with pytest.raises(SystemExit):
+        detect_cli.main()
+    detect_cli.export_metrics(str(out))
+    snap = json.loads(out.read_text(encoding="utf-8").splitlines()[-1])
+    assert snap["counters"]["files_scanned"] == 4
+    # Spans recorded in the worker processes reached the parent
+    assert snap["spans_ms"]["detect_inference"]["count"] >= 4
@@ -0,0 +1,44 @@
+import os
+import time
+
+import joblib
+
+import model_registry
+
+
+def _write(path, obj, mtime):
+    joblib.dump(obj, path)
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_reload_drops_replaced_model(tmp_path):
+    path = str(tmp_path / "model.pkl")
+    _write(path, {"version": 1}, 1_000_000_000)
+    registry = model_registry.ModelRegistry(check_interval=0)
+    assert registry.get(path) == {"version": 1}
+
+    _write(path, {"version": 2}, 2_000_000_000)
+    deadline = time.monotonic() + 5
+    while registry.get(path) != {"version": 2}:
+        assert time.monotonic() < deadline, "model was not reloaded"
+        time.sleep(0.01)
+    # Wait for the reload thread to finish
+    while registry._reloading:
+        time.sleep(0.01)
+    assert registry.stats()["models"] == 1
+
+
+def test_shared_content_stays_loaded(tmp_path):
+    a, b = str(tmp_path / "a.pkl"), str(tmp_path / "b.pkl")
+    _write(a, {"version": 1}, 1_000_000_000)
+    _write(b, {"version": 1}, 1_000_000_000)
+    registry = model_registry.ModelRegistry(check_interval=0)
+    registry.get(a)
+    registry.get(b)
+    assert registry.stats()["models"] == 1
+
+    _write(b, {"version": 2}, 2_000_000_000)
+    registry._load(os.path.abspath(b))
+    # a still points to the first version
+    assert registry.stats()["models"] == 2
+    assert registry.get(a) == {"version": 1}
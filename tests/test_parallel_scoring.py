@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import openai_utils
+
+
+@pytest.fixture
+def frame(records):
+    # Runs interleaved, so partitions are not contiguous blocks
+    return pd.DataFrame(sorted(records, key=lambda r: (r["timestamp"][-6:], r["run_id"])))
+
+
+def test_partitions_keep_runs_whole(frame):
+    parts = openai_utils.partition_runs(frame, 4)
+    assert sum(len(p) for p in parts) == len(frame)
+    run_sets = [set(p["run_id"]) for p in parts]
+    assert all(a.isdisjoint(b) for i, a in enumerate(run_sets) for b in run_sets[i + 1:])
+    assert sorted(i for p in parts for i in p.index) == list(frame.index)
+
+
+@pytest.mark.parametrize("executor", ["process", "thread"])
+def test_parallel_matches_serial(frame, model_path, monkeypatch, executor):
+    monkeypatch.setattr(openai_utils, "PARALLEL_MIN_RECORDS", 0)
+    serial = openai_utils.score_frame(frame, model_path=model_path)
+    parallel = openai_utils.score_frame(frame, model_path=model_path, workers=3, executor=executor)
+    pd.testing.assert_series_equal(parallel, serial)
+
+    expected = openai_utils.detect_frame(frame, threshold=0.3, model_path=model_path)
+    found = openai_utils.detect_frame(frame, threshold=0.3, model_path=model_path, workers=3, executor=executor)
+    assert len(found) > 0
+    pd.testing.assert_frame_equal(found, expected)
+
+
+def test_small_inputs_stay_in_process(frame, model_path, monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError("a pool was started")
+
+    monkeypatch.setattr(openai_utils, "ProcessPoolExecutor", no_pool)
+    probs = openai_utils.score_frame(frame, model_path=model_path, workers=4)
+    np.testing.assert_allclose(probs, openai_utils.score_frame(frame, model_path=model_path))
+
+
+def test_process_pool_is_reused_across_calls(frame, model_path, monkeypatch):
+    monkeypatch.setattr(openai_utils, "PARALLEL_MIN_RECORDS", 0)
+    openai_utils.shutdown_pools()
+    started = []
+    real = openai_utils.ProcessPoolExecutor
+
+    def counting_pool(*args, **kwargs):
+        started.append(args)
+        return real(*args, **kwargs)
+
+    monkeypatch.setattr(openai_utils, "ProcessPoolExecutor", counting_pool)
+    first = openai_utils.score_frame(frame, model_path=model_path, workers=2)
+    openai_utils.detect_frame(frame, model_path=model_path, workers=2)
+    second = openai_utils.score_frame(frame, model_path=model_path, workers=2)
+    assert len(started) == 1
+    pd.testing.assert_series_equal(first, second)
+
+    openai_utils.shutdown_pools()
+    openai_utils.score_frame(frame, model_path=model_path, workers=2)
+    assert len(started) == 2
+    openai_utils.shutdown_pools()
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import openai_utils
+
+
+@pytest.fixture
+def frame(records):
+    df = pd.DataFrame(records)
+    df.index = pd.RangeIndex(1000, 1000 + len(df))
+    return df.assign(extra=np.arange(len(df)))
+
+
+def test_every_input_type_scores_the_same(frame, records, model_path):
+    expected = openai_utils.score_frame(records, model_path=model_path).to_numpy()
+    columns = {c: frame[c].to_numpy() for c in frame}
+    for data in (frame, pa.Table.from_pandas(frame, preserve_index=False), columns):
+        np.testing.assert_array_equal(openai_utils.score_frame(data, model_path=model_path).to_numpy(), expected)
+    np.testing.assert_array_equal(openai_utils.score_records(records, model_path=model_path), expected)
+
+
+def test_frame_input_is_not_modified(frame, model_path):
+    before = frame.copy()
+    probs = openai_utils.score_frame(frame, model_path=model_path)
+    pd.testing.assert_frame_equal(frame, before)
+    assert probs.index.equals(frame.index) and probs.name == "anomaly_prob"
+
+
+def test_detect_frame_returns_input_rows(frame, model_path):
+    found = openai_utils.detect_frame(frame, threshold=0.3, model_path=model_path)
+    from_arrow = openai_utils.detect_frame(
+        pa.Table.from_pandas(frame, preserve_index=False), threshold=0.3, model_path=model_path
+    )
+    assert len(found) > 0
+    # Columns scoring does not read come along untouched
+    assert (found["message"].to_numpy() == frame.loc[found.index, "message"].to_numpy()).all()
+    assert (found["extra"] == found.index - 1000).all()
+    assert list(found["extra"]) == list(from_arrow["extra"])
+    assert found["timestamp"].dtype.kind == "M"
+    assert list(found.sort_values(["run_id", "timestamp"], kind="stable").index) == list(found.index)
+
+    anomalies = openai_utils.detect_anomalies(frame.to_dict(orient="records"), threshold=0.3, model_path=model_path)
+    assert [a["extra"] for a in anomalies] == list(found["extra"])
+
+
+def test_empty_inputs(model_path):
+    assert openai_utils.score_frame([], model_path=model_path).empty
+    assert openai_utils.detect_frame(pd.DataFrame(), model_path=model_path).empty
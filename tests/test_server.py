@@ -0,0 +1,108 @@
+import json
+import threading
+import http.client
+
+import numpy as np
+import pytest
+
+import openai_utils
+import server
+
+
+@pytest.fixture
+def unix_server(model_path, tmp_path):
+    sock = str(tmp_path / "score.sock")
+    server.ScoringHandler.service = server.ScoringService(model_path)
+    httpd = server.ThreadingUnixHTTPServer(sock, server.ScoringHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"unix://{sock}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_many_concurrent_clients(unix_server, records):
+    n_clients = 16
+    barrier = threading.Barrier(n_clients)
+    results, errors = [None] * n_clients, []
+
+    def client(i):
+        barrier.wait()
+        try:
+            results[i] = server.score_remote(records[:50], unix_server)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(n_clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert all(r == results[0] and len(r) == 50 for r in results)
+
+
+def _post(url, payload):
+    conn = server._UnixHTTPConnection(url[len("unix://"):], 10)
+    try:
+        conn.request("POST", "/score", body=json.dumps(payload).encode("utf-8"))
+        resp = conn.getresponse()
+        return resp.status, json.loads(resp.read())
+    finally:
+        conn.close()
+
+
+def test_record_without_timestamp_is_bad_request(unix_server, records):
+    rec = dict(records[0])
+    del rec["timestamp"]
+    status, body = _post(unix_server, {"records": [records[1], rec]})
+    assert status == 400
+    assert "record 1 is missing timestamp" in body["error"]
+
+
+def test_records_must_be_objects(unix_server):
+    status, body = _post(unix_server, {"records": [1]})
+    assert status == 400
+
+
+@pytest.mark.parametrize("field, value", [
+    ("message", None),
+    ("stage", 3),
+    ("timestamp", "x"),
+    ("timestamp", 1735689600),
+])
+def test_badly_typed_fields_are_bad_requests(unix_server, records, field, value):
+    status, body = _post(unix_server, {"records": [dict(records[0], **{field: value})]})
+    assert status == 400
+    assert f"record 0: '{field}'" in body["error"]
+
+
+def test_body_must_be_an_object(unix_server, records):
+    status, body = _post(unix_server, records[:2])
+    assert status == 400
+    assert "JSON object" in body["error"]
+
+
+def _get(url, path):
+    conn = server._UnixHTTPConnection(url[len("unix://"):], 10)
+    try:
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+    finally:
+        conn.close()
+
+
+def test_probabilities_match_local_scoring(unix_server, records, model_path):
+    probs = server.score_remote(records, unix_server)
+    np.testing.assert_allclose(probs, openai_utils.score_records(records, model_path=model_path))
+
+
+def test_health_and_metrics(unix_server, records):
+    server.score_remote(records[:10], unix_server)
+    assert _get(unix_server, "/healthz") == (200, b'{"status": "ok"}')
+    status, body = _get(unix_server, "/metrics")
+    assert status == 200
+    stats = json.loads(body)
+    assert stats["requests"] == 1 and stats["records_scored"] == 10
+    assert _get(unix_server, "/nope")[0] == 404
@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+from sklearn.model_selection import train_test_split
+
+import train_model
+
+
+@pytest.fixture(scope="module")
+def split(records):
+    df = pd.DataFrame(records)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601")
+    X, y = train_model.prepare_features(df)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, stratify=y, random_state=0)
+    return X_train, y_train, X_test, y_test
+
+
+def test_search_is_the_same_on_several_cores(split, monkeypatch):
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+
+    monkeypatch.setattr(train_model, "SEARCH_VOCAB_SIZES", (50, 100))
+    monkeypatch.setattr(train_model, "search_candidates", lambda: {
+        "rf": RandomForestClassifier(n_estimators=10, random_state=0),
+        "logreg": LogisticRegression(max_iter=500),
+    })
+    serial = train_model.run_search(*split, jobs=1)
+    parallel = train_model.run_search(*split, jobs=2)
+
+    def key(results):
+        return [(r["tfidf_max_features"], r["model"], round(r["test_ap"], 12)) for r in results]
+
+    assert len(serial) == 4
+    assert sorted(key(serial)) == sorted(key(parallel))
+    aps = [round(r["test_ap"], 4) for r in serial]
+    assert aps == sorted(aps, reverse=True)
+    assert any(r["pareto"] for r in serial)
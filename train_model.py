@@ -4,14 +4,19 @@
 import os
 import sys
 import glob
+import json
+import time
 import joblib
 import argparse
 
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from joblib import Parallel, delayed
 
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.ensemble import RandomForestClassifier, ExtraTreesClassifier
+from sklearn.linear_model import LogisticRegression
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
@@ -25,28 +30,41 @@ from sklearn.metrics import (
     average_precision_score
 )
 
-def load_data(logs_pattern: str) -> pd.DataFrame:
+import corpus
+import ingest
+import baseline_index
+import compiled_model
+import run_features
+import incremental_model
+from template_features import TemplateEncoder
+
+def load_data(logs_pattern: str, workers: int = None, use_cache: bool = True) -> pd.DataFrame:
+    if corpus.is_corpus(logs_pattern):
+        try:
+            return corpus.read_corpus(logs_pattern, columns=corpus.TRAIN_COLUMNS)
+        except (RuntimeError, ValueError) as e:
+            print(f"Ошибка: {e}", file=sys.stderr)
+            sys.exit(1)
+
     files = glob.glob(logs_pattern)
     if not files:
         print(f"Ошибка: не найдены файлы логов по паттерну {logs_pattern}", file=sys.stderr)
         sys.exit(1)
 
-    dfs = []
-    for fn in sorted(files):
-        try:
-            dfs.append(pd.read_json(fn))
-        except ValueError as e:
-            print(f"Warning: не удалось прочитать {fn}: {e}", file=sys.stderr)
+    data = ingest.read_logs(
+        files,
+        workers=workers,
+        cache_dir=ingest.CACHE_DIR if use_cache else None,
+    )
 
-    if not dfs:
+    if data.empty:
         print(f"Ошибка: ни один файл не был загружен из {logs_pattern}", file=sys.stderr)
         sys.exit(1)
 
-    data = pd.concat(dfs, ignore_index=True)
     data["timestamp"] = pd.to_datetime(data["timestamp"], errors="coerce")
     return data
 
-def prepare_features(df: pd.DataFrame):
+def add_delta(df: pd.DataFrame) -> pd.DataFrame:
     # Sort and compute delta
     df = df.sort_values(["run_id", "timestamp"])
     df["delta"] = (
@@ -55,43 +73,62 @@ def prepare_features(df: pd.DataFrame):
           .dt.total_seconds()
           .fillna(0)
     )
+    return df
+
+def prepare_features(df: pd.DataFrame, baseline: dict = None):
+    if "delta" not in df:
+        df = add_delta(df)
     # We'll use: 'delta', 'stage', 'status', 'message'
-    X = df[["delta", "stage", "status", "message"]].copy()
+    columns = ["delta", "stage", "status", "message"]
+    if baseline is not None:
+        # plus run/stage aggregates compared with the historical baseline
+        df = run_features.add_line_features(df, baseline)
+        columns += run_features.LINE_FEATURES
+    X = df[columns].copy()
     y = df["label"].astype(int)
     return X, y
 
-def build_pipeline():
+def build_preprocessor(max_features: int = 500, extra_numeric=(), text_features: str = "tfidf") -> ColumnTransformer:
     # Numeric features
-    num_features = ["delta"]
+    num_features = ["delta", *extra_numeric]
     num_transformer = StandardScaler()
 
     # Categorical features
     cat_features = ["stage", "status"]
     cat_transformer = OneHotEncoder(handle_unknown="ignore")
 
-    # Text feature
+    # Text feature: TF-IDF bigrams, or one-hot of the mined message template
     text_feature = "message"
-    text_transformer = TfidfVectorizer(
-        max_features=500,
-        ngram_range=(1,2),
-        stop_words="english"  # remove English stopwords—customize for Russian if needed
-    )
+    if text_features == "templates":
+        text_step = ("tpl", TemplateEncoder(), text_feature)
+    else:
+        text_step = ("txt", TfidfVectorizer(
+            max_features=max_features,
+            ngram_range=(1,2),
+            stop_words="english"  # remove English stopwords—customize for Russian if needed
+        ), text_feature)
 
-    preprocessor = ColumnTransformer(
+    return ColumnTransformer(
         transformers=[
             ("num", num_transformer, num_features),
             ("cat", cat_transformer, cat_features),
-            ("txt", text_transformer, text_feature),
+            text_step,
         ],
         remainder="drop"
     )
 
+def build_pipeline(n_jobs: int = None, max_features: int = 500, clf=None, extra_numeric=(),
+                   text_features: str = "tfidf"):
+    preprocessor = build_preprocessor(max_features, extra_numeric, text_features)
+
     # You can swap RandomForest for MLPClassifier, XGBClassifier, etc.
-    clf = RandomForestClassifier(
-        n_estimators=200,
-        class_weight="balanced",
-        random_state=42
-    )
+    if clf is None:
+        clf = RandomForestClassifier(
+            n_estimators=200,
+            class_weight="balanced",
+            random_state=42,
+            n_jobs=n_jobs
+        )
 
     pipeline = Pipeline([
         ("prep", preprocessor),
@@ -100,6 +137,91 @@ def build_pipeline():
 
     return pipeline
 
+# Candidates for --search: TF-IDF vocabulary sizes x classifiers
+SEARCH_VOCAB_SIZES = (250, 500, 1000)
+
+def search_candidates():
+    cands = {}
+    for n in (100, 200, 400):
+        for mf in ("sqrt", "log2"):
+            cands[f"rf(n_estimators={n}, max_features={mf})"] = RandomForestClassifier(
+                n_estimators=n, max_features=mf, class_weight="balanced", random_state=42
+            )
+    cands["extra_trees(n_estimators=200)"] = ExtraTreesClassifier(
+        n_estimators=200, class_weight="balanced", random_state=42
+    )
+    cands["logreg(C=1.0)"] = LogisticRegression(
+        C=1.0, class_weight="balanced", max_iter=1000
+    )
+    return cands
+
+def _fit_candidate(name, clf, Xt_train, y_train, Xt_test, y_test):
+    start = time.perf_counter()
+    clf.fit(Xt_train, y_train)
+    fit_s = time.perf_counter() - start
+    start = time.perf_counter()
+    y_score = clf.predict_proba(Xt_test)[:, 1]
+    predict_s = time.perf_counter() - start
+    return name, average_precision_score(y_test, y_score), fit_s, predict_s
+
+def run_search(X_train, y_train, X_test, y_test, jobs: int = None, extra_numeric=()):
+    """Fit every candidate on features built once per vocabulary size and
+    rank them by test AP and end-to-end scoring throughput."""
+    results = []
+    for vocab in SEARCH_VOCAB_SIZES:
+        prep = build_preprocessor(vocab, extra_numeric)
+        Xt_train = prep.fit_transform(X_train)
+        start = time.perf_counter()
+        Xt_test = prep.transform(X_test)
+        transform_s = time.perf_counter() - start
+        print(f"Features built for max_features={vocab}: {Xt_train.shape[1]} columns")
+
+        fitted = Parallel(n_jobs=jobs or 1)(
+            delayed(_fit_candidate)(name, clf, Xt_train, y_train, Xt_test, y_test)
+            for name, clf in search_candidates().items()
+        )
+        for name, ap, fit_s, predict_s in fitted:
+            results.append({
+                "tfidf_max_features": vocab,
+                "model": name,
+                "test_ap": ap,
+                "fit_seconds": fit_s,
+                "scoring_rows_per_sec": len(X_test) / (transform_s + predict_s),
+            })
+
+    # A candidate is on the front if no other one is at least as good on both axes
+    for r in results:
+        r["pareto"] = not any(
+            o is not r
+            and o["test_ap"] >= r["test_ap"]
+            and o["scoring_rows_per_sec"] >= r["scoring_rows_per_sec"]
+            and (o["test_ap"] > r["test_ap"] or o["scoring_rows_per_sec"] > r["scoring_rows_per_sec"])
+            for o in results
+        )
+    results.sort(key=lambda r: (-round(r["test_ap"], 4), -r["scoring_rows_per_sec"]))
+    return results
+
+def train_run_model(df: pd.DataFrame, baseline: dict, test_size: float, n_jobs: int = None):
+    """Fit the run-level classifier on one row of aggregates per run."""
+    runs = run_features.run_table(df, baseline)
+    X, y = runs[run_features.RUN_FEATURES], runs["label"]
+    print(f"Runs: {len(runs)}, anomalous runs: {y.mean():.2%}")
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=test_size, stratify=y, random_state=42
+    )
+    clf = RandomForestClassifier(
+        n_estimators=200,
+        class_weight="balanced",
+        random_state=42,
+        n_jobs=n_jobs
+    )
+    clf.fit(X_train, y_train)
+    y_score = clf.predict_proba(X_test)[:, 1]
+    print("\n=== RUN-LEVEL TEST SET METRICS ===")
+    print(classification_report(y_test, clf.predict(X_test), digits=4))
+    print(f"Run-level AP: {average_precision_score(y_test, y_score):.4f}")
+    return run_features.RunLevelModel(clf, baseline)
+
 def plot_confusion(cm, title):
     plt.figure()
     plt.imshow(cm, cmap="Blues")
@@ -113,6 +235,101 @@ def plot_confusion(cm, title):
             plt.text(j, i, cm[i,j], ha="center", va="center")
     plt.tight_layout()
 
+def fit_baseline_index(df: pd.DataFrame, X_train, y_train, X_test, y_test, y_score):
+    """Baseline index from normal training lines, plus how much of the test
+    set it would let the detector skip and what that costs in recall."""
+    index = baseline_index.BaselineIndex()
+    index.update(df.loc[X_train.index[y_train.to_numpy() == 0]])
+    routine = index.routine_mask(df.loc[X_test.index])
+
+    positive = y_test.to_numpy() == 1
+    flagged = y_score > 0.5
+    recall_full = flagged[positive].mean() if positive.any() else float("nan")
+    recall_pre = (flagged & ~routine)[positive].mean() if positive.any() else float("nan")
+    print("\n=== BASELINE PRE-FILTER (test set) ===")
+    print(f"Keys: {len(index.entries)}, skipped lines: {routine.mean():.2%}")
+    print(f"Recall @0.5: {recall_full:.4f} -> {recall_pre:.4f} with pre-filter "
+          f"({int((routine & positive).sum())} anomalies skipped)")
+    return index
+
+def train_incremental(pattern: str, base_path: str = None, out_path: str = None,
+                      chunk_files: int = 200, workers: int = None):
+    """Update the model at ``base_path`` (or start a new one) with the files
+    matching ``pattern`` it has not seen, ``chunk_files`` files at a time.
+
+    Each chunk is scored before it is learned from (progressive
+    validation), so the printed metrics cost no extra pass over the data.
+    The result and its baseline index go to a new versioned file; the
+    base model is left untouched.
+    """
+    if base_path:
+        model = joblib.load(base_path)
+        if not isinstance(model, incremental_model.IncrementalPipeline):
+            print(f"Ошибка: {base_path} обучена без --incremental и не поддерживает дообучение",
+                  file=sys.stderr)
+            sys.exit(1)
+    else:
+        model = incremental_model.IncrementalPipeline()
+
+    files = glob.glob(pattern)
+    if not files:
+        print(f"Ошибка: не найдены файлы логов по паттерну {pattern}", file=sys.stderr)
+        sys.exit(1)
+    new = model.new_files(files)
+    print(f"Model version {model.version}: {len(files) - len(new)} files already learned, {len(new)} new")
+    if not new:
+        print("Нет новых файлов — модель не изменилась")
+        return None
+
+    index_file = baseline_index.index_path(base_path) if base_path else None
+    if index_file and os.path.exists(index_file):
+        index = baseline_index.BaselineIndex.load(index_file)
+    else:
+        index = baseline_index.BaselineIndex()
+
+    start = time.perf_counter()
+    n_records = n_anomalies = 0
+    cm = np.zeros((2, 2), dtype=int)
+    for i in range(0, len(new), chunk_files):
+        chunk = new[i:i + chunk_files]
+        # Files hold whole runs, so delta is exact within a chunk
+        df = ingest.read_logs(chunk, workers=workers, cache_dir=None, verbose=False)
+        if df.empty:
+            continue
+        df = add_delta(df)
+        X, y = prepare_features(df)
+        if model.fitted:
+            cm += confusion_matrix(y, model.predict(X), labels=[0, 1])
+        model.partial_fit(X, y)
+        index.update(df.loc[(y == 0).to_numpy()])
+        model.trained_files.update(os.path.basename(f) for f in chunk)
+        n_records += len(y)
+        n_anomalies += int(y.sum())
+        print(f"  {min(i + chunk_files, len(new))}/{len(new)} files, {n_records} records "
+              f"({time.perf_counter() - start:.1f}s)", flush=True)
+
+    model.version += 1
+    model.history.append({
+        "version": model.version,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "files": len(new),
+        "records": n_records,
+        "anomalies": n_anomalies,
+    })
+
+    (tn, fp), (fn, tp) = cm
+    if cm.sum():
+        print("\n=== PROGRESSIVE VALIDATION (each chunk scored before training on it) ===")
+        print(cm)
+        print(f"Precision: {tp / max(tp + fp, 1):.4f}  Recall: {tp / max(tp + fn, 1):.4f}")
+
+    out_path = out_path or incremental_model.versioned_path(base_path, model.version)
+    joblib.dump(model, out_path)
+    index.save(baseline_index.index_path(out_path))
+    print(f"\nModel version {model.version} saved as '{out_path}' "
+          f"({n_records} new records in {time.perf_counter() - start:.1f}s)")
+    return out_path
+
 def main():
     parser = argparse.ArgumentParser(
         description="Train supervised model on CI/CD logs with text+CATEGORY+numeric features"
@@ -125,12 +342,84 @@ def main():
         "--test-size", "-t", type=float, default=0.2,
         help="доля тестового набора"
     )
+    parser.add_argument(
+        "--corpus", "-c", default=None,
+        help="Parquet-корпус, собранный corpus.py (вместо --logs-dir)"
+    )
+    parser.add_argument(
+        "--workers", "-w", type=int, default=None,
+        help="число процессов для чтения логов (по умолчанию — все ядра)"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="не использовать кэш разобранных логов"
+    )
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=None,
+        help="число ядер для обучения (-1 — все ядра)"
+    )
+    parser.add_argument(
+        "--search", action="store_true",
+        help="перебор конфигураций (размер словаря TF-IDF, классификаторы) вместо обучения"
+    )
+    parser.add_argument(
+        "--search-out", default="search_results.json",
+        help="куда сохранить результаты перебора (default=search_results.json)"
+    )
+    parser.add_argument(
+        "--run-features", action="store_true",
+        help="добавить агрегаты по прогону/этапу (длительность этапа, доля ошибок, отклонение от перцентилей)"
+    )
+    parser.add_argument(
+        "--run-level", action="store_true",
+        help="дополнительно обучить модель оценки целых прогонов (run_model.pkl)"
+    )
+    parser.add_argument(
+        "--text-features", choices=["tfidf", "templates"], default="tfidf",
+        help="признаки текста: TF-IDF биграммы или ID шаблона сообщения (templates — "
+             "быстрее и компактнее; таблица шаблонов сохраняется в модели)"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="дообучить модель по частям только на новых файлах (HashingVectorizer + SGD, "
+             "память ограничена --chunk-files); результат — новая версия model.vN.pkl"
+    )
+    parser.add_argument(
+        "--base-model", default=None,
+        help="модель, которую дообучает --incremental (по умолчанию — обучить новую)"
+    )
+    parser.add_argument(
+        "--chunk-files", type=int, default=200,
+        help="сколько файлов читать за раз в режиме --incremental (default=200)"
+    )
+    parser.add_argument(
+        "--output", "-o", default=None,
+        help="куда сохранить модель --incremental (по умолчанию — следующая версия рядом с --base-model)"
+    )
     args = parser.parse_args()
 
-    pattern = os.path.join(args.logs_dir, "run_*.json")
+    if args.incremental:
+        if args.corpus:
+            parser.error("--incremental читает файлы логов, а не Parquet-корпус")
+        train_incremental(
+            os.path.join(args.logs_dir, "run_*.json"), args.base_model, args.output,
+            chunk_files=args.chunk_files, workers=args.workers
+        )
+        return
+
+    pattern = args.corpus or os.path.join(args.logs_dir, "run_*.json")
     print(f"Loading logs from: {pattern}")
-    df = load_data(pattern)
-    X, y = prepare_features(df)
+    df = load_data(pattern, workers=args.workers, use_cache=not args.no_cache)
+    df = add_delta(df)
+    baseline = None
+    if args.run_features or args.run_level:
+        baseline = run_features.fit_baseline(df)
+    if args.run_level:
+        run_model = train_run_model(df, baseline, args.test_size, n_jobs=args.jobs)
+        joblib.dump(run_model, "run_model.pkl")
+        print("Run-level model saved as 'run_model.pkl'")
+
+    X, y = prepare_features(df, baseline if args.run_features else None)
     print(f"Total records: {len(y)}, Anomaly rate: {y.mean():.2%}")
 
     # Split
@@ -138,10 +427,32 @@ def main():
         X, y, test_size=args.test_size, stratify=y, random_state=42
     )
 
+    if args.search:
+        results = run_search(
+            X_train, y_train, X_test, y_test, jobs=args.jobs,
+            extra_numeric=run_features.LINE_FEATURES if args.run_features else ()
+        )
+        print("\n=== SEARCH RESULTS (by test AP, then throughput) ===")
+        for r in results:
+            print(
+                f"{'*' if r['pareto'] else ' '} AP={r['test_ap']:.4f}  "
+                f"{r['scoring_rows_per_sec']:>10.0f} rows/s  fit={r['fit_seconds']:.1f}s  "
+                f"tfidf={r['tfidf_max_features']:<5d} {r['model']}"
+            )
+        print("* — Парето-оптимальные по AP и скорости оценки")
+        with open(args.search_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Results saved to '{args.search_out}'")
+        return
+
     # Build & train
-    pipe = build_pipeline()
+    extra = run_features.LINE_FEATURES if args.run_features else ()
+    pipe = build_pipeline(n_jobs=args.jobs, extra_numeric=extra, text_features=args.text_features)
     print("Training supervised classifier…")
     pipe.fit(X_train, y_train)
+    if args.run_features:
+        # the detector needs the same baseline to rebuild these features
+        pipe.stage_baseline_ = baseline
 
     # Predict & evaluate
     y_pred_train = pipe.predict(X_train)
@@ -167,6 +478,13 @@ def main():
     # Save model
     joblib.dump(pipe, "model.pkl")
     print("\nSupervised model saved as 'model.pkl'")
+    compiled_model.export_pipeline(pipe, "model.npz")
+    print("Compiled (pickle-free) model saved as 'model.npz'")
+    # Same index for both files: model.baseline.json
+    index = fit_baseline_index(df, X_train, y_train, X_test, y_test, y_score)
+    index.save(baseline_index.index_path("model.pkl"))
+    print(f"Baseline index saved as '{baseline_index.index_path('model.pkl')}' "
+          "(used by detect_cli.py/server.py with --prefilter)")
 
     # Visualization
     plot_confusion(cm_train, "Confusion Matrix — Train")